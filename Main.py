@@ -1,25 +1,39 @@
 
+import time
+APP_START = time.perf_counter() # startup timing includes the imports below
+
 import customtkinter as ctk
 import tkinter as tk
+import tkinter.font as tkfont
 from tkinter import messagebox
 
-import pyperclip
-import time
 import threading
+import queue
 import sys
 import os
 import json
+import re
+import math
+import hashlib
 import uuid
-import requests
+import bisect
+import functools
+import traceback
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 import sqlite3
-import bcrypt
 import random
-import smtplib
-from email.message import EmailMessage
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-from openai import OpenAI
-from PIL import Image, ImageDraw, ImageOps
+# openai, requests, PIL, bcrypt, pyperclip, smtplib and multiprocessing are imported where they are
+# first used, so the window can appear before they load. customtkinter stays eager
+# because the UI classes subclass it.
+if TYPE_CHECKING:
+    import asyncio
+    from openai import OpenAI
+    from PIL import Image
 
 # =========================
 # CONFIGURATION
@@ -30,15 +44,38 @@ APP_TITLE = "HELIX"
 LOGO_FILENAME = "helix_logo.png"   # packaged asset
 DB_FILE = "helix_v2.db"            # runtime data
 SESSION_FILE = "helix_session.json"  # runtime data
+SNAPSHOT_FILE = "helix_snapshot.json"  # runtime data: last UI state for instant restore
 
 # --- ⚠️ EMAIL SETTINGS ⚠️ ---
 # Use environment variables in real deployments.
-SMTP_EMAIL = "your_real_email@gmail.com"
-SMTP_PASSWORD = "paste_your_16_digit_app_password_here"
+SMTP_EMAIL = os.environ.get("HELIX_SMTP_USER", "your_real_email@gmail.com")
+SMTP_PASSWORD_PLACEHOLDER = "paste_your_16_digit_app_password_here"
+SMTP_PASSWORD = os.environ.get("HELIX_SMTP_PASSWORD", SMTP_PASSWORD_PLACEHOLDER)  # "" for a relay without AUTH
+SMTP_HOST = os.environ.get("HELIX_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("HELIX_SMTP_PORT", "465"))
+SMTP_SECURITY = os.environ.get("HELIX_SMTP_SECURITY", "ssl")  # ssl | starttls | plain (benchmarks/smtp_server.py)
+
+# --- MAIL QUEUE ---
+MAIL_MAX_ATTEMPTS = 5           # tries before a message is marked failed
+MAIL_RETRY_BASE = 2.0           # seconds before the first retry; doubles each time
+MAIL_RETRY_MAX = 120.0
+MAIL_TTL = 600                  # a code not sent within this many seconds is useless; give up
+MAIL_LEASE = 60                 # a claimed message returns to the queue if its sender dies
+MAIL_PER_RECIPIENT = 3          # messages accepted per address ...
+MAIL_RECIPIENT_WINDOW = 600     # ... per this many seconds
+MAIL_IDLE_CLOSE = 30            # seconds an unused SMTP connection is kept open
+MAIL_STATUS_WAIT = 20           # seconds the sign-up screen waits to report delivery
 
 # --- ADMIN SECRETS ---
 ADMIN_EMAIL = "admin@helix.com"
 
+# --- PASSWORDS & SESSIONS ---
+BCRYPT_ROUNDS = int(os.environ.get("HELIX_BCRYPT_ROUNDS", "12"))  # cost; pick one with benchmarks/bcrypt_cost.py
+PASSWORD_WORKERS = max(1, min(4, os.cpu_count() or 1))  # processes doing bcrypt
+SESSION_TTL = 604800            # seconds a sign-in (desktop or API token) stays valid
+SIGNUP_CODE_TTL = 900           # seconds a sign-up code can be used
+SIGNUP_CODE_ATTEMPTS = 5        # wrong guesses before the code is discarded
+
 # --- MODEL CONFIGURATION ---
 MODEL_CONFIG = {
     "Standard": {"id": "hermes-3-llama-3.1-8b", "cost_multiplier": 1, "desc": "⚡"},
@@ -49,10 +86,76 @@ MODEL_CONFIG = {
 INITIAL_TOKENS = 5000
 MAX_MEMORIES = 65
 
+# --- ADMISSION ---
+# Each request reserves its worst-case cost before it reaches the model
+MODEL_CONTEXT_TOKENS = 8192     # prompt + reply must fit
+REPLY_MAX_TOKENS = 2048         # reply cap when a request sets none
+REPLY_MIN_TOKENS = 32           # a low balance shortens replies down to this, then refuses
+USER_MAX_CONCURRENT = 4         # replies streaming at once per user (across desktops sharing storage)
+USER_TOKENS_PER_MIN = 40000     # prompt + reply tokens per user per minute, per process
+RESERVATION_TTL = 900           # seconds; older reservations are refunded (client died mid-reply)
+
+# --- MEMORY EXTRACTION ---
+MEMORY_IDLE_MS = 45000        # chat must be quiet this long before facts are extracted
+MEMORY_MIN_INTERVAL = 90      # seconds between background extraction calls
+MEMORY_BATCH_TURNS = 12       # newest unprocessed turns sent per extraction
+MEMORY_TURN_CHARS = 1500      # per-turn cap so the extraction call stays cheap
+
+# --- MESSAGES ---
+DM_PAGE_SIZE = 50             # DM history rows fetched per page
+
+# --- NOTEBOOK CONTEXT ---
+CHUNK_MAX_CHARS = 1200          # soft cap for one notebook chunk
+ATTACH_CONTEXT_TOKENS = 3000    # budget for the attached canvas
+NOTEBOOK_CONTEXT_TOKENS = 1500  # budget for chunks retrieved across notebooks
+NOTEBOOK_CONTEXT_SCAN = 20      # most recent notebooks considered for retrieval
+
+# --- PROMPT COMPRESSION ---
+COMPRESSION_TARGET_RATIO = 0.5  # keep about this fraction of injected context
+COMPRESSION_MIN_CHARS = 2000    # smaller context is sent as-is
+
+# --- STARTUP SNAPSHOT ---
+SNAPSHOT_INTERVAL_MS = 60000    # periodic snapshot while the app is open
+SNAPSHOT_TAIL_MSGS = 20         # messages of the open chat kept in the snapshot
+SNAPSHOT_MSG_CHARS = 4000       # per-message cap; longer ones are re-read from the DB
+
+# --- BACKGROUND WORK ---
+BACKGROUND_WORKERS = 4          # pool for bcrypt and database reads
+
+# --- TELEMETRY ---
+TELEMETRY_FILE = "helix_telemetry.jsonl"  # runtime data
+TELEMETRY_MAX_BYTES = 2 * 1024 * 1024     # rotate the log past this size
+TELEMETRY_BACKUPS = 3                     # rotated files kept (.1 .. .3)
+TELEMETRY_SAMPLES = 1000                  # recent samples per metric for percentiles
+
+# --- DIAGNOSTICS ---
+HEARTBEAT_MS = 100              # event-loop latency probe interval
+STALL_THRESHOLD_MS = 250        # main thread blocked this long counts as a stall
+DIAGNOSTICS_FILE = "helix_diagnostics.json"  # runtime data
+
+# --- BATCH MODE ---
+BATCH_CONCURRENCY = 4           # model requests in flight for `Main.py batch`
+
+# --- STORAGE ---
+# Point every desktop at one storage service (`Main.py dbserver`) instead of a local file
+DB_URL = os.environ.get("HELIX_DB_URL", "")
+DB_TOKEN = os.environ.get("HELIX_DB_TOKEN", "")  # shared secret the service checks
+DB_POOL_SIZE = 8                # kept-open connections (SQLite or HTTP) per process
+DB_SERVER_PORT = 8766
+DB_SERVER_WORKERS = 16          # service threads doing SQLite work
+
+# --- API SERVER ---
+API_HOST = "127.0.0.1"          # `Main.py serve` binds here; keep it local unless fronted by TLS
+API_PORT = 8765
+API_WORKERS = 8                 # threads for SQLite and waiting on bcrypt; requests themselves are coroutines
+API_MAX_BODY = 2 * 1024 * 1024  # bytes
+API_SESSION_CACHE = 60          # seconds a checked token is trusted before asking storage again
+
 # --- NETWORK SETTINGS ---
-LOCAL_URL = "http://localhost:1234/v1"
-PUBLIC_URL = "https://balanced-normally-mink.ngrok-free.app/v1"
-API_KEY = "lm-studio"
+# Overridable so the app can run against benchmarks/mock_server.py or another host
+LOCAL_URL = os.environ.get("HELIX_LOCAL_URL", "http://localhost:1234/v1")
+PUBLIC_URL = os.environ.get("HELIX_PUBLIC_URL", "https://balanced-normally-mink.ngrok-free.app/v1")
+API_KEY = os.environ.get("HELIX_API_KEY", "lm-studio")
 
 # --- THEME (Gemini-inspired) ---
 ctk.set_appearance_mode("Dark")
@@ -68,16 +171,30 @@ TEXT_WHITE = "#E3E3E3"
 TEXT_GRAY = "#A8A8A8"
 PLACEHOLDER_GRAY = "#5F6368"
 
+# --- IMAGE CACHE ---
+IMAGE_CACHE_SOURCES = 32            # decoded originals kept (logo, avatars, ...)
+IMAGE_CACHE_BYTES = 24 * 1024 * 1024  # budget for derived variants (RGBA bytes)
+
+# --- ANIMATION ---
+ANIM_FRAME_MS = 16       # shared frame clock (~60 fps)
+ANIM_DURATION_MS = 220   # page slides and overlay open/close
+
 FONT_HEADER = ("Google Sans", 26, "bold")
 FONT_SUBHEADER = ("Google Sans", 18, "bold")
 FONT_NORMAL = ("Google Sans", 14)
 FONT_BOLD = ("Google Sans", 14, "bold")
 FONT_INPUT = ("Google Sans", 15)
 FONT_SMALL = ("Google Sans", 12)
+FONT_CODE = ("Consolas", 13)
 
 PROMPTS = {
     "Fix": "Output ONLY the corrected version. Do NOT explain.",
-    "Chat": "You are Helix, an intelligent AI assistant. Answer clearly."
+    "Chat": "You are Helix, an intelligent AI assistant. Answer clearly.",
+    "Memory": (
+        "Extract lasting facts about the USER from this conversation (preferences, background, "
+        "projects, goals). One short fact per line, each starting with '- '. "
+        "Ignore anything temporary or about the assistant. If there are none, output NONE."
+    ),
 }
 
 # =========================
@@ -101,7 +218,8 @@ def data_path(rel_path: str) -> str:
 # IMAGE UTILS
 # =========================
 
-def make_circle(pil_img: Image.Image) -> Image.Image:
+def make_circle(pil_img: "Image.Image") -> "Image.Image":
+    from PIL import Image, ImageDraw, ImageOps
     pil_img = pil_img.convert("RGBA")
     size = pil_img.size
     mask = Image.new("L", size, 0)
@@ -111,25 +229,134 @@ def make_circle(pil_img: Image.Image) -> Image.Image:
     output.putalpha(mask)
     return output
 
+class ImageCache:
+    """Decodes each image once and memoizes derived variants (size, circle mask, scale).
+
+    Variants are resized straight to the pixel size they are shown at, so CTkImage does
+    not have to resample from the full-size original. Both tables are LRU-bounded, which
+    keeps per-user avatars from growing memory without limit.
+    """
+
+    def __init__(self, max_sources: int = IMAGE_CACHE_SOURCES, max_bytes: int = IMAGE_CACHE_BYTES):
+        self.max_sources = max_sources
+        self.max_bytes = max_bytes
+        self.sources: OrderedDict = OrderedDict()   # path -> RGBA image
+        self.variants: OrderedDict = OrderedDict()  # (path, px, circle) -> RGBA image
+        self.images: OrderedDict = OrderedDict()    # (path, size, circle, scale) -> CTkImage
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def source(self, path: str) -> "Image.Image":
+        with self.lock:
+            img = self.sources.get(path)
+            if img is not None:
+                self.sources.move_to_end(path)
+                return img
+        from PIL import Image
+        with Image.open(path) as f:
+            img = f.convert("RGBA")
+        with self.lock:
+            self.sources[path] = img
+            while len(self.sources) > self.max_sources:
+                self.sources.popitem(last=False)
+        return img
+
+    def variant(self, path: str, px: tuple[int, int], circle: bool = False) -> "Image.Image":
+        """Original at an exact pixel size, optionally masked to a circle."""
+        key = (path, px, circle)
+        with self.lock:
+            img = self.variants.get(key)
+            if img is not None:
+                self.variants.move_to_end(key)
+                return img
+        from PIL import Image, ImageOps
+        img = self.source(path)
+        img = ImageOps.fit(img, px, Image.LANCZOS, centering=(0.5, 0.5)) if img.size != px else img.copy()
+        if circle:
+            img = make_circle(img)
+        self._store(key, img)
+        return img
+
+    def _store(self, key, img: "Image.Image") -> None:
+        with self.lock:
+            if key in self.variants:
+                return
+            self.variants[key] = img
+            self.bytes += img.width * img.height * 4
+            while self.bytes > self.max_bytes and len(self.variants) > 1:
+                old_key, old = self.variants.popitem(last=False)
+                self.bytes -= old.width * old.height * 4
+                for ik in [k for k in self.images if (k[0], k[2]) == (old_key[0], old_key[2])]:
+                    self.images.pop(ik, None)
+
+    def ctk_image(self, path: str, size: tuple[int, int], circle: bool = False, scale: float = 1.0) -> ctk.CTkImage:
+        """Shared CTkImage for a logical size, pre-scaled for the widget's DPI scale."""
+        key = (path, size, circle, round(scale, 3))
+        with self.lock:
+            img = self.images.get(key)
+            if img is not None:
+                self.images.move_to_end(key)
+                return img
+        px = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+        img = ctk.CTkImage(light_image=self.variant(path, px, circle), size=size)
+        with self.lock:
+            self.images[key] = img
+        return img
+
+    def logo(self, size: int, circle: bool = False, scale: float = 1.0) -> ctk.CTkImage:
+        return self.ctk_image(asset_path(LOGO_FILENAME), (size, size), circle, scale)
+
+    def avatar(self, key: str, color: str | None, size: int, scale: float = 1.0, path: str | None = None) -> ctk.CTkImage:
+        """Round avatar from an image file if given, else a flat circle in the profile color."""
+        if path and os.path.exists(path):
+            return self.ctk_image(path, (size, size), True, scale)
+        color = color or HELIX_PURPLE
+        # Color is part of the key, so a changed profile color never serves a stale image.
+        name = f"avatar:{key}:{color}"
+        ikey = (name, (size, size), True, round(scale, 3))
+        with self.lock:
+            img = self.images.get(ikey)
+            if img is not None:
+                self.images.move_to_end(ikey)
+                return img
+        from PIL import Image
+        px = max(1, round(size * scale))
+        base = make_circle(Image.new("RGBA", (px, px), color))
+        self._store((name, (px, px), True), base)
+        img = ctk.CTkImage(light_image=base, size=(size, size))
+        with self.lock:
+            self.images[ikey] = img
+        return img
+
+    def clear(self) -> None:
+        with self.lock:
+            self.sources.clear()
+            self.variants.clear()
+            self.images.clear()
+            self.bytes = 0
+
+ASSETS = ImageCache()
+
 # =========================
 # SESSION & EMAIL
 # =========================
 
-def save_session(email: str) -> None:
+def save_session(email: str, token: str) -> None:
     try:
         with open(data_path(SESSION_FILE), "w", encoding="utf-8") as f:
-            json.dump({"email": email, "expiry": time.time() + 604800}, f)
+            json.dump({"email": email, "token": token, "expiry": time.time() + SESSION_TTL}, f)
     except Exception:
         pass
 
-def load_session() -> str | None:
+def load_session() -> tuple[str, str] | None:
+    """(email, token) of the saved sign-in; check the token with db.session_user()."""
     try:
         path = data_path(SESSION_FILE)
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            if data.get("expiry", 0) > time.time():
-                return data.get("email")
+            if data.get("expiry", 0) > time.time() and data.get("email") and data.get("token"):
+                return data["email"], data["token"]
     except Exception:
         pass
     return None
@@ -142,34 +369,549 @@ def clear_session() -> None:
     except Exception:
         pass
 
-def send_otp_email(to_email: str, otp_code: str) -> tuple[bool, str]:
+def save_snapshot(data: dict) -> None:
+    """Write the UI snapshot atomically so a crash mid-write never leaves a broken file."""
+    try:
+        path = data_path(SNAPSHOT_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+def load_snapshot(email: str) -> dict | None:
+    """Last UI snapshot, if it belongs to this user."""
     try:
+        path = data_path(SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get("version") == 1 and data.get("email") == email:
+                return data
+    except Exception:
+        pass
+    return None
+
+def clear_snapshot() -> None:
+    try:
+        path = data_path(SNAPSHOT_FILE)
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception:
+        pass
+
+class MailServerError(Exception):
+    """Couldn't connect or sign in to the SMTP server; no message was tried."""
+
+class MailQueue:
+    """Outbound mail, stored in the mail_queue table and sent by one worker thread.
+
+    The worker keeps one authenticated SMTP connection open while there is mail and
+    closes it after MAIL_IDLE_CLOSE idle seconds. Transient failures are retried with
+    exponential backoff; permanent (5xx) rejections fail at once. When the server
+    can't be reached or refuses our login, mail goes back to the queue without using
+    up attempts. Only a process with SMTP settings runs the worker: the desktop with a
+    local database, or the storage service.
+    """
+
+    def __init__(self, dbm=None):
+        self._db = dbm
+        self.wake = threading.Event()
+        self.finished = threading.Condition()
+        self.lock = threading.Lock()
+        self.worker: threading.Thread | None = None
+        self.smtp = None
+        self.last_used = 0.0
+        self.server_errors = 0 # connection or login failures in a row
+        self.stats = {"connections": 0, "sent": 0, "retried": 0, "failed": 0, "deferred": 0}
+
+    @staticmethod
+    def can_send() -> bool:
+        return SMTP_PASSWORD != SMTP_PASSWORD_PLACEHOLDER
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else db
+
+    def send(self, recipient: str, subject: str, body: str) -> tuple[str, str | None]:
+        """Queue a message: ("queued", id) or ("limited", None). Blocks on the database."""
+        status, mid = self.db.enqueue_mail(recipient, subject, body)
+        if mid:
+            self.start()
+        return status, mid
+
+    def start(self) -> None:
+        """Run the worker; it exits once nothing is queued and the connection is closed."""
+        if not self.can_send():
+            return # left queued for a process that has the credentials
+        with self.lock:
+            self.wake.set()
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="helix-mail", daemon=True)
+                self.worker.start()
+
+    def wait(self, mid: str, timeout: float = MAIL_STATUS_WAIT) -> dict | None:
+        """mail_status() once the message is sent or given up on, or when timeout runs out."""
+        deadline = time.monotonic() + timeout
+        while True:
+            info = self.db.mail_status(mid)
+            left = deadline - time.monotonic()
+            if info is None or info["status"] in ("sent", "failed") or left <= 0:
+                return info
+            with self.finished:
+                self.finished.wait(min(1.0, left)) # polls too: another process may deliver it
+
+    def _run(self) -> None:
+        while True:
+            self.wake.clear()
+            try:
+                rows, next_due = self.db.claim_mail()
+            except Exception:
+                rows, next_due = [], time.time() + MAIL_RETRY_BASE # storage unreachable
+            for i, row in enumerate(rows):
+                try:
+                    self._deliver(*row)
+                except MailServerError as e:
+                    self._defer([r[0] for r in rows[i:]], e)
+                    break
+                except Exception:
+                    pass # left "sending"; it is retried once the lease runs out
+            if rows:
+                continue
+
+            waits = []
+            if next_due is not None:
+                waits.append(next_due - time.time())
+            if self.smtp is not None:
+                waits.append(MAIL_IDLE_CLOSE - (time.monotonic() - self.last_used))
+            if not waits:
+                with self.lock:
+                    if not self.wake.is_set():
+                        self.worker = None
+                        return
+                continue
+            if not self.wake.wait(max(0.05, min(waits))) and self.smtp is not None \
+                    and time.monotonic() - self.last_used >= MAIL_IDLE_CLOSE:
+                self._close()
+
+    def _deliver(self, mid: str, recipient: str, subject: str, body: str, attempts: int) -> None:
+        import smtplib
+        from email.message import EmailMessage
         msg = EmailMessage()
-        msg.set_content(f"Verification code: {otp_code}")
-        msg["Subject"] = "Helix Code"
+        msg.set_content(body)
+        msg["Subject"] = subject
         msg["From"] = SMTP_EMAIL
-        msg["To"] = to_email
+        msg["To"] = recipient
+        try:
+            reused = self.smtp is not None
+            try:
+                self._connection().send_message(msg)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException) as e:
+                if not reused or not self._dropped(e):
+                    raise
+                # The server dropped the idle connection; a fresh one doesn't count as an attempt
+                self._close()
+                self._connection().send_message(msg)
+        except (smtplib.SMTPException, OSError) as e:
+            self._failed(mid, attempts + 1, e)
+        else:
+            self.last_used = time.monotonic()
+            self.db.finish_mail(mid)
+            self.stats["sent"] += 1
+        with self.finished:
+            self.finished.notify_all()
+
+    def _defer(self, mids: list[str], e: MailServerError) -> None:
+        # Our server or credentials, not these messages: requeue them without counting an attempt
+        self.server_errors += 1
+        delay = min(MAIL_RETRY_MAX, MAIL_RETRY_BASE * 2 ** (self.server_errors - 1)) * random.uniform(0.8, 1.2)
+        error = f"{type(e.__cause__).__name__}: {e.__cause__}"[:300]
+        for mid in mids:
+            self.db.finish_mail(mid, error, time.time() + delay, attempted=False)
+        self.stats["deferred"] += len(mids)
+        with self.finished:
+            self.finished.notify_all()
+
+    def _failed(self, mid: str, attempts: int, e: Exception) -> None:
+        import smtplib
+        if self._dropped(e) or not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+            self._close() # closed on us, or no reply so the session's state is unknown
+        permanent = self._permanent(e)
+        error = f"{type(e).__name__}: {e}"[:300]
+        if permanent or attempts >= MAIL_MAX_ATTEMPTS:
+            self.db.finish_mail(mid, error)
+            self.stats["failed"] += 1
+        else:
+            delay = min(MAIL_RETRY_MAX, MAIL_RETRY_BASE * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            self.db.finish_mail(mid, error, time.time() + delay)
+            self.stats["retried"] += 1
+
+    @staticmethod
+    def _dropped(e: Exception) -> bool:
+        import smtplib
+        return isinstance(e, smtplib.SMTPServerDisconnected) or getattr(e, "smtp_code", None) == 421
+
+    @staticmethod
+    def _permanent(e: Exception) -> bool:
+        import smtplib
+        if isinstance(e, smtplib.SMTPRecipientsRefused):
+            return all(code >= 500 for code, _ in e.recipients.values())
+        code = getattr(e, "smtp_code", None)
+        return isinstance(code, int) and code >= 500
+
+    def _connection(self):
+        if self.smtp is None:
+            import smtplib
+            smtp = None
+            try:
+                if SMTP_SECURITY == "ssl":
+                    smtp = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=30)
+                else:
+                    smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+                    if SMTP_SECURITY == "starttls":
+                        smtp.starttls()
+                if SMTP_PASSWORD:
+                    smtp.login(SMTP_EMAIL, SMTP_PASSWORD)
+            except (smtplib.SMTPException, OSError) as e:
+                if smtp is not None:
+                    smtp.close()
+                raise MailServerError(str(e)) from e
+            self.smtp = smtp
+            self.server_errors = 0
+            self.stats["connections"] += 1
+        return self.smtp
+
+    def _close(self) -> None:
+        smtp, self.smtp = self.smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except Exception:
+                smtp.close()
 
-        server = smtplib.SMTP_SSL("smtp.gmail.com", 465)
-        server.login(SMTP_EMAIL, SMTP_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        return True, "Code sent!"
-    except Exception:
-        return False, "Email failed."
+mailer = MailQueue()
+
+def send_signup_code(email: str) -> tuple[str, str | None]:
+    """Have storage mail a sign-up code: ("queued", mail id), ("limited", None) or ("exists", None)."""
+    status, mid = db.start_signup(email)
+    if mid and not DB_URL:
+        mailer.start() # with shared storage the service's own queue sends it
+    return status, mid
+
+# =========================
+# TELEMETRY
+# =========================
+
+def percentile(values, p: float) -> float:
+    """Nearest-rank percentile (0.0 for no values)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+class Telemetry:
+    """Opt-in performance events: in-memory percentiles plus a rotating JSONL log.
+
+    Every hook checks `enabled` first, so while telemetry is off a call site costs one
+    attribute read. Events are written by a background thread, never the caller.
+    """
+
+    def __init__(self, path: str, enabled: bool = False):
+        self.path = path
+        self.enabled = False
+        self.samples: dict[str, deque] = {}
+        self.counters: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.events: queue.Queue = queue.Queue()
+        self.writer: threading.Thread | None = None
+        self.set_enabled(enabled)
+
+    def set_enabled(self, on: bool) -> None:
+        self.enabled = on
+        if on and self.writer is None:
+            self.writer = threading.Thread(target=self._write_loop, daemon=True)
+            self.writer.start()
+
+    def observe(self, metric: str, value: float | None) -> None:
+        if value is None:
+            return
+        with self.lock:
+            bucket = self.samples.get(metric)
+            if bucket is None:
+                bucket = self.samples[metric] = deque(maxlen=TELEMETRY_SAMPLES)
+            bucket.append(value)
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def record(self, kind: str, **fields) -> None:
+        if self.enabled:
+            self.events.put({"ts": round(time.time(), 3), "kind": kind, **fields})
+
+    def request(self, purpose: str, **fields) -> None:
+        if not self.enabled:
+            return
+        for name in ("ttft_ms", "total_ms", "tok_s", "prompt_tokens"):
+            self.observe(f"request.{purpose}.{name}", fields.get(name))
+        self.count(f"request.{purpose}")
+        if fields.get("cancelled"):
+            self.count(f"request.{purpose}.cancelled")
+        if fields.get("error"):
+            self.count(f"request.{purpose}.error")
+        self.record("request", purpose=purpose, **fields)
+
+    def db(self, op: str, ms: float) -> None:
+        if self.enabled:
+            self.observe(f"db.{op}.ms", ms)
+            self.record("db", op=op, ms=round(ms, 2))
+
+    def summary(self) -> list[tuple[str, int, float, float, float]]:
+        """(metric, count, p50, p95, p99) for every metric, sorted by name."""
+        with self.lock:
+            items = [(k, list(v)) for k, v in self.samples.items()]
+        return [(k, len(v), percentile(v, 50), percentile(v, 95), percentile(v, 99)) for k, v in sorted(items)]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.samples = {}
+            self.counters = {}
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self.events.get()]
+            while not self.events.empty() and len(batch) < 500:
+                batch.append(self.events.get_nowait())
+            try:
+                self._rotate_if_needed()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(e) + "\n" for e in batch))
+            except Exception:
+                pass
+
+    def _rotate_if_needed(self) -> None:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < TELEMETRY_MAX_BYTES:
+            return
+        for i in range(TELEMETRY_BACKUPS - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+TELEMETRY = Telemetry(data_path(TELEMETRY_FILE), enabled=os.environ.get("HELIX_TELEMETRY") == "1")
+
+class RequestTrace:
+    """Timing for one model call; every method is a no-op while telemetry is off."""
+
+    def __init__(self, purpose: str, model: str, messages: list[dict]):
+        self.on = TELEMETRY.enabled
+        if not self.on:
+            return
+        self.purpose = purpose
+        self.model = model
+        self.prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+        self.t0 = time.perf_counter()
+        self.first: float | None = None
+        self.chars = 0
+        self.flush_ms: list[float] = []
+
+    def chunk(self, text: str) -> None:
+        if self.on:
+            if self.first is None:
+                self.first = time.perf_counter()
+            self.chars += len(text)
+
+    def flushed(self, arrived: float | None) -> None:
+        """Called on the Tk thread once a chunk that arrived at `arrived` is on screen."""
+        if self.on and arrived is not None:
+            ms = (time.perf_counter() - arrived) * 1000
+            self.flush_ms.append(ms)
+            TELEMETRY.observe("ui.flush_ms", ms)
+
+    def finish(self, cancelled: bool = False, error: str | None = None) -> None:
+        if not self.on:
+            return
+        now = time.perf_counter()
+        first = self.first if self.first is not None else now
+        tokens = (self.chars + 3) // 4 # same chars/4 estimate as estimate_tokens
+        gen_s = now - first
+        try:
+            endpoint = str(client.base_url)
+        except Exception:
+            endpoint = ""
+        TELEMETRY.request(
+            self.purpose,
+            endpoint=endpoint,
+            model=self.model,
+            prompt_tokens=(self.prompt_chars + 3) // 4,
+            completion_tokens=tokens,
+            ttft_ms=round((first - self.t0) * 1000, 1),
+            total_ms=round((now - self.t0) * 1000, 1),
+            tok_s=round(tokens / gen_s, 1) if gen_s >= 0.01 and tokens else None, # skip single-burst replies
+            flush_p95_ms=round(percentile(self.flush_ms, 95), 2) if self.flush_ms else None,
+            cancelled=cancelled,
+            error=error,
+        )
+
+def timed_db_methods(cls):
+    """Class decorator: report the duration of each public method call to telemetry."""
+    def wrap(name, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            if not TELEMETRY.enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                TELEMETRY.db(name, (time.perf_counter() - t0) * 1000)
+        return timed
+
+    for name, fn in list(vars(cls).items()):
+        if callable(fn) and not name.startswith("_"):
+            setattr(cls, name, wrap(name, fn))
+    return cls
+
+# =========================
+# PASSWORDS
+# =========================
+
+def _bcrypt_hash(password: str, rounds: int) -> bytes:
+    import bcrypt
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
+
+def _bcrypt_check(password: str, pw_hash: bytes) -> bool:
+    import bcrypt
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), pw_hash)
+    except ValueError:
+        return False # not a bcrypt hash
+
+def make_password_pool():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # Not fork: the parent has Tk, SQLite and network threads that a forked child would inherit mid-state
+    return ProcessPoolExecutor(max_workers=PASSWORD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def run_password_job(fn, *args):
+    """Run a bcrypt call in the password processes, or here if they can't start.
+
+    bcrypt is slow on purpose; in separate processes a burst of logins uses every core
+    instead of queueing in this interpreter. The caller's thread just waits.
+    """
+    from concurrent.futures import BrokenExecutor
+    try:
+        return password_pool.submit(fn, *args).result()
+    except (OSError, NotImplementedError, BrokenExecutor):
+        return fn(*args)
+
+def hash_password(password: str) -> bytes:
+    return run_password_job(_bcrypt_hash, password, BCRYPT_ROUNDS)
+
+def check_password(password: str, pw_hash: bytes | str) -> bool:
+    if isinstance(pw_hash, str):
+        pw_hash = pw_hash.encode("utf-8")
+    return run_password_job(_bcrypt_check, password, pw_hash)
+
+def hash_rounds(pw_hash: bytes | str) -> int | None:
+    """Cost factor of a bcrypt hash ($2b$12$...), None if it isn't one."""
+    if isinstance(pw_hash, bytes):
+        pw_hash = pw_hash.decode("ascii", "replace")
+    parts = pw_hash.split("$")
+    return int(parts[2]) if len(parts) > 3 and parts[2].isdigit() else None
+
+def session_digest(token: str) -> str:
+    # Tokens are random, so a plain hash is enough; storage never sees a usable token
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
 # =========================
 # DATABASE
 # =========================
 
+class SQLitePool:
+    """Reusable connections to one SQLite file; sized for the threads that use it at once."""
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+
+    def connect(self) -> "PooledConnection":
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        return PooledConnection(conn, self)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if self.idle.qsize() < self.size:
+            self.idle.put(conn)
+        else:
+            conn.close()
+
+class PooledConnection:
+    """A borrowed sqlite3 connection; close() discards uncommitted work and returns it."""
+
+    __slots__ = ("_conn", "_pool")
+
+    def __init__(self, conn: sqlite3.Connection, pool: SQLitePool):
+        self._conn = conn
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        self._pool.release(conn)
+
+class KeyedLocks:
+    """One lock per key (a user's email), created on demand and dropped when unused."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks: dict[str, list] = {} # key -> [lock, holders]
+
+    @contextmanager
+    def hold(self, key: str):
+        with self.lock:
+            entry = self.locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.locks[key]
+
+@timed_db_methods
 class DatabaseManager:
-    def __init__(self) -> None:
-        self.path = data_path(DB_FILE)
+    def __init__(self, path: str | None = None, pool_size: int = DB_POOL_SIZE) -> None:
+        self.path = path or data_path(DB_FILE)
+        self.pool = SQLitePool(self.path, pool_size)
+        self.user_locks = KeyedLocks() # serialises read-modify-write on one user's balance
         self.init_db()
 
+    def _connect(self) -> PooledConnection:
+        return self.pool.connect()
+
     def init_db(self) -> None:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         c = conn.cursor()
+        # Readers don't wait for a writer, which matters once many clients share the file
+        c.execute("PRAGMA journal_mode=WAL")
 
         c.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -198,9 +940,13 @@ class DatabaseManager:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 email TEXT,
                 content TEXT,
-                created_at TEXT
+                created_at TEXT,
+                source TEXT DEFAULT 'manual'
             )
         """)
+        # Older databases predate the source column; their rows were all saved by hand
+        if "source" not in [col[1] for col in c.execute("PRAGMA table_info(memories)")]:
+            c.execute("ALTER TABLE memories ADD COLUMN source TEXT DEFAULT 'manual'")
         c.execute("""
             CREATE TABLE IF NOT EXISTS profiles (
                 email TEXT PRIMARY KEY,
@@ -230,20 +976,109 @@ class DatabaseManager:
                 is_draft INTEGER
             )
         """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_dm_contact_ts ON dm_messages (contact_id, timestamp)")
+        # Tokens set aside for replies still streaming (see AdmissionController)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS token_reservations (
+                id TEXT PRIMARY KEY,
+                email TEXT,
+                amount INTEGER,
+                created_at REAL
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_reservations_email ON token_reservations (email)")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS mail_queue (
+                id TEXT PRIMARY KEY,
+                recipient TEXT,
+                subject TEXT,
+                body TEXT,
+                status TEXT,
+                attempts INTEGER,
+                next_attempt REAL,
+                created_at REAL,
+                sent_at REAL,
+                error TEXT
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_mail_due ON mail_queue (status, next_attempt)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_mail_recipient ON mail_queue (recipient, created_at)")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                token_hash TEXT PRIMARY KEY,
+                email TEXT,
+                expires_at REAL
+            )
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS signup_codes (
+                email TEXT PRIMARY KEY,
+                code_hash TEXT,
+                expires_at REAL,
+                attempts INTEGER
+            )
+        """)
         conn.commit()
         conn.close()
 
+    def as_user(self, token: str | None) -> "DatabaseManager":
+        """Same as RemoteDatabase.as_user(); a local file needs no sign-in, so this manager."""
+        return self
+
+    def use_session(self, token: str | None) -> None:
+        pass
+
     def check_exists(self, email: str) -> bool:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         res = conn.cursor().execute("SELECT 1 FROM users WHERE email=?", (email,)).fetchone()
         conn.close()
         return res is not None
 
-    def register_final(self, email: str, password: str) -> tuple[bool, str]:
-        conn = sqlite3.connect(self.path)
+    def start_signup(self, email: str) -> tuple[str, str | None]:
+        """Mail a sign-up code: ("queued", mail id), ("limited", None) or ("exists", None).
+
+        Only the code's digest is stored. A limited request leaves the last code sent valid.
+        """
+        import secrets
+        if self.check_exists(email):
+            return "exists", None
+        code = str(100000 + secrets.randbelow(900000))
+        status, mid = self.enqueue_mail(email, "Helix Code", f"Verification code: {code}")
+        if mid:
+            conn = self._connect()
+            conn.cursor().execute("INSERT OR REPLACE INTO signup_codes VALUES (?, ?, ?, 0)",
+                                  (email, session_digest(f"{email}:{code}"), time.time() + SIGNUP_CODE_TTL))
+            conn.commit()
+            conn.close()
+        return status, mid
+
+    def register_final(self, email: str, password: str, code: str) -> tuple[bool, str, str | None]:
+        """Create the account if `code` is the one last mailed to it; returns (ok, message, session token)."""
+        import hmac
+        conn = self._connect()
+        try:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            row = c.execute("SELECT code_hash, expires_at, attempts FROM signup_codes WHERE email=?", (email,)).fetchone()
+            if row is None or row[1] < time.time() or row[2] >= SIGNUP_CODE_ATTEMPTS:
+                return False, "No valid code for this address. Request a new one.", None
+            if not hmac.compare_digest(row[0], session_digest(f"{email}:{str(code).strip()}")):
+                c.execute("UPDATE signup_codes SET attempts=attempts+1 WHERE email=?", (email,))
+                conn.commit()
+                return False, "Invalid code.", None
+            c.execute("DELETE FROM signup_codes WHERE email=?", (email,))
+            conn.commit()
+        finally:
+            conn.close()
+        ok, msg = self.add_user(email, password)
+        return ok, msg, self.create_session(email) if ok else None
+
+    def add_user(self, email: str, password: str) -> tuple[bool, str]:
+        """Create an account with no sign-up check; the storage service doesn't expose this."""
+        pw_hash = hash_password(password) # before taking a connection; this is the slow part
+        conn = self._connect()
         c = conn.cursor()
         try:
-            pw_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
             c.execute("INSERT INTO users VALUES (?, ?, ?)", (email, pw_hash, INITIAL_TOKENS))
             c.execute("INSERT INTO history VALUES (?, ?)", (email, "{}"))
             # Init profile
@@ -256,38 +1091,234 @@ class DatabaseManager:
             conn.close()
 
     def login(self, email: str, password: str) -> tuple[bool, int]:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         data = conn.cursor().execute("SELECT password_hash, tokens FROM users WHERE email=?", (email,)).fetchone()
         conn.close()
-        if data and bcrypt.checkpw(password.encode("utf-8"), data[0]):
-            return True, int(data[1])
-        return False, 0
-
-    def deduct_tokens(self, email: str, amount: int) -> int:
-        conn = sqlite3.connect(self.path)
+        if not data or not check_password(password, data[0]):
+            return False, 0
+        if hash_rounds(data[0]) != BCRYPT_ROUNDS:
+            # The cost setting changed since this hash was made; upgrade it while we have the password
+            new_hash = hash_password(password)
+            conn = self._connect()
+            conn.cursor().execute("UPDATE users SET password_hash=? WHERE email=? AND password_hash=?",
+                                  (new_hash, email, data[0]))
+            conn.commit()
+            conn.close()
+        return True, int(data[1])
+
+    def open_session(self, email: str, password: str, ttl: float = SESSION_TTL) -> tuple[bool, int, str | None]:
+        """login() plus a new session of at most SESSION_TTL seconds: (ok, balance, token)."""
+        ok, balance = self.login(email, password)
+        return ok, balance, self.create_session(email, min(ttl, SESSION_TTL)) if ok else None
+
+    def create_session(self, email: str, ttl: float = SESSION_TTL) -> str:
+        """New sign-in token for `email`; only its digest is stored."""
+        import secrets
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        conn = self._connect()
         c = conn.cursor()
-        c.execute("UPDATE users SET tokens = MAX(0, tokens - ?) WHERE email=?", (amount, email))
+        c.execute("DELETE FROM sessions WHERE expires_at<?", (now,))
+        c.execute("INSERT INTO sessions VALUES (?, ?, ?)", (session_digest(token), email, now + ttl))
+        conn.commit()
+        conn.close()
+        return token
+
+    def session_user(self, token: str) -> str | None:
+        """Email a token was issued to, or None if it is unknown or expired. No bcrypt involved."""
+        conn = self._connect()
+        row = conn.cursor().execute("SELECT email, expires_at FROM sessions WHERE token_hash=?",
+                                    (session_digest(token),)).fetchone()
+        conn.close()
+        return row[0] if row and row[1] > time.time() else None
+
+    def delete_session(self, token: str) -> None:
+        conn = self._connect()
+        conn.cursor().execute("DELETE FROM sessions WHERE token_hash=?", (session_digest(token),))
         conn.commit()
-        bal = c.execute("SELECT tokens FROM users WHERE email=?", (email,)).fetchone()
         conn.close()
+
+    def enqueue_mail(self, recipient: str, subject: str, body: str,
+                     per_recipient: int = MAIL_PER_RECIPIENT, window: float = MAIL_RECIPIENT_WINDOW) -> tuple[str, str | None]:
+        """Queue a message: ("queued", id), or ("limited", None) if the address had enough lately."""
+        mid = str(uuid.uuid4())
+        now = time.time()
+        with self.user_locks.hold(recipient):
+            conn = self._connect()
+            try:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                recent = c.execute("SELECT COUNT(*) FROM mail_queue WHERE recipient=? AND created_at>?",
+                                   (recipient, now - window)).fetchone()[0]
+                if per_recipient and recent >= per_recipient:
+                    return "limited", None
+                c.execute("INSERT INTO mail_queue VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, NULL, NULL)",
+                          (mid, recipient, subject, body, now, now))
+                conn.commit()
+            finally:
+                conn.close()
+        return "queued", mid
+
+    def claim_mail(self, limit: int = 20, lease: float = MAIL_LEASE) -> tuple[list, float | None]:
+        """Take due messages for sending; returns ([(id, recipient, subject, body, attempts)], next due time).
+
+        Claimed rows stay "sending" for `lease` seconds, then any worker may take them again.
+        Messages older than MAIL_TTL are marked failed instead.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("UPDATE mail_queue SET status='failed', error=COALESCE(error, 'expired') "
+                      "WHERE status IN ('queued', 'sending') AND created_at<?", (now - MAIL_TTL,))
+            rows = c.execute("SELECT id, recipient, subject, body, attempts FROM mail_queue "
+                             "WHERE status IN ('queued', 'sending') AND next_attempt<=? ORDER BY next_attempt LIMIT ?",
+                             (now, limit)).fetchall()
+            c.executemany("UPDATE mail_queue SET status='sending', next_attempt=? WHERE id=?",
+                          [(now + lease, r[0]) for r in rows])
+            nxt = c.execute("SELECT MIN(next_attempt) FROM mail_queue WHERE status IN ('queued', 'sending')").fetchone()[0]
+            conn.commit()
+        finally:
+            conn.close()
+        return [tuple(r) for r in rows], nxt
+
+    def finish_mail(self, mid: str, error: str | None = None, retry_at: float | None = None,
+                    attempted: bool = True) -> None:
+        """Record a send attempt: sent (no error), queued again (retry_at) or failed.
+
+        attempted=False requeues a message that was never tried, leaving its attempts alone.
+        """
+        now = time.time()
+        tried = 1 if attempted else 0
+        conn = self._connect()
+        if error is None:
+            conn.cursor().execute("UPDATE mail_queue SET status='sent', attempts=attempts+?, sent_at=?, error=NULL "
+                                  "WHERE id=?", (tried, now, mid))
+        else:
+            conn.cursor().execute("UPDATE mail_queue SET status=?, attempts=attempts+?, next_attempt=?, error=? WHERE id=?",
+                                  ("queued" if retry_at else "failed", tried, retry_at or now, error, mid))
+        conn.commit()
+        conn.close()
+
+    def mail_status(self, mid: str) -> dict | None:
+        conn = self._connect()
+        row = conn.cursor().execute("SELECT status, attempts, error, sent_at FROM mail_queue WHERE id=?", (mid,)).fetchone()
+        conn.close()
+        return {"status": row[0], "attempts": row[1], "error": row[2], "sent_at": row[3]} if row else None
+
+    def deduct_tokens(self, email: str, amount: int) -> int:
+        # The update and the balance read are one write transaction, so concurrent charges
+        # (other threads here, or other processes on the same file) can't interleave.
+        with self.user_locks.hold(email):
+            conn = self._connect()
+            try:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                c.execute("UPDATE users SET tokens = MAX(0, tokens - ?) WHERE email=?", (max(0, int(amount)), email))
+                bal = c.execute("SELECT tokens FROM users WHERE email=?", (email,)).fetchone()
+                conn.commit()
+            finally:
+                conn.close()
         return int(bal[0]) if bal else 0
 
     def get_token_balance(self, email: str) -> int:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         res = conn.cursor().execute("SELECT tokens FROM users WHERE email=?", (email,)).fetchone()
         conn.close()
         return int(res[0]) if res else 0
 
+    def reserve_tokens(self, rid: str, email: str, amount: int, max_active: int = 0) -> tuple[str, int]:
+        """Set `amount` aside for a reply about to stream.
+
+        Returns ("ok" | "busy" | "insufficient", balance). "busy" means the user already
+        has `max_active` reservations open. Reservations older than RESERVATION_TTL are
+        refunded first; they belong to clients that died mid-reply.
+        """
+        amount = max(0, int(amount))
+        with self.user_locks.hold(email):
+            conn = self._connect()
+            try:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                cutoff = time.time() - RESERVATION_TTL
+                stale = c.execute("SELECT COALESCE(SUM(amount), 0) FROM token_reservations WHERE email=? AND created_at<?",
+                                  (email, cutoff)).fetchone()[0]
+                if stale:
+                    c.execute("UPDATE users SET tokens = tokens + ? WHERE email=?", (stale, email))
+                c.execute("DELETE FROM token_reservations WHERE email=? AND created_at<?", (email, cutoff))
+                row = c.execute("SELECT tokens FROM users WHERE email=?", (email,)).fetchone()
+                balance = int(row[0]) if row else 0
+                active = c.execute("SELECT COUNT(*) FROM token_reservations WHERE email=?", (email,)).fetchone()[0]
+                if max_active and active >= max_active:
+                    status = "busy"
+                elif row is None or balance < amount:
+                    status = "insufficient"
+                else:
+                    c.execute("UPDATE users SET tokens = tokens - ? WHERE email=?", (amount, email))
+                    c.execute("INSERT INTO token_reservations VALUES (?, ?, ?, ?)", (rid, email, amount, time.time()))
+                    status, balance = "ok", balance - amount
+                conn.commit()
+            finally:
+                conn.close()
+        return status, balance
+
+    def settle_tokens(self, rid: str, email: str, actual: int) -> int:
+        """Close a reservation, charging `actual` instead; returns the new balance.
+
+        A reservation already refunded as stale is charged in full, clamped at zero.
+        """
+        with self.user_locks.hold(email):
+            conn = self._connect()
+            try:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                row = c.execute("SELECT amount FROM token_reservations WHERE id=? AND email=?", (rid, email)).fetchone()
+                reserved = int(row[0]) if row else 0
+                c.execute("DELETE FROM token_reservations WHERE id=?", (rid,))
+                c.execute("UPDATE users SET tokens = MAX(0, tokens + ? - ?) WHERE email=?",
+                          (reserved, max(0, int(actual)), email))
+                bal = c.execute("SELECT tokens FROM users WHERE email=?", (email,)).fetchone()
+                conn.commit()
+            finally:
+                conn.close()
+        return int(bal[0]) if bal else 0
+
     def save_chats(self, email: str, chat_dict: dict) -> None:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         conn.cursor().execute("UPDATE history SET chat_data=? WHERE email=?", (json.dumps(chat_dict), email))
         conn.commit()
         conn.close()
 
+    def update_chats(self, email: str, changed: dict, deleted=()) -> None:
+        """Write just these chats (and drop `deleted`) into the stored set.
+
+        Read and write are one transaction, so the desktop app and API processes sharing
+        the file each keep the chats the others saved, which save_chats would overwrite.
+        """
+        with self.user_locks.hold(email):
+            conn = self._connect()
+            try:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                row = c.execute("SELECT chat_data FROM history WHERE email=?", (email,)).fetchone()
+                chats = self._decode_chats(row)
+                chats.update(changed)
+                for cid in deleted:
+                    chats.pop(cid, None)
+                c.execute("UPDATE history SET chat_data=? WHERE email=?", (json.dumps(chats), email))
+                conn.commit()
+            finally:
+                conn.close()
+
     def load_chats(self, email: str) -> dict:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         row = conn.cursor().execute("SELECT chat_data FROM history WHERE email=?", (email,)).fetchone()
         conn.close()
+        return self._decode_chats(row)
+
+    @staticmethod
+    def _decode_chats(row) -> dict:
         if not row or not row[0]:
             return {}
         try:
@@ -297,7 +1328,7 @@ class DatabaseManager:
             return {}
 
     def save_notebook(self, nid: str, email: str, title: str, content: str) -> None:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         conn.cursor().execute(
             "INSERT OR REPLACE INTO notebooks (id, email, title, content, updated_at) VALUES (?, ?, ?, ?, ?)",
             (nid, email, title, content, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
@@ -306,7 +1337,7 @@ class DatabaseManager:
         conn.close()
 
     def load_notebooks_list(self, email: str):
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         res = conn.cursor().execute(
             "SELECT id, title FROM notebooks WHERE email=? ORDER BY updated_at DESC",
             (email,),
@@ -315,31 +1346,61 @@ class DatabaseManager:
         return res
 
     def load_notebook_content(self, nid: str) -> tuple[str, str]:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         res = conn.cursor().execute("SELECT title, content FROM notebooks WHERE id=?", (nid,)).fetchone()
         conn.close()
         return (res[0], res[1]) if res else ("Untitled", "")
 
-    def add_memory(self, email: str, content: str) -> None:
-        conn = sqlite3.connect(self.path)
+    def notebook_owner(self, nid: str) -> str | None:
+        conn = self._connect()
+        res = conn.cursor().execute("SELECT email FROM notebooks WHERE id=?", (nid,)).fetchone()
+        conn.close()
+        return res[0] if res else None
+
+    def delete_notebook(self, nid: str, email: str) -> bool:
+        conn = self._connect()
         c = conn.cursor()
-        # Enforce limit by deleting oldest if count >= MAX_MEMORIES
-        count = c.execute("SELECT COUNT(*) FROM memories WHERE email=?", (email,)).fetchone()[0]
-        if count >= MAX_MEMORIES:
-            # Delete oldest
-            oldest = c.execute("SELECT id FROM memories WHERE email=? ORDER BY id ASC LIMIT 1", (email,)).fetchone()
-            if oldest:
-                c.execute("DELETE FROM memories WHERE id=?", (oldest[0],))
-
-        c.execute(
-            "INSERT INTO memories (email, content, created_at) VALUES (?, ?, ?)",
-            (email, content, datetime.now().strftime("%Y-%m-%d")),
-        )
+        c.execute("DELETE FROM notebooks WHERE id=? AND email=?", (nid, email))
         conn.commit()
         conn.close()
+        return c.rowcount > 0
+
+    def add_memory(self, email: str, content: str, source: str = "manual") -> None:
+        """Store a memory; source is "manual" or "auto" (MemoryExtractor).
+
+        At MAX_MEMORIES the oldest automatic fact makes room, so extracted facts never
+        push out what the user saved by hand. A manual memory falls back to the oldest
+        manual one; an automatic fact with no automatic row to replace is dropped.
+        """
+        # Count, evict and insert in one write transaction: the extractor and a manual add
+        # racing past the count would otherwise both insert and overshoot the limit.
+        with self.user_locks.hold(email):
+            conn = self._connect()
+            try:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                count = c.execute("SELECT COUNT(*) FROM memories WHERE email=?", (email,)).fetchone()[0]
+                if count >= MAX_MEMORIES:
+                    only_auto = " AND source='auto'" if source == "auto" else ""
+                    oldest = c.execute(
+                        f"SELECT id FROM memories WHERE email=?{only_auto} ORDER BY source='auto' DESC, id ASC LIMIT 1",
+                        (email,),
+                    ).fetchone()
+                    if not oldest:
+                        conn.rollback()
+                        return
+                    c.execute("DELETE FROM memories WHERE id=?", (oldest[0],))
+
+                c.execute(
+                    "INSERT INTO memories (email, content, created_at, source) VALUES (?, ?, ?, ?)",
+                    (email, content, datetime.now().strftime("%Y-%m-%d"), source),
+                )
+                conn.commit()
+            finally:
+                conn.close()
 
     def get_memories(self, email: str):
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         res = conn.cursor().execute(
             "SELECT id, content FROM memories WHERE email=? ORDER BY id DESC",
             (email,),
@@ -347,14 +1408,19 @@ class DatabaseManager:
         conn.close()
         return res
 
-    def delete_memory(self, mid: int) -> None:
-        conn = sqlite3.connect(self.path)
-        conn.cursor().execute("DELETE FROM memories WHERE id=?", (mid,))
+    def delete_memory(self, mid: int, email: str | None = None) -> bool:
+        conn = self._connect()
+        c = conn.cursor()
+        if email is None:
+            c.execute("DELETE FROM memories WHERE id=?", (mid,))
+        else:
+            c.execute("DELETE FROM memories WHERE id=? AND email=?", (mid, email))
         conn.commit()
         conn.close()
+        return c.rowcount > 0
 
     def get_profile(self, email: str):
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         res = conn.cursor().execute("SELECT display_name, bio, avatar_color FROM profiles WHERE email=?", (email,)).fetchone()
         conn.close()
         if not res:
@@ -362,7 +1428,7 @@ class DatabaseManager:
         return res
 
     def save_profile(self, email: str, display_name: str, bio: str):
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         # Check if exists
         exists = conn.cursor().execute("SELECT 1 FROM profiles WHERE email=?", (email,)).fetchone()
         if exists:
@@ -374,41 +1440,193 @@ class DatabaseManager:
 
     # --- DM METHODS ---
     def get_contacts(self, email):
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         res = conn.cursor().execute("SELECT id, name, last_msg FROM contacts WHERE user_email=? ORDER BY updated_at DESC", (email,)).fetchall()
         conn.close()
         return res
 
     def add_contact(self, email, name):
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         cid = str(uuid.uuid4())
         conn.cursor().execute("INSERT INTO contacts VALUES (?, ?, ?, ?, ?, ?)", (cid, email, name, "#555", "New Chat", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
         conn.commit()
         conn.close()
         return cid
 
+    def contact_owner(self, contact_id) -> str | None:
+        conn = self._connect()
+        res = conn.cursor().execute("SELECT user_email FROM contacts WHERE id=?", (contact_id,)).fetchone()
+        conn.close()
+        return res[0] if res else None
+
     def get_dm_messages(self, contact_id):
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         res = conn.cursor().execute("SELECT role, content, is_draft FROM dm_messages WHERE contact_id=? ORDER BY timestamp ASC", (contact_id,)).fetchall()
         conn.close()
         return res
 
-    def save_dm_message(self, contact_id, role, content, is_draft=0):
-        conn = sqlite3.connect(self.path)
+    def get_dm_messages_page(self, contact_id, before: tuple[str, int] | None = None, limit: int = 50) -> list[dict]:
+        """Up to `limit` messages older than the (timestamp, rowid) key `before`, oldest first."""
+        conn = self._connect()
+        if before is None:
+            rows = conn.cursor().execute(
+                "SELECT rowid, role, content, is_draft, timestamp FROM dm_messages WHERE contact_id=? "
+                "ORDER BY timestamp DESC, rowid DESC LIMIT ?",
+                (contact_id, limit),
+            ).fetchall()
+        else:
+            rows = conn.cursor().execute(
+                "SELECT rowid, role, content, is_draft, timestamp FROM dm_messages WHERE contact_id=? "
+                "AND (timestamp < ? OR (timestamp = ? AND rowid < ?)) ORDER BY timestamp DESC, rowid DESC LIMIT ?",
+                (contact_id, before[0], before[0], before[1], limit),
+            ).fetchall()
+        conn.close()
+        return [{"rowid": r[0], "role": r[1], "content": r[2], "is_draft": r[3], "timestamp": r[4]} for r in reversed(rows)]
+
+    def save_dm_message(self, contact_id, role, content, is_draft=0) -> dict:
+        conn = self._connect()
         mid = str(uuid.uuid4())
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        conn.cursor().execute("INSERT INTO dm_messages VALUES (?, ?, ?, ?, ?, ?)", (mid, contact_id, role, content, ts, is_draft))
+        cur = conn.cursor()
+        cur.execute("INSERT INTO dm_messages VALUES (?, ?, ?, ?, ?, ?)", (mid, contact_id, role, content, ts, is_draft))
+        rowid = cur.lastrowid
         if not is_draft:
             conn.cursor().execute("UPDATE contacts SET last_msg=?, updated_at=? WHERE id=?", (content[:30], ts, contact_id))
         conn.commit()
         conn.close()
+        return {"rowid": rowid, "role": role, "content": content, "is_draft": is_draft, "timestamp": ts}
+
+# What the storage service lets clients call, and how each call is tied to the caller.
+# None: no sign-in needed. Otherwise (email position, owned id): the caller's session
+# supplies the email argument at that position, whatever the client sent, and an owned
+# "notebook" or "contact" id in the first argument must belong to the caller.
+DB_METHODS = {
+    "check_exists": None,
+    "login": None,
+    "open_session": None,
+    "session_user": None,
+    "delete_session": None,
+    "start_signup": None,
+    "register_final": None,
+    "mail_status": None,
+    "deduct_tokens": (0, None),
+    "get_token_balance": (0, None),
+    "reserve_tokens": (1, None),
+    "settle_tokens": (1, None),
+    "save_chats": (0, None),
+    "update_chats": (0, None),
+    "load_chats": (0, None),
+    "save_notebook": (1, "notebook"),
+    "load_notebooks_list": (0, None),
+    "load_notebook_content": (None, "notebook"),
+    "notebook_owner": (None, "notebook"),
+    "delete_notebook": (1, None),
+    "add_memory": (0, None),
+    "get_memories": (0, None),
+    "delete_memory": (1, None),
+    "get_profile": (0, None),
+    "save_profile": (0, None),
+    "get_contacts": (0, None),
+    "add_contact": (0, None),
+    "get_dm_messages": (None, "contact"),
+    "get_dm_messages_page": (None, "contact"),
+    "save_dm_message": (None, "contact"),
+}
+
+class RemoteDatabase:
+    """DatabaseManager's methods, forwarded to a shared storage service (`Main.py dbserver`).
+
+    Calls are JSON over HTTP on kept-alive connections from a small pool, so many threads
+    can use one instance. Besides the service token, calls carry the signed-in user's
+    session (use_session); the service acts for that user only. Service errors surface
+    as RuntimeError.
+    """
+
+    def __init__(self, url: str, token: str = "", pool_size: int = DB_POOL_SIZE, timeout: float = 30,
+                 session: str | None = None):
+        from urllib.parse import urlsplit
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if self.https else 80)
+        self.rpc_path = parts.path.rstrip("/") + "/rpc"
+        self.token = token
+        self.size = pool_size
+        self.timeout = timeout
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.session = session
+
+    def as_user(self, token: str | None) -> "RemoteDatabase":
+        """A view acting for the user signed in with `token`, sharing this connection pool."""
+        import copy
+        view = copy.copy(self)
+        view.session = token
+        return view
+
+    def use_session(self, token: str | None) -> None:
+        """Act for the user signed in with `token` from now on (None after logout)."""
+        self.session = token
+
+    def _new_conn(self):
+        import http.client
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def call(self, method: str, *args):
+        import http.client
+        body = json.dumps({"method": method, "args": args})
+        headers = {"Content-Type": "application/json", "X-Helix-Token": self.token}
+        if self.session:
+            headers["X-Helix-Session"] = self.session
+        t0 = time.perf_counter()
+        for attempt in (0, 1):
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self._new_conn()
+            try:
+                conn.request("POST", self.rpc_path, body, headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if attempt:
+                    raise
+                continue # a pooled connection the server already closed; retry on a fresh one
+            if self.idle.qsize() < self.size and not resp.will_close:
+                self.idle.put(conn)
+            else:
+                conn.close()
+            break
+        if TELEMETRY.enabled:
+            TELEMETRY.db(method, (time.perf_counter() - t0) * 1000)
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            payload = {"error": data[:200].decode("utf-8", "replace")}
+        if resp.status != 200:
+            raise RuntimeError(f"storage service: {payload.get('error', resp.status)}")
+        return payload.get("result")
+
+    def __getattr__(self, name):
+        if name in DB_METHODS:
+            return functools.partial(self.call, name)
+        raise AttributeError(name)
+
+def open_database():
+    """The shared storage service when HELIX_DB_URL is set, else the local SQLite file."""
+    if DB_URL:
+        return RemoteDatabase(DB_URL, DB_TOKEN)
+    return DatabaseManager()
 
 
 # =========================
 # AI CLIENT
 # =========================
 
-def get_working_client() -> OpenAI:
+def get_working_client() -> "OpenAI":
+    import requests
+    from openai import OpenAI
     try:
         if requests.get(f"{LOCAL_URL}/models", timeout=1).status_code == 200:
             return OpenAI(base_url=LOCAL_URL, api_key=API_KEY)
@@ -416,8 +1634,1229 @@ def get_working_client() -> OpenAI:
         pass
     return OpenAI(base_url=PUBLIC_URL, api_key=API_KEY)
 
-client = get_working_client()
-db = DatabaseManager()
+class LazyService:
+    """Module-level service created on first use, or ahead of time by warm_up().
+
+    Attribute access is forwarded, so `db.login(...)` and `client.chat...` read the same
+    as with the plain objects; only the first caller pays the construction cost.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        obj = self._obj
+        if obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._factory()
+                obj = self._obj
+        return obj
+
+    def ready(self) -> bool:
+        return self._obj is not None
+
+    def warm_up(self) -> None:
+        """Build the service on a background thread."""
+        threading.Thread(target=self.get, daemon=True).start()
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+# The client probe is a network round trip and the DB runs its schema; neither blocks import.
+client = LazyService(get_working_client)
+db = LazyService(open_database)
+password_pool = LazyService(make_password_pool)
+
+# =========================
+# MEMORY EXTRACTION
+# =========================
+
+def _normalize_memory(text: str) -> str:
+    return " ".join("".join(ch.lower() if ch.isalnum() else " " for ch in text).split())
+
+def is_duplicate_memory(candidate: str, existing: list[str]) -> bool:
+    """True if candidate matches, is contained in, or mostly overlaps an existing memory."""
+    cand = _normalize_memory(candidate)
+    if not cand:
+        return True
+    cand_words = set(cand.split())
+    for mem in existing:
+        norm = _normalize_memory(mem)
+        if not norm:
+            continue
+        if cand == norm or cand in norm:
+            return True
+        words = set(norm.split())
+        if len(cand_words & words) / len(cand_words | words) >= 0.8:
+            return True
+    return False
+
+def parse_memory_facts(output: str) -> list[str]:
+    facts = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith(("-", "*", "•")):
+            continue
+        fact = line.lstrip("-*• ").strip()
+        if 8 <= len(fact) <= 200:
+            facts.append(fact)
+    return facts
+
+class MemoryExtractor:
+    """Low-priority worker that turns finished chat turns into memories.
+
+    Jobs run one at a time, at most once per MEMORY_MIN_INTERVAL, and only while no
+    interactive stream is active. An extraction that is in flight when the user starts
+    a new request is abandoned and retried later.
+    """
+
+    def __init__(self, dbm: DatabaseManager, ai=None) -> None:
+        self.db = dbm
+        self.ai = ai if ai is not None else client
+        self.jobs: queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.interactive = 0
+        self.idle = threading.Event()
+        self.idle.set()
+        self.last_call = 0.0
+        self.worker: threading.Thread | None = None
+
+    def interactive_begin(self) -> None:
+        with self.lock:
+            self.interactive += 1
+            self.idle.clear()
+
+    def interactive_end(self) -> None:
+        with self.lock:
+            self.interactive = max(0, self.interactive - 1)
+            if not self.interactive:
+                self.idle.set()
+
+    def submit(self, email: str, turns: list[dict], on_done) -> None:
+        """Queue turns for extraction; on_done(added) runs on the worker thread."""
+        self.jobs.put((email, turns, on_done))
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+
+    def _run(self) -> None:
+        while True:
+            email, turns, on_done = self.jobs.get()
+            added = None
+            while added is None:
+                wait = MEMORY_MIN_INTERVAL - (time.time() - self.last_call)
+                if wait > 0:
+                    time.sleep(wait)
+                self.idle.wait()
+                self.last_call = time.time()
+                try:
+                    added = self._extract(email, turns)
+                except Exception:
+                    # This job is dropped, but say why: a broken endpoint shouldn't look like "no facts"
+                    print("Memory extraction failed:", file=sys.stderr)
+                    traceback.print_exc()
+                    break
+            if added is not None:
+                on_done(added)
+
+    def _extract(self, email: str, turns: list[dict]) -> list[str] | None:
+        transcript = "\n".join(
+            f"{t.get('role', 'user')}: {str(t.get('content', ''))[:MEMORY_TURN_CHARS]}" for t in turns
+        )
+        messages = [
+            {"role": "system", "content": PROMPTS["Memory"]},
+            {"role": "user", "content": transcript},
+        ]
+        trace = RequestTrace("memory", MODEL_CONFIG["Standard"]["id"], messages)
+        try:
+            stream = self.ai.chat.completions.create(
+                model=MODEL_CONFIG["Standard"]["id"],
+                messages=messages,
+                temperature=0.0,
+                max_tokens=200,
+                stream=True,
+            )
+            output = ""
+            for chunk in stream:
+                if not self.idle.is_set():
+                    # A live request started; give the endpoint back and retry later.
+                    stream.close()
+                    trace.finish(cancelled=True)
+                    return None
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if getattr(delta, "content", None):
+                    trace.chunk(delta.content)
+                    output += delta.content
+        except Exception as e:
+            trace.finish(error=str(e))
+            raise
+        trace.finish()
+
+        existing = [m[1] for m in self.db.get_memories(email)]
+        added = []
+        for fact in parse_memory_facts(output):
+            if is_duplicate_memory(fact, existing):
+                continue
+            self.db.add_memory(email, fact, "auto")
+            existing.append(fact)
+            added.append(fact)
+        return added
+
+# =========================
+# NOTEBOOK CHUNKING
+# =========================
+
+_HEADING_RE = re.compile(r"^\s{0,3}#{1,6}\s")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+_TERM_RE = re.compile(r"[a-z0-9]{3,}")
+_STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "your", "with", "this", "that", "from",
+    "have", "has", "was", "were", "what", "when", "where", "which", "who", "how", "why",
+    "can", "could", "would", "should", "will", "about", "into", "there", "their", "them",
+    "then", "than", "some", "any", "all", "its", "our", "out", "just", "also", "does", "did",
+}
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+def tokenize_terms(text: str) -> list[str]:
+    return [t for t in _TERM_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+def _term_counts(text: str) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for t in tokenize_terms(text):
+        counts[t] = counts.get(t, 0) + 1
+    return counts
+
+def split_blocks(content: str) -> list[tuple[int, int, bool]]:
+    """(start, end, is_heading) ranges for headings and blank-line separated paragraphs."""
+    blocks = []
+    start = None
+    last_end = 0
+    pos = 0
+    for line in content.splitlines(keepends=True):
+        line_end = pos + len(line.rstrip("\r\n"))
+        if not line.strip():
+            if start is not None:
+                blocks.append((start, last_end, False))
+                start = None
+        elif _HEADING_RE.match(line):
+            if start is not None:
+                blocks.append((start, last_end, False))
+                start = None
+            blocks.append((pos, line_end, True))
+        else:
+            if start is None:
+                start = pos
+            last_end = line_end
+        pos += len(line)
+    if start is not None:
+        blocks.append((start, last_end, False))
+    return blocks
+
+def _split_long(content: str, start: int, end: int) -> list[tuple[int, int]]:
+    # Break an oversized paragraph at sentence ends, falling back to hard cuts.
+    pieces = []
+    piece_start = start
+    cut = start
+    for m in _SENTENCE_END_RE.finditer(content, start, end):
+        if m.start() - piece_start > CHUNK_MAX_CHARS and cut > piece_start:
+            pieces.append((piece_start, cut))
+            piece_start = cut
+        cut = m.end()
+    while end - piece_start > CHUNK_MAX_CHARS:
+        if cut > piece_start and cut - piece_start <= CHUNK_MAX_CHARS:
+            pieces.append((piece_start, cut))
+            piece_start = cut
+        else:
+            pieces.append((piece_start, piece_start + CHUNK_MAX_CHARS))
+            piece_start += CHUNK_MAX_CHARS
+    if end > piece_start:
+        pieces.append((piece_start, end))
+    return pieces
+
+def chunk_ranges(content: str) -> list[tuple[int, int, str]]:
+    """Group blocks into (start, end, heading) chunks that never cross a heading."""
+    chunks = []
+    heading = ""
+    cur_start = cur_end = None
+
+    def flush():
+        nonlocal cur_start, cur_end
+        if cur_start is not None:
+            chunks.append((cur_start, cur_end, heading))
+        cur_start = cur_end = None
+
+    for start, end, is_heading in split_blocks(content):
+        if is_heading:
+            flush()
+            heading = content[start:end].strip().lstrip("#").strip()
+            cur_start, cur_end = start, end
+            continue
+        for p_start, p_end in _split_long(content, start, end):
+            if cur_start is not None and p_end - cur_start > CHUNK_MAX_CHARS:
+                flush()
+            if cur_start is None:
+                cur_start = p_start
+            cur_end = p_end
+    flush()
+    return chunks
+
+class NotebookChunkIndex:
+    """Cached structure-aware chunks per notebook.
+
+    Chunk ids are content hashes, so an edit only changes the ids (and term counts) of the
+    chunks it touched; everything else is reused with its new character range.
+    """
+
+    def __init__(self) -> None:
+        self.notes: dict[str, dict] = {}
+
+    def update(self, nid: str, title: str, content: str) -> list[dict]:
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        cached = self.notes.get(nid)
+        if cached and cached["hash"] == digest:
+            cached["title"] = title
+            return cached["chunks"]
+
+        previous = {c["id"]: c for c in cached["chunks"]} if cached else {}
+        seen: dict[str, int] = {}
+        chunks = []
+        for start, end, heading in chunk_ranges(content):
+            text = content[start:end]
+            cid = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+            seen[cid] = seen.get(cid, 0) + 1
+            if seen[cid] > 1:
+                cid = f"{cid}-{seen[cid]}"
+            old = previous.get(cid)
+            terms = old["terms"] if old else _term_counts(text)
+            chunks.append({"id": cid, "start": start, "end": end, "heading": heading, "text": text, "terms": terms})
+
+        self.notes[nid] = {"hash": digest, "title": title, "chunks": chunks}
+        return chunks
+
+    def get(self, nid: str, dbm: DatabaseManager) -> tuple[str, list[dict]]:
+        if nid not in self.notes:
+            title, content = dbm.load_notebook_content(nid)
+            self.update(nid, title, content)
+        note = self.notes[nid]
+        return note["title"], note["chunks"]
+
+    def forget(self, nid: str) -> None:
+        self.notes.pop(nid, None)
+
+def select_chunks(candidates: list[tuple[str, str, dict]], query: str, budget_tokens: int,
+                  fallback_leading: bool = False) -> list[tuple[str, str, dict]]:
+    """Pick the (nid, title, chunk) entries that best match query within a token budget.
+
+    Results come back in document order. With fallback_leading, a query that matches
+    nothing still gets the opening chunks instead of an empty context.
+    """
+    q_terms = set(tokenize_terms(query))
+    scored = []
+    if q_terms and candidates:
+        df = {t: sum(1 for _, _, c in candidates if t in c["terms"]) for t in q_terms}
+        n = len(candidates)
+        for i, cand in enumerate(candidates):
+            terms = cand[2]["terms"]
+            score = sum(
+                (1 + math.log(terms[t])) * math.log(1 + n / df[t])
+                for t in q_terms if t in terms
+            )
+            if score > 0:
+                scored.append((score, i))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+    if not scored and fallback_leading:
+        scored = [(0.0, i) for i in range(len(candidates))]
+
+    picked = []
+    used = 0
+    for _, i in scored:
+        cost = estimate_tokens(candidates[i][2]["text"])
+        if used + cost > budget_tokens:
+            continue
+        picked.append(i)
+        used += cost
+    return [candidates[i] for i in sorted(picked)]
+
+def format_chunk_context(selected: list[tuple[str, str, dict]]) -> tuple[str, list[dict]]:
+    """Render selected chunks for the prompt plus range refs the Canvas can highlight."""
+    parts = []
+    refs = []
+    for nid, title, chunk in selected:
+        title = title or "Untitled"
+        parts.append(f"--- Note: {title} [chars {chunk['start']}-{chunk['end']}] ---\n{chunk['text']}")
+        refs.append({"nid": nid, "title": title, "start": chunk["start"], "end": chunk["end"], "chunk": chunk["id"]})
+    return "\n".join(parts), refs
+
+# =========================
+# PROMPT COMPRESSION
+# =========================
+
+_BOILERPLATE_RE = re.compile(r"^\s*(?:[-=_*~#.]{3,}|page \d+(?: of \d+)?|\d+ of \d+)\s*$", re.IGNORECASE)
+_SECTION_MARKER_RE = re.compile(r"^(?:--- Note: .* ---|Notebook:|\[Context from Notebooks\]:)$")
+
+def collapse_whitespace(text: str) -> str:
+    """Squeeze runs of spaces and blank lines and drop separator or page-number lines.
+
+    Indentation is kept (it carries code and list structure); only the spaces after a
+    line's first non-space character are squeezed. Lines holding just a number stay:
+    they may be data, not page numbers.
+    """
+    lines = []
+    blank = False
+    for line in text.splitlines():
+        body = line.strip()
+        if not body or _BOILERPLATE_RE.match(body):
+            if not blank and lines:
+                lines.append("")
+            blank = True
+            continue
+        lines.append(line[:len(line) - len(line.lstrip())] + " ".join(body.split()))
+        blank = False
+    return "\n".join(lines).strip("\n")
+
+_FENCE_RE = re.compile(r"^\s*(?:```|~~~)")
+# Indented lines, lines ending like code, table rows, and lines without any letters
+_VERBATIM_LINE_RE = re.compile(r"^(?: {4}|\t)|[{};]$|\)\s*:$|\|.*\||^[\W\d_]*$")
+_SEPARATORS = ("", " ", "\n", "\n\n")  # weakest to strongest
+
+def _compression_key(sentence: str) -> str:
+    """Case- and punctuation-insensitive form of a prose sentence, for spotting repeats."""
+    return " ".join(re.findall(r"\w+", sentence.casefold()))
+
+def compress_context(text: str, query: str, target_ratio: float = COMPRESSION_TARGET_RATIO) -> str:
+    """Extractive compression of injected context.
+
+    Whitespace and boilerplate are collapsed and repeated prose sentences dropped first.
+    Code (fenced, indented or code-like lines), table rows and number-only lines are
+    kept verbatim, and consecutive ones form a single block that is kept or dropped as a
+    whole. If the result is still above target_ratio of the original, the units that
+    best match the query are kept (in their original order) until the budget is used
+    up. Section marker lines such as "--- Note: ... ---" always survive so range
+    references stay intact.
+    """
+    if not text:
+        return text
+    budget = int(len(text) * max(0.05, min(1.0, target_ratio)))
+
+    # (text, kind, separator before it); kind is "marker", "code" or "prose"
+    units: list[tuple[str, str, str]] = []
+    seen = set()
+    sep = ""
+    in_fence = False
+    for line in collapse_whitespace(text).split("\n"):
+        if not line:
+            if units:
+                sep = "\n\n"
+            continue
+        fence = _FENCE_RE.match(line)
+        if _SECTION_MARKER_RE.match(line):
+            # A new note starts; a fence its predecessor left open ends here
+            units.append((line, "marker", sep))
+            in_fence = False
+            sep = "\n"
+        elif in_fence or fence or _VERBATIM_LINE_RE.search(line):
+            if units and units[-1][1] == "code" and (in_fence or sep == "\n"):
+                prev, _, prev_sep = units[-1]
+                units[-1] = (prev + sep + line, "code", prev_sep)
+            else:
+                units.append((line, "code", sep))
+            if fence:
+                in_fence = not in_fence
+            sep = "\n"
+        else:
+            for sent in _SENTENCE_END_RE.split(line):
+                key = _compression_key(sent)
+                if key in seen:
+                    continue
+                if key:
+                    seen.add(key)
+                units.append((sent, "prose", sep))
+                sep = " "
+            if sep == " ":
+                sep = "\n"
+
+    def render(keep) -> str:
+        out = ""
+        pending = ""
+        for i, (body, _, brk) in enumerate(units):
+            # A dropped unit hands its break on, so paragraphs don't run together
+            pending = max(pending, brk, key=_SEPARATORS.index)
+            if i in keep:
+                out += pending + body if out else body
+                pending = ""
+        return out
+
+    keep = set(range(len(units)))
+    deduped = render(keep)
+    if len(deduped) <= budget:
+        return deduped
+
+    q_terms = set(tokenize_terms(query))
+    bodies = [i for i, u in enumerate(units) if u[1] != "marker"]
+    df: dict[str, int] = {}
+    unit_terms = {}
+    for i in bodies:
+        terms = set(tokenize_terms(units[i][0]))
+        unit_terms[i] = terms
+        for t in terms & q_terms:
+            df[t] = df.get(t, 0) + 1
+    n = max(1, len(bodies))
+
+    def score(i: int) -> float:
+        s = sum(math.log(1 + n / df[t]) for t in unit_terms[i] & q_terms)
+        # Lead sentences of a paragraph tend to carry its topic.
+        return s + (0.25 if units[i][2] != " " else 0.0)
+
+    keep = {i for i, u in enumerate(units) if u[1] == "marker"}
+    used = sum(len(units[i][0]) + 1 for i in keep)
+    for i in sorted(bodies, key=lambda i: (-score(i), i)):
+        cost = len(units[i][0]) + 1
+        if used + cost > budget:
+            continue
+        keep.add(i)
+        used += cost
+    return render(keep)
+
+# =========================
+# ADMISSION CONTROL
+# =========================
+
+def reply_cost(text: str, model_key: str) -> int:
+    """Replies are billed per word, times the model's multiplier."""
+    return len(text.split()) * int(MODEL_CONFIG[model_key]["cost_multiplier"])
+
+class AdmissionDenied(Exception):
+    """A request refused before reaching the model: reason is "tokens", "busy" or "rate"."""
+
+    def __init__(self, reason: str, message: str, retry_after: float | None = None, balance: int | None = None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.balance = balance
+
+class TokenBucket:
+    """Per-key token buckets refilling at `rate` per second up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.levels: dict[str, tuple[float, float]] = {} # key -> (level, last refill)
+        self.lock = threading.Lock()
+
+    def _level(self, key: str, now: float) -> float:
+        level, t = self.levels.get(key, (self.burst, now))
+        return min(self.burst, level + (now - t) * self.rate)
+
+    def take(self, key: str, n: float) -> float:
+        """Take n and return 0, or take nothing and return the seconds until n is there."""
+        n = min(n, self.burst) # an oversized request waits for a full bucket, not forever
+        with self.lock:
+            now = time.monotonic()
+            level = self._level(key, now)
+            if level >= n:
+                self.levels[key] = (level - n, now)
+                return 0.0
+            self.levels[key] = (level, now)
+            return (n - level) / self.rate
+
+    def give(self, key: str, n: float) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.levels[key] = (min(self.burst, self._level(key, now) + n), now)
+
+class Reservation:
+    """Tokens set aside for one reply; settle it with AdmissionController.settle()."""
+
+    def __init__(self, rid: str, email: str, model_key: str, prompt_tokens: int, max_tokens: int, amount: int):
+        self.rid = rid
+        self.email = email
+        self.model_key = model_key
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens # reply cap, also sent to the model
+        self.amount = amount         # balance set aside
+
+    @property
+    def rate_tokens(self) -> int:
+        return self.prompt_tokens + self.max_tokens
+
+class AdmissionController:
+    """Reserves a request's worst-case cost before it reaches the model.
+
+    The reply is capped so prompt + reply fit the context window, and the cap times the
+    model's multiplier is taken from the balance up front (a billed word is at least
+    one token, so the reply can't cost more). A low balance shortens the cap instead of
+    refusing outright. Reservations live in the database, so the per-user concurrency
+    limit holds across desktops sharing storage; the token rate limit is per process.
+    settle() charges the real reply and hands back the rest.
+    """
+
+    def __init__(self, max_concurrent: int = USER_MAX_CONCURRENT, tokens_per_min: int = USER_TOKENS_PER_MIN):
+        self.max_concurrent = max_concurrent
+        self.rate = TokenBucket(tokens_per_min / 60, tokens_per_min) if tokens_per_min else None
+
+    @staticmethod
+    def prompt_tokens(messages: list[dict]) -> int:
+        return sum(estimate_tokens(str(m.get("content") or "")) + 4 for m in messages)
+
+    @staticmethod
+    def reply_cap(prompt_tokens: int, max_tokens: int | None = None) -> int:
+        room = MODEL_CONTEXT_TOKENS - prompt_tokens
+        return max(REPLY_MIN_TOKENS, min(max_tokens or REPLY_MAX_TOKENS, room))
+
+    def admit(self, dbm, email: str, messages: list[dict], model_key: str,
+              max_tokens: int | None = None) -> Reservation:
+        """Reserve tokens for a reply or raise AdmissionDenied. Blocks on the database."""
+        prompt = self.prompt_tokens(messages)
+        cap = self.reply_cap(prompt, max_tokens)
+        mult = int(MODEL_CONFIG[model_key]["cost_multiplier"])
+        res = Reservation(str(uuid.uuid4()), email, model_key, prompt, cap, cap * mult)
+        if self.rate:
+            wait = self.rate.take(email, res.rate_tokens)
+            if wait:
+                raise AdmissionDenied("rate", f"Rate limit reached; try again in {math.ceil(wait)}s.", retry_after=wait)
+        try:
+            status, balance = dbm.reserve_tokens(res.rid, email, res.amount, self.max_concurrent)
+            if status == "insufficient" and balance // mult >= REPLY_MIN_TOKENS:
+                # Shorten the reply to what the balance covers
+                self._release_rate(res, res.max_tokens - balance // mult)
+                res.max_tokens = balance // mult
+                res.amount = res.max_tokens * mult
+                status, balance = dbm.reserve_tokens(res.rid, email, res.amount, self.max_concurrent)
+        except Exception:
+            self._release_rate(res, res.rate_tokens)
+            raise
+        if status == "ok":
+            return res
+
+        self._release_rate(res, res.rate_tokens)
+        if status == "busy":
+            raise AdmissionDenied("busy", f"{self.max_concurrent} replies are already running; wait for one to finish.",
+                                  retry_after=1.0, balance=balance)
+        raise AdmissionDenied("tokens", f"Not enough tokens (balance {balance}, "
+                                        f"{model_key} needs at least {REPLY_MIN_TOKENS * mult}).", balance=balance)
+
+    def settle(self, dbm, res: Reservation, reply: str) -> int:
+        """Charge the reply actually generated and release the rest; returns the balance."""
+        self._release_rate(res, res.max_tokens - estimate_tokens(reply))
+        return dbm.settle_tokens(res.rid, res.email, reply_cost(reply, res.model_key))
+
+    def _release_rate(self, res: Reservation, n: int) -> None:
+        if self.rate and n > 0:
+            self.rate.give(res.email, n)
+
+# One controller per process so the rate limits see every front end
+admission = AdmissionController()
+
+# =========================
+# HELIX CORE (no Tk)
+# =========================
+
+def heuristic_title(text: str) -> str:
+    t = " ".join(text.strip().split())
+    if not t:
+        return "New Chat"
+    if len(t) <= 42:
+        return t
+    return t[:42].rstrip() + "…"
+
+class CompletionStream:
+    """Text chunks of one streamed completion, in arrival order.
+
+    Iterate it on a worker thread. `text` holds everything received so far and `trace`
+    lets the caller report when a chunk reached the screen. Interactive streams pause
+    background memory extraction while they run.
+
+    A stream billed to `user` is admitted before the request is sent (AdmissionDenied
+    if refused) and settled when it ends, however it ends; `cost` and `balance` are
+    set then.
+    """
+
+    def __init__(self, core: "HelixCore", messages: list[dict], purpose: str, model_key: str,
+                 temperature: float = 0.7, max_tokens: int | None = None, interactive: bool = True,
+                 user: str | None = None):
+        self.core = core
+        self.messages = messages
+        self.model_key = model_key
+        self.model_id = MODEL_CONFIG[model_key]["id"]
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.interactive = interactive
+        self.user = user
+        self.text = ""
+        self.trace = RequestTrace(purpose, self.model_id, messages)
+        self.cancelled = False
+        self.reservation: Reservation | None = None
+        self.cost = 0
+        self.balance: int | None = None
+
+    def cancel(self) -> None:
+        """Stop after the chunk currently being read; safe from any thread."""
+        self.cancelled = True
+
+    def __iter__(self):
+        extractor = self.core.memory_extractor if self.interactive else None
+        if extractor:
+            extractor.interactive_begin()
+        finished = False
+        try:
+            max_tokens = self.max_tokens
+            if self.user:
+                try:
+                    self.reservation = self.core.admission.admit(self.core.db, self.user, self.messages,
+                                                                 self.model_key, max_tokens)
+                except AdmissionDenied as e:
+                    self.balance = e.balance
+                    raise
+                max_tokens = self.reservation.max_tokens
+            extra = {"max_tokens": max_tokens} if max_tokens else {}
+            stream = self.core.ai.chat.completions.create(
+                model=self.model_id,
+                messages=self.messages,
+                temperature=self.temperature,
+                stream=True,
+                **extra,
+            )
+            for chunk in stream:
+                if self.cancelled:
+                    stream.close()
+                    break
+                if not chunk.choices:
+                    continue
+                c = getattr(chunk.choices[0].delta, "content", None)
+                if c:
+                    self.text += c
+                    self.trace.chunk(c)
+                    yield c
+            finished = True
+            self.trace.finish(cancelled=self.cancelled)
+        except GeneratorExit:
+            # The consumer stopped iterating early
+            finished = True
+            stream.close()
+            self.trace.finish(cancelled=True)
+            raise
+        except Exception as e:
+            finished = True
+            self.trace.finish(error=str(e))
+            raise
+        finally:
+            if not finished:
+                self.trace.finish(cancelled=True)
+            if extractor:
+                extractor.interactive_end()
+            if self.reservation:
+                # Whatever arrived is billed, including a reply cut short by an error
+                self.cost = reply_cost(self.text, self.model_key)
+                self.balance = self.core.admission.settle(self.core.db, self.reservation, self.text)
+                self.reservation = None
+
+class HelixCore:
+    """Chat, prompt, notebook, memory and billing logic with no Tk dependency.
+
+    HelixApp renders this state; batch and server front ends can drive it directly.
+    Calls that reach the model or the database block, so run them off any UI thread.
+    """
+
+    def __init__(self, dbm=None, ai=None, admission_control: AdmissionController | None = None):
+        self.db = dbm if dbm is not None else db
+        self.ai = ai if ai is not None else client
+        self.admission = admission_control or admission
+
+        self.current_user: str | None = None
+        self.current_model_key = "Standard"
+        self.saved_chats: dict = {}
+        # Chats changed or deleted since the last take_chat_changes(); only those are written back
+        self.changed_chats: set[str] = set()
+        self.deleted_chats: set[str] = set()
+
+        self.current_note_id: str | None = None
+        self.attach_notebook_to_chat = False
+        self.use_notebook_context = False # Global context toggle
+        self.auto_memories = True # Background memory extraction
+        self.compress_prompts = False # Compress large injected context
+        self.compression_ratio = COMPRESSION_TARGET_RATIO
+
+        self.memory_extractor = MemoryExtractor(self.db, self.ai)
+        self.notebook_chunks = NotebookChunkIndex()
+        self.context_refs: list[dict] = [] # notebook ranges used by the last prompt
+
+    def reset(self) -> None:
+        """Forget everything that belongs to the signed-in user."""
+        self.current_user = None
+        self.saved_chats = {}
+        self.changed_chats = set()
+        self.deleted_chats = set()
+        self.current_note_id = None
+        self.notebook_chunks = NotebookChunkIndex()
+        self.context_refs = []
+
+    def model_id(self, key: str | None = None) -> str:
+        return MODEL_CONFIG[key or self.current_model_key]["id"]
+
+    # ---------- CHATS ----------
+    def set_chats(self, chats: dict | None) -> None:
+        """Adopt chats as loaded from the database, dropping malformed entries."""
+        cleaned = {}
+        for cid, cdata in (chats or {}).items():
+            if not isinstance(cdata, dict):
+                continue
+            title = str(cdata.get("title", "New Chat"))
+            msgs = cdata.get("msgs", [])
+            if not isinstance(msgs, list):
+                msgs = []
+            cleaned[cid] = {"title": title, "msgs": msgs}
+            if isinstance(cdata.get("mem_cursor"), int):
+                cleaned[cid]["mem_cursor"] = cdata["mem_cursor"]
+        self.saved_chats = cleaned
+        self.changed_chats = set()
+        self.deleted_chats = set()
+
+    def take_chat_changes(self) -> tuple[dict, list[str]]:
+        """(changed chats, deleted ids) since the last call, for DatabaseManager.update_chats."""
+        # Copy-then-subtract rather than swap: a reply finishing on another thread may mark a chat meanwhile
+        changed = set(self.changed_chats)
+        self.changed_chats -= changed
+        deleted = set(self.deleted_chats)
+        self.deleted_chats -= deleted
+        # Message dicts are never mutated, so copying the lists is enough for a stable snapshot
+        snapshot = {cid: {**self.saved_chats[cid], "msgs": list(self.saved_chats[cid].get("msgs", []))}
+                    for cid in changed if cid in self.saved_chats}
+        return snapshot, [cid for cid in deleted if cid not in self.saved_chats]
+
+    def new_chat(self) -> str:
+        new_id = str(uuid.uuid4())
+        self.saved_chats[new_id] = {"title": "New Chat", "msgs": []}
+        self.changed_chats.add(new_id)
+        return new_id
+
+    def delete_chat(self, chat_id: str) -> bool:
+        if self.saved_chats.pop(chat_id, None) is None:
+            return False
+        self.deleted_chats.add(chat_id)
+        return True
+
+    def rename_chat(self, chat_id: str, title: str) -> None:
+        if chat_id in self.saved_chats:
+            self.saved_chats[chat_id]["title"] = title
+            self.changed_chats.add(chat_id)
+
+    def branch_chat(self, chat_id: str) -> str | None:
+        src = self.saved_chats.get(chat_id)
+        if src is None:
+            return None
+        new_id = str(uuid.uuid4())
+        self.saved_chats[new_id] = {
+            "title": f"Branch: {src.get('title', 'Chat')}",
+            "msgs": list(src.get("msgs", [])),
+            "mem_cursor": src.get("mem_cursor", 0),
+        }
+        self.changed_chats.add(new_id)
+        return new_id
+
+    def begin_chat_turn(self, chat_id: str, text: str) -> list[dict]:
+        """Record the user's message and return the request for the reply."""
+        self.add_user_message(chat_id, text)
+        return self.chat_request(text)
+
+    def add_user_message(self, chat_id: str, text: str) -> None:
+        self.saved_chats[chat_id]["msgs"].append({"role": "user", "content": text})
+        self.changed_chats.add(chat_id)
+
+    def chat_request(self, text: str) -> list[dict]:
+        """Messages asking for a reply to `text`. Reads memories and notebooks, so it blocks on storage."""
+        return [{"role": "system", "content": self.get_system_prompt("Chat", text)}, {"role": "user", "content": text}]
+
+    def finish_chat_turn(self, chat_id: str, reply: str) -> None:
+        if chat_id in self.saved_chats:
+            self.saved_chats[chat_id]["msgs"].append({"role": "assistant", "content": reply})
+            self.changed_chats.add(chat_id)
+
+    def suggest_title(self, first_prompt: str) -> str:
+        """Short model-written title for a new chat, or a trimmed prompt if that fails."""
+        messages = [
+            {"role": "system", "content": "Create a short chat title (2-5 words). Output ONLY the title."},
+            {"role": "user", "content": first_prompt},
+        ]
+        trace = RequestTrace("title", self.model_id("Standard"), messages)
+        try:
+            resp = self.ai.chat.completions.create(
+                model=self.model_id("Standard"),
+                messages=messages,
+                temperature=0.2,
+                stream=False,
+                max_tokens=24,
+            )
+            title = (resp.choices[0].message.content or "").strip().strip('"')
+            trace.chunk(title)
+            trace.finish()
+        except Exception as e:
+            trace.finish(error=str(e))
+            title = None
+        return title or heuristic_title(first_prompt)
+
+    # ---------- PROMPTS ----------
+    def get_system_prompt(self, key: str, query: str = "") -> str:
+        base = PROMPTS.get(key, "")
+        context = ""
+        self.context_refs = []
+        try:
+            mems = self.db.get_memories(self.current_user)
+            if mems:
+                base += "\nMemories:\n" + "\n".join([m[1] for m in mems])
+        except Exception:
+            pass
+
+        if self.attach_notebook_to_chat and self.current_note_id:
+            try:
+                # Only the parts of the attached canvas that fit the budget and match the question
+                title, chunks = self.notebook_chunks.get(self.current_note_id, self.db)
+                selected = select_chunks([(self.current_note_id, title, c) for c in chunks], query,
+                                         ATTACH_CONTEXT_TOKENS, fallback_leading=True)
+                text, refs = format_chunk_context(selected)
+                if text:
+                    context += f"\nNotebook:\n{text}"
+                    self.context_refs += refs
+            except Exception:
+                pass
+
+        # RAG Implementation
+        if self.use_notebook_context:
+            try:
+                # Keyword retrieval over cached chunks of the most recent notebooks
+                candidates = []
+                for nid, _ in self.db.load_notebooks_list(self.current_user)[:NOTEBOOK_CONTEXT_SCAN]:
+                    if self.attach_notebook_to_chat and nid == self.current_note_id:
+                        continue
+                    title, chunks = self.notebook_chunks.get(nid, self.db)
+                    candidates += [(nid, title, c) for c in chunks]
+                text, refs = format_chunk_context(select_chunks(candidates, query, NOTEBOOK_CONTEXT_TOKENS))
+                if text:
+                    context += "\n\n[Context from Notebooks]:\n" + text
+                    self.context_refs += refs
+            except Exception:
+                pass
+
+        if context and self.compress_prompts and len(context) >= COMPRESSION_MIN_CHARS:
+            context = "\n" + compress_context(context, query, self.compression_ratio)
+
+        return base + context
+
+    @staticmethod
+    def fix_messages(text: str) -> list[dict]:
+        return [{"role": "system", "content": PROMPTS["Fix"]}, {"role": "user", "content": text}]
+
+    @staticmethod
+    def custom_fix_messages(instruction: str, text: str) -> list[dict]:
+        return [{"role": "system", "content": f"Editor. Instruction: {instruction}"}, {"role": "user", "content": text}]
+
+    @staticmethod
+    def notebook_edit_messages(instruction: str, content: str) -> list[dict]:
+        return [{"role": "system", "content": f"Editor. Inst: {instruction}"}, {"role": "user", "content": content}]
+
+    # ---------- COMPLETIONS ----------
+    def stream(self, messages: list[dict], purpose: str, model_key: str | None = None, temperature: float = 0.7,
+               max_tokens: int | None = None, interactive: bool = True, bill: bool = True) -> CompletionStream:
+        """A reply to `messages`, billed to the signed-in user unless bill=False."""
+        return CompletionStream(self, messages, purpose, model_key or self.current_model_key, temperature,
+                                max_tokens, interactive, self.current_user if bill else None)
+
+    def complete(self, messages: list[dict], purpose: str, on_chunk=None, **kwargs) -> str:
+        """Blocking stream; on_chunk(text) runs on the calling thread for every chunk."""
+        stream = self.stream(messages, purpose, **kwargs)
+        for c in stream:
+            if on_chunk:
+                on_chunk(c)
+        return stream.text
+
+    # ---------- TOKENS ----------
+    def reply_cost(self, text: str, model_key: str | None = None) -> int:
+        return reply_cost(text, model_key or self.current_model_key)
+
+    def balance(self) -> int:
+        return self.db.get_token_balance(self.current_user)
+
+    # ---------- MEMORIES ----------
+    def memories(self):
+        return self.db.get_memories(self.current_user)
+
+    def add_memory(self, content: str) -> None:
+        self.db.add_memory(self.current_user, content)
+
+    def delete_memory(self, mid: int) -> bool:
+        return self.db.delete_memory(mid, self.current_user)
+
+    def extract_chat_memories(self, chat_id: str, on_done) -> bool:
+        """Queue the chat's unprocessed turns for extraction.
+
+        on_done(email, end) runs on the extractor thread once the turns up to `end` are
+        processed; pass `end` to mark_memories_extracted. Returns False if nothing was queued.
+        """
+        if not self.auto_memories or not self.current_user or chat_id not in self.saved_chats:
+            return False
+        chat = self.saved_chats[chat_id]
+        msgs = chat.get("msgs", [])
+        end = len(msgs)
+        turns = msgs[chat.get("mem_cursor", 0):end][-MEMORY_BATCH_TURNS:]
+        if not any(m.get("role") == "user" for m in turns):
+            chat["mem_cursor"] = end
+            self.changed_chats.add(chat_id)
+            return False
+        email = self.current_user
+        self.memory_extractor.submit(email, turns, lambda _added: on_done(email, end))
+        return True
+
+    def mark_memories_extracted(self, email: str, chat_id: str, end: int) -> bool:
+        if self.current_user == email and chat_id in self.saved_chats:
+            self.saved_chats[chat_id]["mem_cursor"] = end
+            self.changed_chats.add(chat_id)
+            return True
+        return False
+
+    # ---------- NOTEBOOKS ----------
+    def notebooks(self):
+        return self.db.load_notebooks_list(self.current_user)
+
+    def open_notebook(self, nid: str) -> tuple[str, str]:
+        return self.db.load_notebook_content(nid)
+
+    def save_notebook(self, nid: str | None, title: str, content: str) -> str:
+        nid = nid or str(uuid.uuid4())
+        self.db.save_notebook(nid, self.current_user, title, content)
+        self.notebook_chunks.update(nid, title, content)
+        return nid
+
+# =========================
+# BACKGROUND WORK
+# =========================
+
+class BackgroundService:
+    """Runs blocking calls (bcrypt, SQLite) off the Tk thread and delivers results with after().
+
+    Reads share a small pool; writes go through a single ordered worker so a later save
+    can never land before an earlier one.
+    """
+
+    def __init__(self, root, workers: int = BACKGROUND_WORKERS):
+        self.root = root
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="helix-bg")
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="helix-write")
+
+    def submit(self, fn, *args, on_done=None, on_error=None, ordered: bool = False) -> Future:
+        """Run fn(*args) in the background; on_done(result) / on_error(exc) run on the Tk thread."""
+        fut = (self.writer if ordered else self.pool).submit(fn, *args)
+        fut.add_done_callback(lambda f: self._deliver(f, on_done, on_error))
+        return fut
+
+    def _deliver(self, fut: Future, on_done, on_error) -> None:
+        try:
+            self.root.after(0, self._dispatch, fut, on_done, on_error)
+        except (RuntimeError, tk.TclError):
+            pass # window already destroyed
+
+    def _dispatch(self, fut: Future, on_done, on_error) -> None:
+        if fut.cancelled():
+            return
+        exc = fut.exception()
+        if exc is not None:
+            if on_error is None:
+                raise exc # reported by Tk like any other callback error
+            on_error(exc)
+        elif on_done is not None:
+            on_done(fut.result())
+
+# =========================
+# DIAGNOSTICS
+# =========================
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in milliseconds."""
+
+    BOUNDS = (1, 2, 4, 8, 16, 33, 50, 100, 250, 500, 1000, 2500, float("inf"))
+
+    def __init__(self):
+        self.buckets = [0] * len(self.BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float) -> None:
+        self.buckets[bisect.bisect_left(self.BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (capped at the max seen)."""
+        if not self.count:
+            return 0.0
+        need = p / 100 * self.count
+        seen = 0
+        for bound, n in zip(self.BOUNDS, self.buckets):
+            seen += n
+            if seen >= need:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 2),
+            "total_ms": round(self.total, 1),
+            "buckets": {("inf" if b == float("inf") else f"<={b}"): n for b, n in zip(self.BOUNDS, self.buckets) if n},
+        }
+
+def _callback_name(func) -> str:
+    """Readable name for a Tk callback, looking through tkinter's after() wrapper."""
+    code = getattr(func, "__code__", None)
+    if code is not None and code.co_name == "callit" and func.__closure__:
+        # Misc.after wraps the real callback in a closure named callit
+        cells = dict(zip(code.co_freevars, func.__closure__))
+        if "func" in cells:
+            return _callback_name(cells["func"].cell_contents)
+    target = getattr(func, "__func__", func)
+    name = getattr(target, "__qualname__", None) or type(target).__name__
+    code = getattr(target, "__code__", None)
+    if code is not None and "<lambda>" in name:
+        name += f" ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name
+
+class StallMonitor:
+    """Measures how long the Tk event loop is blocked and by which callbacks.
+
+    A heartbeat scheduled with after() records how late it fires; a watchdog thread
+    notices when the heartbeat stops and captures the main thread's stack while it is
+    still stuck. Every Tk callback is timed per name by wrapping tk.CallWrapper.
+    """
+
+    MAX_STALLS = 50
+
+    def __init__(self, root, heartbeat_ms: int = HEARTBEAT_MS, threshold_ms: int = STALL_THRESHOLD_MS):
+        self.root = root
+        self.heartbeat_ms = heartbeat_ms
+        self.threshold_ms = threshold_ms
+        self.main_ident = threading.get_ident()
+        self.started_at = time.time()
+        self.loop_lag = LatencyHistogram()
+        self.callbacks: dict[str, LatencyHistogram] = {}
+        self.stalls: deque = deque(maxlen=self.MAX_STALLS)
+        self.current: str | None = None # callback running on the main thread, if any
+        self.last_beat = time.perf_counter()
+        self._open_stall: dict | None = None
+        self._running = False
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._install_callback_timer()
+        self.last_beat = time.perf_counter()
+        self.root.after(self.heartbeat_ms, self._beat, self.last_beat + self.heartbeat_ms / 1000)
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self) -> None:
+        self._running = False
+
+    def reset(self) -> None:
+        self.loop_lag = LatencyHistogram()
+        self.callbacks = {}
+        self.stalls.clear()
+
+    def _install_callback_timer(self) -> None:
+        if getattr(tk.CallWrapper, "_helix_orig_call", None):
+            tk.CallWrapper._helix_monitor = self
+            return
+        orig = tk.CallWrapper.__call__
+
+        def timed_call(wrapper, *args):
+            mon = tk.CallWrapper._helix_monitor
+            if mon is None or not mon._running:
+                return orig(wrapper, *args)
+            name = _callback_name(wrapper.func)
+            outer = mon.current
+            mon.current = name
+            t0 = time.perf_counter()
+            try:
+                return orig(wrapper, *args)
+            finally:
+                ms = (time.perf_counter() - t0) * 1000
+                mon.current = outer
+                hist = mon.callbacks.get(name)
+                if hist is None:
+                    hist = mon.callbacks[name] = LatencyHistogram()
+                hist.add(ms)
+
+        tk.CallWrapper._helix_orig_call = orig
+        tk.CallWrapper._helix_monitor = self
+        tk.CallWrapper.__call__ = timed_call
+
+    def _beat(self, expected: float) -> None:
+        now = time.perf_counter()
+        lag = max(0.0, (now - expected) * 1000)
+        self.loop_lag.add(lag)
+        stall = self._open_stall
+        if stall is not None:
+            stall["ms"] = round(lag + self.heartbeat_ms, 1)
+            self._open_stall = None
+        self.last_beat = now
+        if self._running:
+            try:
+                self.root.after(self.heartbeat_ms, self._beat, now + self.heartbeat_ms / 1000)
+            except tk.TclError:
+                pass
+
+    def _watch(self) -> None:
+        limit = (self.heartbeat_ms + self.threshold_ms) / 1000
+        while self._running:
+            time.sleep(self.threshold_ms / 2000)
+            last = self.last_beat
+            if self._open_stall is None and time.perf_counter() - last > limit:
+                frame = sys._current_frames().get(self.main_ident)
+                stack = traceback.format_stack(frame)[-25:] if frame is not None else []
+                stall = {
+                    "at": datetime.now().isoformat(timespec="seconds"),
+                    "callback": self.current or "(tk internal)",
+                    "ms": None, # filled in when the heartbeat resumes
+                    "stack": [line.rstrip() for line in stack],
+                }
+                self._open_stall = stall
+                self.stalls.append(stall)
+
+    def top_callbacks(self, n: int = 15, key: str = "total") -> list[tuple[str, LatencyHistogram]]:
+        items = list(self.callbacks.items())
+        items.sort(key=lambda kv: getattr(kv[1], key), reverse=True)
+        return items[:n]
+
+    def snapshot(self, extra: dict | None = None) -> dict:
+        data = {
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "heartbeat_ms": self.heartbeat_ms,
+            "stall_threshold_ms": self.threshold_ms,
+            "loop_lag": self.loop_lag.to_dict(),
+            "stalls": list(self.stalls),
+            "callbacks": {name: h.to_dict() for name, h in self.top_callbacks(len(self.callbacks))},
+        }
+        if extra:
+            data.update(extra)
+        return data
+
+    def dump(self, path: str, extra: dict | None = None) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(extra), f, indent=2)
+        return path
 
 # =========================
 # FLOATING WIDGET
@@ -434,8 +2873,7 @@ class FloatingWidget(ctk.CTkToplevel):
         self.attributes("-transparentcolor", "#000001")
 
         try:
-            logo = Image.open(asset_path(LOGO_FILENAME))
-            self.logo_image = ctk.CTkImage(light_image=make_circle(logo), size=(60, 60))
+            self.logo_image = ASSETS.logo(60, circle=True, scale=self._get_widget_scaling())
             self.btn = ctk.CTkButton(
                 self,
                 text="",
@@ -561,8 +2999,11 @@ class CanvasDraftingOverlay(ctk.CTkFrame):
         self.close()
 
     def close(self):
-        self.app.animate_overlay_close(self)
-        self.app.canvas_overlay = None
+        self.app.animate_overlay_close(self, self._closed)
+
+    def _closed(self):
+        if self.app.canvas_overlay is self:
+            self.app.canvas_overlay = None
 
 # =========================
 # SETTINGS OVERLAY (ANIMATED)
@@ -575,6 +3016,7 @@ class SettingsOverlay(ctk.CTkFrame):
         self.db = dbm
         self.current_user = current_user
         self.on_logout = on_logout
+        self.page_token = 0 # bumped on every page switch so stale loads are dropped
 
         # Grid layout
         self.grid_columnconfigure(0, weight=0) # sidebar
@@ -598,6 +3040,8 @@ class SettingsOverlay(ctk.CTkFrame):
         self.create_nav_btn("Context", "Context")
         self.create_nav_btn("Personalization", "Personalization")
         self.create_nav_btn("General", "General")
+        self.create_nav_btn("Performance", "Performance")
+        self.create_nav_btn("Diagnostics", "Diagnostics")
 
         ctk.CTkFrame(self.sidebar, height=1, fg_color=BG_CARD).pack(fill="x", pady=20, padx=30)
 
@@ -655,9 +3099,24 @@ class SettingsOverlay(ctk.CTkFrame):
 
     def close(self):
         # Slide down animation
-        self.app.animate_overlay_close(self)
+        self.app.animate_overlay_close(self, self._closed)
+
+    def _closed(self):
+        if self.app.settings_overlay is self:
+            self.app.settings_overlay = None
+
+    def load_async(self, fn, *args, on_done):
+        """Run a db call in the background; on_done gets the result if this page is still shown."""
+        token = self.page_token
+
+        def deliver(result):
+            if token == self.page_token and self.winfo_exists():
+                on_done(result)
+
+        self.app.bg.submit(fn, *args, on_done=deliver)
 
     def switch_page(self, page):
+        self.page_token += 1
         # Update styling
         for p, b in self.nav_btns.items():
             b.configure(fg_color=BG_CARD if p == page else "transparent")
@@ -677,33 +3136,54 @@ class SettingsOverlay(ctk.CTkFrame):
             self.build_personalization_page()
         elif page == "General":
             self.build_general_page()
+        elif page == "Performance":
+            self.build_performance_page()
+        elif page == "Diagnostics":
+            self.build_diagnostics_page()
 
     def build_profile_page(self):
-        # Fetch data
-        dname, bio, color = self.db.get_profile(self.current_user)
-
         ctk.CTkLabel(self.content, text="Public Profile (Saved Locally)", font=FONT_NORMAL, text_color=TEXT_GRAY).pack(anchor="w", pady=(0, 20))
 
         # Display Name
         ctk.CTkLabel(self.content, text="Display Name", font=FONT_BOLD).pack(anchor="w", pady=(10, 5))
         self.entry_dname = ctk.CTkEntry(self.content, width=300, height=40, font=FONT_NORMAL, fg_color=BG_INPUT, border_width=0, corner_radius=10)
         self.entry_dname.pack(anchor="w")
-        self.entry_dname.insert(0, dname)
 
         # Bio
         ctk.CTkLabel(self.content, text="Bio", font=FONT_BOLD).pack(anchor="w", pady=(20, 5))
         self.entry_bio = ctk.CTkTextbox(self.content, width=400, height=100, font=FONT_NORMAL, fg_color=BG_INPUT, border_width=0, corner_radius=10)
         self.entry_bio.pack(anchor="w")
-        self.entry_bio.insert("0.0", bio)
 
-        # Save
-        ctk.CTkButton(self.content, text="Save Changes", fg_color=HELIX_PURPLE, text_color="black", width=150, height=40, corner_radius=20, command=self.save_profile).pack(anchor="w", pady=30)
+        # Save (enabled once the profile has loaded)
+        self.btn_save_profile = ctk.CTkButton(self.content, text="Loading…", fg_color=HELIX_PURPLE, text_color="black", width=150, height=40,
+                                              corner_radius=20, state="disabled", command=self.save_profile)
+        self.btn_save_profile.pack(anchor="w", pady=30)
+
+        def fill(profile):
+            dname, bio, _color = profile
+            self.entry_dname.insert(0, dname)
+            self.entry_bio.insert("0.0", bio)
+            self.btn_save_profile.configure(text="Save Changes", state="normal")
+
+        self.load_async(self.db.get_profile, self.current_user, on_done=fill)
 
     def save_profile(self):
         dn = self.entry_dname.get().strip()
         bio = self.entry_bio.get("0.0", "end").strip()
-        self.db.save_profile(self.current_user, dn, bio)
-        messagebox.showinfo("Success", "Profile updated!")
+        btn = self.btn_save_profile
+        btn.configure(text="Saving…", state="disabled")
+
+        def done(_):
+            if btn.winfo_exists():
+                btn.configure(text="Save Changes", state="normal")
+            messagebox.showinfo("Success", "Profile updated!")
+
+        def failed(e):
+            if btn.winfo_exists():
+                btn.configure(text="Save Changes", state="normal")
+            messagebox.showerror("Error", f"Could not save profile: {e}")
+
+        self.app.bg.submit(self.db.save_profile, self.current_user, dn, bio, on_done=done, on_error=failed, ordered=True)
 
     def build_context_page(self):
         ctk.CTkLabel(self.content, text="Notebook Context (RAG)", font=FONT_SUBHEADER).pack(anchor="w", pady=(10, 10))
@@ -716,22 +3196,49 @@ class SettingsOverlay(ctk.CTkFrame):
 
         ctk.CTkSwitch(self.content, text="Enable Notebook Context", variable=self.var_context_active, command=toggle_ctx, progress_color=HELIX_PURPLE).pack(anchor="w", pady=10)
 
+        # Compression of large attached / retrieved context
+        self.var_compress = ctk.BooleanVar(value=self.app.compress_prompts)
+
+        def toggle_compress():
+            self.app.compress_prompts = self.var_compress.get()
+
+        ctk.CTkSwitch(self.content, text="Compress large context", variable=self.var_compress, command=toggle_compress, progress_color=HELIX_PURPLE).pack(anchor="w", pady=10)
+
+        ratio_row = ctk.CTkFrame(self.content, fg_color="transparent")
+        ratio_row.pack(anchor="w", fill="x")
+        lbl_ratio = ctk.CTkLabel(ratio_row, text=f"Keep {int(self.app.compression_ratio * 100)}%", text_color=TEXT_GRAY, width=90, anchor="w")
+
+        def set_ratio(v):
+            self.app.compression_ratio = round(float(v), 2)
+            lbl_ratio.configure(text=f"Keep {int(self.app.compression_ratio * 100)}%")
+
+        slider = ctk.CTkSlider(ratio_row, from_=0.2, to=0.9, number_of_steps=14, width=250, command=set_ratio, progress_color=HELIX_PURPLE, button_color=HELIX_PURPLE)
+        slider.set(self.app.compression_ratio)
+        slider.pack(side="left")
+        lbl_ratio.pack(side="left", padx=10)
+
         ctk.CTkLabel(self.content, text="Available Notebooks:", font=FONT_BOLD).pack(anchor="w", pady=(20, 10))
 
         # List of notebooks
         scroll = ctk.CTkScrollableFrame(self.content, fg_color="transparent", height=300)
         scroll.pack(fill="both", expand=True)
 
-        notebooks = self.db.load_notebooks_list(self.current_user)
-        if not notebooks:
-            ctk.CTkLabel(scroll, text="No notebooks found.", text_color="gray").pack(pady=20)
+        loading = ctk.CTkLabel(scroll, text="Loading…", text_color="gray")
+        loading.pack(pady=20)
 
-        for nid, title in notebooks:
-            # For now, all are included if enabled. Later: individual selection.
-            row = ctk.CTkFrame(scroll, fg_color=BG_CARD)
-            row.pack(fill="x", pady=2)
-            ctk.CTkLabel(row, text="📓 " + (title or "Untitled"), anchor="w").pack(side="left", padx=10, pady=5)
-            ctk.CTkLabel(row, text="Active", text_color="#555", font=FONT_SMALL).pack(side="right", padx=10)
+        def fill(notebooks):
+            if not notebooks:
+                loading.configure(text="No notebooks found.")
+                return
+            loading.destroy()
+            for nid, title in notebooks:
+                # For now, all are included if enabled. Later: individual selection.
+                row = ctk.CTkFrame(scroll, fg_color=BG_CARD)
+                row.pack(fill="x", pady=2)
+                ctk.CTkLabel(row, text="📓 " + (title or "Untitled"), anchor="w").pack(side="left", padx=10, pady=5)
+                ctk.CTkLabel(row, text="Active", text_color="#555", font=FONT_SMALL).pack(side="right", padx=10)
+
+        self.load_async(self.db.load_notebooks_list, self.current_user, on_done=fill)
 
     def build_personalization_page(self):
         ctk.CTkLabel(self.content, text="Memories (Max 65)", font=FONT_SUBHEADER).pack(anchor="w", pady=(10, 10))
@@ -745,31 +3252,45 @@ class SettingsOverlay(ctk.CTkFrame):
 
         ctk.CTkButton(add_row, text="Add", width=80, height=45, fg_color=HELIX_PURPLE, text_color="black", corner_radius=22, command=self.add_mem).pack(side="right")
 
+        self.var_auto_mem = ctk.BooleanVar(value=self.app.auto_memories)
+
+        def toggle_auto_mem():
+            self.app.auto_memories = self.var_auto_mem.get()
+
+        ctk.CTkSwitch(self.content, text="Learn memories from my chats", variable=self.var_auto_mem, command=toggle_auto_mem, progress_color=HELIX_PURPLE).pack(anchor="w", pady=(0, 10))
+
         # List
         self.mem_scroll = ctk.CTkScrollableFrame(self.content, fg_color="transparent", height=400)
         self.mem_scroll.pack(fill="both", expand=True)
         self.refresh_memories()
 
     def refresh_memories(self):
-        for w in self.mem_scroll.winfo_children(): w.destroy()
-        mems = self.db.get_memories(self.current_user)
+        if not self.mem_scroll.winfo_children():
+            ctk.CTkLabel(self.mem_scroll, text="Loading…", text_color="gray").pack(pady=20)
 
-        for m_id, content in mems:
-            row = ctk.CTkFrame(self.mem_scroll, fg_color=BG_CARD, corner_radius=15)
-            row.pack(fill="x", pady=5)
-            ctk.CTkLabel(row, text=content, anchor="w", text_color="white", wraplength=500).pack(side="left", padx=15, pady=10)
-            ctk.CTkButton(row, text="Delete", width=60, height=30, fg_color="#333", hover_color="#550000", corner_radius=15, command=lambda x=m_id: self.del_mem(x)).pack(side="right", padx=10)
+        def fill(mems):
+            for w in self.mem_scroll.winfo_children(): w.destroy()
+            for m_id, content in mems:
+                row = ctk.CTkFrame(self.mem_scroll, fg_color=BG_CARD, corner_radius=15)
+                row.pack(fill="x", pady=5)
+                ctk.CTkLabel(row, text=content, anchor="w", text_color="white", wraplength=500).pack(side="left", padx=15, pady=10)
+                ctk.CTkButton(row, text="Delete", width=60, height=30, fg_color="#333", hover_color="#550000", corner_radius=15, command=lambda x=m_id: self.del_mem(x)).pack(side="right", padx=10)
+
+        self.load_async(self.db.get_memories, self.current_user, on_done=fill)
 
     def add_mem(self):
         txt = self.mem_entry.get().strip()
         if not txt: return
-        self.db.add_memory(self.current_user, txt)
         self.mem_entry.delete(0, "end")
-        self.refresh_memories()
+        self.app.bg.submit(self.db.add_memory, self.current_user, txt, on_done=self._memories_changed, ordered=True)
 
     def del_mem(self, mid):
-        self.db.delete_memory(mid)
-        self.refresh_memories()
+        self.app.bg.submit(self.db.delete_memory, mid, self.current_user, on_done=self._memories_changed, ordered=True)
+
+    def _memories_changed(self, _):
+        # Re-read only after the write has landed, and only if the list is still shown
+        if self.winfo_exists() and self.mem_scroll.winfo_exists():
+            self.refresh_memories()
 
     def build_general_page(self):
         ctk.CTkLabel(self.content, text="Appearance", font=FONT_SUBHEADER).pack(anchor="w", pady=(10, 20))
@@ -789,10 +3310,811 @@ class SettingsOverlay(ctk.CTkFrame):
         seg = ctk.CTkSegmentedButton(row, values=["Dark", "Light"], variable=self.theme_var, command=lambda x: toggle_theme())
         seg.pack(side="right", padx=20)
 
+    def build_performance_page(self):
+        ctk.CTkLabel(self.content, text="Telemetry", font=FONT_SUBHEADER).pack(anchor="w", pady=(10, 10))
+        ctk.CTkLabel(self.content, text=f"Request, database and UI timings are kept in memory and logged to {TELEMETRY_FILE}.",
+                     text_color=TEXT_GRAY).pack(anchor="w", pady=(0, 10))
+
+        self.var_telemetry = ctk.BooleanVar(value=TELEMETRY.enabled)
+
+        def toggle():
+            TELEMETRY.set_enabled(self.var_telemetry.get())
+
+        ctk.CTkSwitch(self.content, text="Record performance telemetry", variable=self.var_telemetry, command=toggle,
+                      progress_color=HELIX_PURPLE).pack(anchor="w", pady=10)
+
+        btn_row = ctk.CTkFrame(self.content, fg_color="transparent")
+        btn_row.pack(anchor="w", pady=10)
+        ctk.CTkButton(btn_row, text="Refresh", width=100, height=35, corner_radius=17, fg_color=BG_CARD, hover_color=BG_INPUT,
+                      command=lambda: self.switch_page("Performance")).pack(side="left", padx=(0, 10))
+
+        def clear():
+            TELEMETRY.clear()
+            self.switch_page("Performance")
+
+        ctk.CTkButton(btn_row, text="Clear", width=80, height=35, corner_radius=17, fg_color=BG_CARD, hover_color=BG_INPUT,
+                      command=clear).pack(side="left")
+
+        counters = dict(TELEMETRY.counters)
+        if counters:
+            text = "   ".join(f"{k.removeprefix('request.')}: {v}" for k, v in sorted(counters.items()))
+            ctk.CTkLabel(self.content, text=text, text_color=TEXT_GRAY, font=FONT_SMALL, wraplength=700, justify="left").pack(anchor="w", pady=(0, 10))
+
+        scroll = ctk.CTkScrollableFrame(self.content, fg_color="transparent", height=420)
+        scroll.pack(fill="both", expand=True)
+
+        rows = TELEMETRY.summary()
+        if not rows:
+            ctk.CTkLabel(scroll, text="No samples yet." if TELEMETRY.enabled else "Telemetry is off.", text_color="gray").pack(pady=20)
+        for metric, n, p50, p95, p99 in rows:
+            row = ctk.CTkFrame(scroll, fg_color=BG_CARD, corner_radius=10)
+            row.pack(fill="x", pady=2)
+            ctk.CTkLabel(row, text=metric, anchor="w", font=FONT_SMALL).pack(side="left", padx=10, pady=4)
+            ctk.CTkLabel(row, text=f"n={n}   p50 {p50:.1f}   p95 {p95:.1f}   p99 {p99:.1f}",
+                         text_color=TEXT_GRAY, font=FONT_SMALL).pack(side="right", padx=10)
+
+    def build_diagnostics_page(self):
+        mon = self.app.stall_monitor
+        lag = mon.loop_lag
+        times = self.app.startup_times
+
+        ctk.CTkLabel(self.content, text="Event Loop", font=FONT_SUBHEADER).pack(anchor="w", pady=(10, 10))
+        summary = (
+            f"Heartbeat lag  p50 {lag.percentile(50):.0f} ms · p95 {lag.percentile(95):.0f} ms · "
+            f"p99 {lag.percentile(99):.0f} ms · max {lag.max:.0f} ms\n"
+            f"Stalls over {mon.threshold_ms} ms: {len(mon.stalls)}"
+        )
+        if times:
+            summary += f"\nStartup: first frame {times.get('first_frame_ms', 0):.0f} ms, interactive {times.get('interactive_ms', 0):.0f} ms"
+        ctk.CTkLabel(self.content, text=summary, text_color=TEXT_GRAY, justify="left").pack(anchor="w")
+
+        btn_row = ctk.CTkFrame(self.content, fg_color="transparent")
+        btn_row.pack(anchor="w", pady=15)
+        ctk.CTkButton(btn_row, text="Refresh", width=100, height=35, corner_radius=17, fg_color=BG_CARD, hover_color=BG_INPUT,
+                      command=lambda: self.switch_page("Diagnostics")).pack(side="left", padx=(0, 10))
+        ctk.CTkButton(btn_row, text="Save to File", width=120, height=35, corner_radius=17, fg_color=HELIX_PURPLE, text_color="black",
+                      command=self.dump_diagnostics).pack(side="left", padx=(0, 10))
+
+        def reset():
+            mon.reset()
+            self.switch_page("Diagnostics")
+
+        ctk.CTkButton(btn_row, text="Reset", width=80, height=35, corner_radius=17, fg_color=BG_CARD, hover_color=BG_INPUT,
+                      command=reset).pack(side="left")
+
+        scroll = ctk.CTkScrollableFrame(self.content, fg_color="transparent", height=400)
+        scroll.pack(fill="both", expand=True)
+
+        ctk.CTkLabel(scroll, text="Slowest Callbacks (by total time)", font=FONT_BOLD).pack(anchor="w", pady=(0, 5))
+        for name, h in mon.top_callbacks():
+            row = ctk.CTkFrame(scroll, fg_color=BG_CARD, corner_radius=10)
+            row.pack(fill="x", pady=2)
+            ctk.CTkLabel(row, text=name, anchor="w", font=FONT_SMALL).pack(side="left", padx=10, pady=4)
+            ctk.CTkLabel(row, text=f"{h.count}×  p95 {h.percentile(95):.0f} ms  max {h.max:.0f} ms  total {h.total:.0f} ms",
+                         text_color=TEXT_GRAY, font=FONT_SMALL).pack(side="right", padx=10)
+
+        ctk.CTkLabel(scroll, text="Recent Stalls", font=FONT_BOLD).pack(anchor="w", pady=(20, 5))
+        if not mon.stalls:
+            ctk.CTkLabel(scroll, text="No stalls recorded.", text_color="gray").pack(anchor="w")
+        for stall in reversed(mon.stalls):
+            dur = f"{stall['ms']:.0f} ms" if stall["ms"] is not None else "ongoing"
+            text = f"{stall['at']}  {dur}  in {stall['callback']}\n" + "\n".join(stall["stack"][-4:])
+            ctk.CTkLabel(scroll, text=text, anchor="w", justify="left", font=FONT_CODE, text_color=TEXT_GRAY,
+                         wraplength=700).pack(anchor="w", pady=4)
+
+    def dump_diagnostics(self):
+        try:
+            path = self.app.stall_monitor.dump(data_path(DIAGNOSTICS_FILE), {"startup": self.app.startup_times})
+            messagebox.showinfo("Diagnostics", f"Saved to {path}")
+        except Exception as e:
+            messagebox.showerror("Diagnostics", f"Could not save: {e}")
+
+# =========================
+# ANIMATION
+# =========================
+
+def ease_out_cubic(t: float) -> float:
+    return 1 - (1 - t) ** 3
+
+class Animator:
+    """Single frame clock for all UI transitions.
+
+    Animations are keyed (usually by widget). Starting another one on the same key
+    replaces it, by default continuing from the current value, so repeated clicks
+    retarget instead of stacking competing after() chains. Progress is computed from
+    elapsed time: when the event loop is busy a frame is skipped, not queued.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.anims: dict = {}
+        self.job = None
+
+    def animate(self, key, start: float, end: float, duration_ms: int, apply, on_done=None,
+                easing=ease_out_cubic, retarget: bool = True) -> None:
+        current = self.anims.get(key)
+        if current is not None and retarget:
+            start = current["value"]
+        self.anims[key] = {
+            "start": start,
+            "end": end,
+            "value": start,
+            "t0": time.perf_counter(),
+            "duration": max(1, duration_ms) / 1000,
+            "apply": apply,
+            "on_done": on_done,
+            "easing": easing,
+        }
+        if self.job is None:
+            self.job = self.root.after(0, self._tick)
+
+    def cancel(self, key, finish: bool = False) -> None:
+        anim = self.anims.pop(key, None)
+        if anim and finish:
+            self._finish(anim)
+
+    def is_running(self, key) -> bool:
+        return key in self.anims
+
+    def _finish(self, anim: dict) -> None:
+        try:
+            anim["apply"](anim["end"])
+        except tk.TclError:
+            return
+        if anim["on_done"]:
+            anim["on_done"]()
+
+    def _tick(self) -> None:
+        self.job = None
+        now = time.perf_counter()
+        for key, anim in list(self.anims.items()):
+            t = min(1.0, (now - anim["t0"]) / anim["duration"])
+            if t >= 1.0:
+                del self.anims[key]
+                self._finish(anim)
+                continue
+            anim["value"] = anim["start"] + (anim["end"] - anim["start"]) * anim["easing"](t)
+            try:
+                anim["apply"](anim["value"])
+            except tk.TclError:
+                # Widget destroyed mid-flight
+                self.anims.pop(key, None)
+        if self.anims:
+            self.job = self.root.after(ANIM_FRAME_MS, self._tick)
+
+# =========================
+# TEXT LAYOUT
+# =========================
+
+TEXT_PAD_PX = 12        # inner padding CTkTextbox adds around the tk.Text content
+REFLOW_DEBOUNCE_MS = 80 # resize settle time before visible bubbles are re-wrapped
+
+class WrapState:
+    """Greedy word-wrap state for text that only grows at the end (streaming).
+
+    Mirrors tk.Text wrap="word": a word moves to the next line when it does not fit,
+    and words wider than a line are broken across lines.
+    """
+
+    def __init__(self, layout: "TextLayout", width: int, font: tkfont.Font):
+        self.layout = layout
+        self.width = max(1, width)
+        self.font = font
+        self.lines = 1
+        self.x = 0
+        self.word = ""
+
+    def feed(self, text: str) -> None:
+        for part in re.split(r"(\s)", text):
+            if not part:
+                continue
+            if part == "\n":
+                self._commit()
+                self.lines += 1
+                self.x = 0
+            elif part.isspace():
+                self._commit()
+                self.x += self.layout.measure(part, self.font)
+            else:
+                self.word += part
+
+    def _commit(self) -> None:
+        if self.word:
+            self.lines, self.x = self._place(self.lines, self.x, self.layout.measure(self.word, self.font))
+            self.word = ""
+
+    def _place(self, lines: int, x: int, w: int) -> tuple[int, int]:
+        if x > 0 and x + w > self.width:
+            lines += 1
+            x = 0
+        if w > self.width:
+            lines += w // self.width
+            return lines, w % self.width
+        return lines, x + w
+
+    def line_count(self) -> int:
+        if not self.word:
+            return self.lines
+        return self._place(self.lines, self.x, self.layout.measure(self.word, self.font))[0]
+
+    def copy(self) -> "WrapState":
+        other = WrapState(self.layout, self.width, self.font)
+        other.lines, other.x, other.word = self.lines, self.x, self.word
+        return other
+
+class TextLayout:
+    """Wrapped text height from real font metrics.
+
+    Line counts are cached per paragraph under (text hash, width, font), so re-measuring
+    a message after an edit or a resize only wraps the paragraphs that are new.
+    """
+
+    def __init__(self, max_entries: int = 8192):
+        self.max_entries = max_entries
+        self.fonts: dict[tuple, tkfont.Font] = {}
+        self.lines: OrderedDict = OrderedDict()
+        self.words: dict[tuple, int] = {}
+
+    def font(self, spec: tuple, scaling: float = 1.0) -> tkfont.Font:
+        """Tk font matching what CTk renders for a (family, size[, style]) spec."""
+        key = (spec, round(scaling, 3))
+        f = self.fonts.get(key)
+        if f is None:
+            style = spec[2] if len(spec) > 2 else ""
+            # CTk scales font sizes and passes them as negative (pixel) sizes.
+            f = tkfont.Font(
+                family=spec[0],
+                size=-abs(round(spec[1] * scaling)),
+                weight="bold" if "bold" in style else "normal",
+                slant="italic" if "italic" in style else "roman",
+            )
+            self.fonts[key] = f
+        return f
+
+    def measure(self, word: str, font: tkfont.Font) -> int:
+        key = (str(font), word)
+        w = self.words.get(key)
+        if w is None:
+            if len(self.words) > self.max_entries * 4:
+                self.words.clear()
+            w = font.measure(word)
+            self.words[key] = w
+        return w
+
+    def paragraph_lines(self, para: str, width: int, font: tkfont.Font) -> int:
+        key = (hash(para), len(para), width, str(font))
+        n = self.lines.get(key)
+        if n is not None:
+            self.lines.move_to_end(key)
+            return n
+        state = WrapState(self, width, font)
+        state.feed(para)
+        n = state.line_count()
+        self.lines[key] = n
+        if len(self.lines) > self.max_entries:
+            self.lines.popitem(last=False)
+        return n
+
+    def line_count(self, text: str, width: int, font: tkfont.Font) -> int:
+        return sum(self.paragraph_lines(p, width, font) for p in text.split("\n"))
+
+    def text_height(self, text: str, width: int, font: tkfont.Font) -> int:
+        return self.line_count(text, width, font) * font.metrics("linespace") + TEXT_PAD_PX
+
+    def wrap_state(self, text: str, width: int, font: tkfont.Font) -> WrapState:
+        """WrapState positioned at the end of text, reusing cached counts for closed paragraphs."""
+        head, _, tail = text.rpartition("\n")
+        state = WrapState(self, width, font)
+        if _:
+            state.lines = self.line_count(head, width, font) + 1
+        state.feed(tail)
+        return state
+
+    def natural_width(self, text: str, font: tkfont.Font) -> int:
+        return max((font.measure(p) for p in text.split("\n")), default=0)
+
+TEXT_LAYOUT = TextLayout()
+
+# =========================
+# MARKDOWN (streaming)
+# =========================
+
+_MD_HEADING_RE = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_MD_LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_MD_QUOTE_RE = re.compile(r"^\s*>\s?(.*)$")
+_MD_RULE_RE = re.compile(r"^\s*([-*_])(?:\s*\1){2,}\s*$")
+_MD_INLINE_RE = re.compile(
+    r"(`[^`]+`)|(\*\*[^*]+\*\*|__[^_]+__)|(\*[^*\s][^*]*\*|_[^_\s][^_]*_)|(\[[^\]]+\]\([^)\s]+\))"
+)
+
+_CODE_KEYWORDS = frozenset(
+    "False None True and as assert async await break case catch class const continue def del elif else "
+    "enum except export extends final finally fn for from func function go if impl import in interface "
+    "is lambda let match mut new nil nonlocal not null or package pass private protected pub public raise "
+    "return self static struct super switch this throw try type typeof use var void while with yield".split()
+)
+_CODE_TOKEN_RE = re.compile(
+    r"(?P<com>#.*$|//.*$|--\s.*$)|(?P<str>\"(?:\\.|[^\"\\])*\"?|'(?:\\.|[^'\\])*'?)"
+    r"|(?P<num>\b\d+(?:\.\d+)?\b)|(?P<word>\b[A-Za-z_]\w*\b)"
+)
+_HASH_COMMENT_LANGS = {"", "python", "py", "sh", "bash", "shell", "zsh", "ruby", "rb", "yaml", "yml", "toml", "r", "perl"}
+_SLASH_COMMENT_LANGS = {"", "js", "javascript", "ts", "typescript", "java", "c", "cpp", "c++", "cs", "csharp",
+                        "go", "rust", "rs", "kotlin", "swift", "php", "dart", "scala"}
+
+@functools.lru_cache(maxsize=4096)
+def highlight_code_line(line: str, lang: str) -> tuple[tuple[int, int, str], ...]:
+    """(start, end, tag) syntax spans for one line of fenced code; cached per (line, lang)."""
+    spans = []
+    for m in _CODE_TOKEN_RE.finditer(line):
+        kind = m.lastgroup
+        text = m.group()
+        if kind == "com":
+            if text.startswith("#") and lang not in _HASH_COMMENT_LANGS:
+                continue
+            if text.startswith("//") and lang not in _SLASH_COMMENT_LANGS:
+                continue
+            if text.startswith("--") and lang not in ("sql", "lua", "haskell", "hs"):
+                continue
+            spans.append((m.start(), len(line), "md_com"))
+            break
+        if kind == "word":
+            if text in _CODE_KEYWORDS:
+                spans.append((m.start(), m.end(), "md_kw"))
+        else:
+            spans.append((m.start(), m.end(), "md_" + kind))
+    return tuple(spans)
+
+def markdown_inline(text: str, base: tuple = ()) -> list[tuple[str, tuple]]:
+    """Split a line into (text, tags) segments for inline code, bold, italic and links."""
+    segs = []
+    pos = 0
+    for m in _MD_INLINE_RE.finditer(text):
+        if m.start() > pos:
+            segs.append((text[pos:m.start()], base))
+        tok = m.group()
+        if m.group(1):
+            segs.append((tok[1:-1], base + ("md_inline_code",)))
+        elif m.group(2):
+            segs.append((tok[2:-2], base + ("md_bold",)))
+        elif m.group(3):
+            segs.append((tok[1:-1], base + ("md_italic",)))
+        else:
+            segs.append((tok[1:tok.index("](")], base + ("md_link",)))
+        pos = m.end()
+    if pos < len(text):
+        segs.append((text[pos:], base))
+    return segs
+
+class MarkdownStream:
+    """Renders streamed markdown into a tk.Text with tags, touching only new text.
+
+    Complete lines are final: each is parsed once and inserted with its tags. The
+    unfinished last line (the only unstable part) is shown raw and re-rendered when its
+    newline arrives, so total work stays linear in the length of the answer.
+    """
+
+    def __init__(self, text_widget: tk.Text, scaling: float = 1.0):
+        self.w = text_widget
+        self._configure_tags(scaling)
+        self.reset()
+
+    def _configure_tags(self, scaling: float) -> None:
+        font = lambda spec: TEXT_LAYOUT.font(spec, scaling)
+        w = self.w
+        w.tag_configure("md_h1", font=font(("Google Sans", 20, "bold")), spacing1=int(8 * scaling), spacing3=int(4 * scaling))
+        w.tag_configure("md_h2", font=font(("Google Sans", 17, "bold")), spacing1=int(6 * scaling), spacing3=int(3 * scaling))
+        w.tag_configure("md_h3", font=font(("Google Sans", 15, "bold")), spacing1=int(4 * scaling), spacing3=int(2 * scaling))
+        w.tag_configure("md_bold", font=font(FONT_BOLD))
+        w.tag_configure("md_italic", font=font(("Google Sans", 14, "italic")))
+        w.tag_configure("md_list", lmargin1=int(8 * scaling), lmargin2=int(24 * scaling))
+        w.tag_configure("md_quote", lmargin1=int(12 * scaling), lmargin2=int(12 * scaling), foreground=TEXT_GRAY)
+        w.tag_configure("md_rule", foreground=PLACEHOLDER_GRAY)
+        w.tag_configure("md_link", foreground=HELIX_PURPLE, underline=True)
+        w.tag_configure("md_code", font=font(FONT_CODE), background="#1B1C1D", lmargin1=int(10 * scaling), lmargin2=int(10 * scaling))
+        w.tag_configure("md_inline_code", font=font(FONT_CODE), background="#1B1C1D")
+        # Created last so their colors win over md_code
+        w.tag_configure("md_kw", foreground="#C792EA")
+        w.tag_configure("md_str", foreground="#C3E88D")
+        w.tag_configure("md_num", foreground="#F78C6C")
+        w.tag_configure("md_com", foreground="#7F848E")
+
+    def reset(self) -> None:
+        """Start over; the caller has already cleared the widget."""
+        self.pending = ""
+        self.in_code = False
+        self.lang = ""
+        self.parts: list[str] = []
+        self.headings = 0
+        self.w.mark_set("md_tail", "end-1c")
+        self.w.mark_gravity("md_tail", "left")
+
+    def committed_text(self) -> str:
+        """Plain text of all rendered (complete) lines, as displayed."""
+        return "".join(self.parts)
+
+    def feed(self, more: str) -> str:
+        """Render a streamed chunk; returns the plain text of lines it completed."""
+        if "\n" not in more:
+            # Still inside the same line: just extend the raw tail.
+            self.pending += more
+            self.w.insert("end-1c", more, self._tail_tags())
+            return ""
+        lines = (self.pending + more).split("\n")
+        self.pending = lines.pop()
+        self.w.delete("md_tail", "end-1c")
+        args: list = []
+        plain = []
+        for line in lines:
+            shown = self._render_line(line, args)
+            if shown is not None:
+                plain.append(shown + "\n")
+        if args:
+            self.w.insert("end-1c", *args)
+        self.w.mark_set("md_tail", "end-1c")
+        if self.pending:
+            self.w.insert("end-1c", self.pending, self._tail_tags())
+        new = "".join(plain)
+        self.parts.append(new)
+        return new
+
+    def finish(self) -> str:
+        """Render the last line, which no newline will complete; returns its plain text."""
+        if not self.pending:
+            return ""
+        line, self.pending = self.pending, ""
+        self.w.delete("md_tail", "end-1c")
+        args: list = []
+        shown = self._render_line(line, args)
+        if len(args) > 2:
+            self.w.insert("end-1c", *args[:-2]) # without the line's trailing newline
+        self.w.mark_set("md_tail", "end-1c")
+        self.parts.append(shown or "")
+        return shown or ""
+
+    def _tail_tags(self) -> tuple:
+        return ("md_code",) if self.in_code else ()
+
+    def _emit(self, args: list, segs: list[tuple[str, tuple]]) -> str:
+        for text, tags in segs:
+            args += [text, tags]
+        args += ["\n", segs[-1][1] if segs else ()]
+        return "".join(t for t, _ in segs)
+
+    def _render_line(self, line: str, args: list) -> str | None:
+        if line.lstrip().startswith("```"):
+            # Fence lines are not shown; they only switch code mode.
+            self.in_code = not self.in_code
+            self.lang = line.strip()[3:].strip().lower() if self.in_code else ""
+            return None
+        if self.in_code:
+            segs = []
+            pos = 0
+            for start, end, tag in highlight_code_line(line, self.lang):
+                if start > pos:
+                    segs.append((line[pos:start], ("md_code",)))
+                segs.append((line[start:end], ("md_code", tag)))
+                pos = end
+            if pos < len(line) or not segs:
+                segs.append((line[pos:], ("md_code",)))
+            return self._emit(args, segs)
+
+        m = _MD_HEADING_RE.match(line)
+        if m:
+            self.headings += 1
+            tag = f"md_h{min(len(m.group(1)), 3)}"
+            return self._emit(args, markdown_inline(m.group(2), (tag,)))
+        if _MD_RULE_RE.match(line):
+            return self._emit(args, [("─" * 24, ("md_rule",))])
+        m = _MD_LIST_RE.match(line)
+        if m:
+            marker = "•" if m.group(2) in "-*+" else m.group(2)
+            return self._emit(args, [(f"{m.group(1)}{marker} ", ("md_list",))] + markdown_inline(m.group(3), ("md_list",)))
+        m = _MD_QUOTE_RE.match(line)
+        if m:
+            return self._emit(args, markdown_inline(m.group(1), ("md_quote",)))
+        return self._emit(args, markdown_inline(line))
+
+# =========================
+# VIRTUAL SCROLLING
+# =========================
+
+class VirtualScroller(ctk.CTkFrame):
+    """Scrollable list that only materializes rows near the viewport.
+
+    Subclasses provide row_kind(), create_row(), bind_row() and estimate_height().
+    Rows are canvas windows placed at cached y offsets and recycled through a per-kind
+    pool, so the number of live widgets follows the viewport size, not the item count.
+    A row is any object with a `container` widget whose parent is `self.canvas`.
+    """
+
+    OVERSCAN_PX = 400
+    measure_rows = True  # False for fixed-height rows that never need measuring
+    # One wheel handler per Tk root routes events to the scroller under the pointer;
+    # per-instance bind_all handlers would pile up and outlive their widgets.
+    _wheel_targets: dict[str, "VirtualScroller"] = {} # canvas path -> scroller
+    _wheel_root = None
+
+    def __init__(self, master, bg: str = BG_DARK, **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.canvas = tk.Canvas(self, bg=bg, highlightthickness=0, bd=0, yscrollincrement=20)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.canvas.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.canvas.configure(yscrollcommand=self._on_yscroll)
+
+        self.items: list = []
+        self.heights: list[int] = []
+        self.measured: list[bool] = []
+        self._offsets: list[int] = [0]
+        self._dirty_from = 0
+        self.active: dict[int, object] = {}
+        self.pool: dict[str, list] = {}
+        self.width = 1
+        self.stick_to_bottom = False
+        self._render_job = None
+        self._reflow_job = None
+        self._rendering = False
+
+        self.canvas.bind("<Configure>", self._on_configure)
+        VirtualScroller._wheel_targets[str(self.canvas)] = self
+        root = self._root()
+        if VirtualScroller._wheel_root is not root:
+            # Bound through the root so the Tcl command isn't deleted along with this widget
+            VirtualScroller._wheel_root = root
+            for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+                root.bind_all(seq, VirtualScroller._dispatch_wheel, add="+")
+
+    def destroy(self) -> None:
+        VirtualScroller._wheel_targets.pop(str(self.canvas), None)
+        super().destroy()
+
+    # --- hooks ---
+    def row_kind(self, item) -> str:
+        return "row"
+
+    def create_row(self, kind: str):
+        raise NotImplementedError
+
+    def bind_row(self, row, item) -> None:
+        raise NotImplementedError
+
+    def unbind_row(self, row) -> None:
+        pass
+
+    def estimate_height(self, item) -> int:
+        return 40
+
+    # --- model ---
+    def set_items(self, items: list) -> None:
+        for idx in list(self.active):
+            self._release(idx)
+        self.items = list(items)
+        self.heights = [self.estimate_height(it) for it in self.items]
+        self.measured = [False] * len(self.items)
+        self._dirty_from = 0
+        self.schedule_render()
+
+    def append(self, item) -> int:
+        self.items.append(item)
+        self.heights.append(self.estimate_height(item))
+        self.measured.append(False)
+        self._dirty_from = min(self._dirty_from, len(self.items) - 1)
+        self.schedule_render()
+        return len(self.items) - 1
+
+    def prepend(self, items: list) -> None:
+        """Insert items at the top while keeping the visible content where it is."""
+        if not items:
+            return
+        top = self.canvas.canvasy(0)
+        for idx in list(self.active):
+            self._release(idx)
+        added = [self.estimate_height(it) for it in items]
+        self.items[0:0] = list(items)
+        self.heights[0:0] = added
+        self.measured[0:0] = [False] * len(items)
+        self._dirty_from = 0
+        self._ensure_offsets()
+        self._update_scrollregion()
+        self._scroll_to_px(top + sum(added))
+        self.schedule_render()
+
+    def item_changed(self, idx: int) -> None:
+        if 0 <= idx < len(self.items):
+            self.measured[idx] = False
+            if idx not in self.active:
+                self.heights[idx] = self.estimate_height(self.items[idx])
+                self._dirty_from = min(self._dirty_from, idx)
+            self.schedule_render()
+
+    def clear(self) -> None:
+        self.set_items([])
+        self.canvas.yview_moveto(0)
+
+    def scroll_to_end(self) -> None:
+        self.stick_to_bottom = True
+        self._ensure_offsets()
+        self._update_scrollregion()
+        self.canvas.yview_moveto(1.0)
+        self.schedule_render()
+
+    # --- layout ---
+    def _ensure_offsets(self) -> None:
+        n = len(self.heights)
+        if self._dirty_from > n:
+            return
+        del self._offsets[self._dirty_from + 1:]
+        total = self._offsets[self._dirty_from]
+        for h in self.heights[self._dirty_from:]:
+            total += h
+            self._offsets.append(total)
+        self._dirty_from = n + 1
+
+    def _update_scrollregion(self) -> None:
+        total = max(self._offsets[-1], self.canvas.winfo_height())
+        self.canvas.configure(scrollregion=(0, 0, self.width, total))
+
+    def _scroll_to_px(self, y: float) -> None:
+        total = max(1, self._offsets[-1])
+        self.canvas.yview_moveto(max(0.0, min(1.0, y / total)))
+
+    def visible_range(self, overscan: int = 0) -> range:
+        self._ensure_offsets()
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        lo = max(0, bisect.bisect_right(self._offsets, top - overscan) - 1)
+        hi = min(len(self.items), bisect.bisect_left(self._offsets, bottom + overscan))
+        return range(lo, hi)
+
+    def schedule_render(self) -> None:
+        if self._render_job is None:
+            self._render_job = self.after_idle(self.render)
+
+    def render(self) -> None:
+        self._render_job = None
+        if self._rendering:
+            self.schedule_render()
+            return
+        self._rendering = True
+        try:
+            self._render()
+        finally:
+            self._rendering = False
+
+    def _render(self) -> None:
+        self._ensure_offsets()
+        self._update_scrollregion()
+
+        # Anchor on the first visible row so late measurements above it don't shift the view.
+        top = self.canvas.canvasy(0)
+        anchor = max(0, min(len(self.items) - 1, bisect.bisect_right(self._offsets, top) - 1))
+        anchor_delta = top - self._offsets[anchor] if self.items else 0
+
+        want = self.visible_range(self.OVERSCAN_PX)
+        for idx in [i for i in self.active if i not in want]:
+            self._release(idx)
+
+        fresh = []
+        for idx in want:
+            row = self.active.get(idx)
+            if row is None:
+                row = self._acquire(self.row_kind(self.items[idx]))
+                self.bind_row(row, self.items[idx])
+                self.active[idx] = row
+                self.canvas.itemconfigure(row._vs_window, state="normal")
+            self.canvas.coords(row._vs_window, 0, self._offsets[idx])
+            if self.measure_rows and not self.measured[idx]:
+                fresh.append(idx)
+
+        if not fresh:
+            return
+        self.canvas.update_idletasks()
+        changed = False
+        for idx in fresh:
+            h = self.active[idx].container.winfo_reqheight()
+            self.measured[idx] = True
+            if h != self.heights[idx]:
+                self.heights[idx] = h
+                self._dirty_from = min(self._dirty_from, idx)
+                changed = True
+        if changed:
+            self._ensure_offsets()
+            self._update_scrollregion()
+            if self.stick_to_bottom:
+                self.canvas.yview_moveto(1.0)
+            elif self.items:
+                self._scroll_to_px(self._offsets[anchor] + anchor_delta)
+            self.schedule_render()
+
+    def _acquire(self, kind: str):
+        free = self.pool.get(kind)
+        if free:
+            return free.pop()
+        row = self.create_row(kind)
+        row._vs_kind = kind
+        row._vs_window = self.canvas.create_window(0, 0, window=row.container, anchor="nw", width=self.width)
+        return row
+
+    def _release(self, idx: int) -> None:
+        self._recycle(self.active.pop(idx))
+
+    def _recycle(self, row) -> None:
+        self.canvas.itemconfigure(row._vs_window, state="hidden")
+        self.unbind_row(row)
+        self.pool.setdefault(row._vs_kind, []).append(row)
+
+    # --- events ---
+    def _on_configure(self, e) -> None:
+        # Width changes are coalesced: rows reflow once after the resize settles.
+        if e.width != self.width:
+            if self._reflow_job is not None:
+                self.after_cancel(self._reflow_job)
+            self._reflow_job = self.after(REFLOW_DEBOUNCE_MS, self._reflow)
+        if self.stick_to_bottom:
+            self.canvas.yview_moveto(1.0)
+        self.schedule_render()
+
+    def _reflow(self) -> None:
+        self._reflow_job = None
+        old_width, self.width = self.width, self.canvas.winfo_width()
+        if old_width == self.width:
+            return
+        for rows in [self.active.values()] + list(self.pool.values()):
+            for row in rows:
+                self.canvas.itemconfigure(row._vs_window, width=self.width)
+        self.on_width_change(old_width)
+        self.schedule_render()
+
+    def on_width_change(self, old_width: int) -> None:
+        # Wrapped rows change height with width; visible ones are re-measured on render.
+        if self.measure_rows:
+            self.measured = [False] * len(self.items)
+
+    def _on_yscroll(self, first: str, last: str) -> None:
+        self.scrollbar.set(first, last)
+        self.stick_to_bottom = float(last) >= 0.999
+        self.schedule_render()
+        self.on_scrolled(float(first), float(last))
+
+    def on_scrolled(self, first: float, last: float) -> None:
+        pass
+
+    @staticmethod
+    def _dispatch_wheel(e) -> None:
+        path = str(e.widget)
+        for canvas, scroller in VirtualScroller._wheel_targets.items():
+            if path == canvas or path.startswith(canvas + "."):
+                scroller._on_wheel(e)
+                return
+
+    def _on_wheel(self, e) -> None:
+        if getattr(e, "num", None) == 4:
+            step = -3
+        elif getattr(e, "num", None) == 5:
+            step = 3
+        else:
+            step = -int(e.delta / 120) if abs(e.delta) >= 120 else (-1 if e.delta > 0 else 1)
+        self.canvas.yview_scroll(step, "units")
+
 # =========================
 # CHAT UI HELPERS (bubbles)
 # =========================
 
+BUBBLE_CHROME = {"user": 38, "assistant": 59} # row height around the textbox (padding, actions)
+
+def bubble_text_size(role: str, text: str, max_width_px: int, scale: float) -> tuple[int, int]:
+    """(width, height) of a bubble's textbox in unscaled units; user bubbles shrink to fit."""
+    font = TEXT_LAYOUT.font(FONT_NORMAL, scale)
+    width = max_width_px
+    if role == "user":
+        natural = TEXT_LAYOUT.natural_width(text, font) / scale + TEXT_PAD_PX + 4
+        width = int(max(60, min(max_width_px - 80, natural)))
+    lines = TEXT_LAYOUT.line_count(text, int(width * scale) - TEXT_PAD_PX, font)
+    return width, max(40, int((lines * font.metrics("linespace") + TEXT_PAD_PX) / scale))
+
 class BubbleMessage:
     """A message row in the chat (user bubble or assistant text block)."""
 
@@ -803,6 +4125,12 @@ class BubbleMessage:
         self.container.grid_columnconfigure(0, weight=1)
 
         self.max_width_px = max_width_px
+        self.entry = None # TranscriptEntry currently shown (set by ChatTranscript)
+        self.source_btns: list = []
+        self._wrap: WrapState | None = None
+        self._width = 0
+        self._height = 0
+        self.md: MarkdownStream | None = None
 
         if role == "user":
             # right-aligned bubble
@@ -842,9 +4170,15 @@ class BubbleMessage:
                 height=0,
                 activate_scrollbars=False
             )
-            self.textbox.insert("0.0", text)
             self.textbox.configure(state="disabled")
-            self.textbox.pack(anchor="w", fill="x", expand=True)
+            self.textbox.pack(anchor="w") # width is set explicitly from the wrap length
+
+            # Assistant text is rendered as markdown directly into the inner tk.Text
+            self.md = MarkdownStream(self.textbox._textbox, self.textbox._get_widget_scaling())
+            self.textbox.configure(state="normal")
+            self.md.feed(text)
+            self.md.finish()
+            self.textbox.configure(state="disabled")
 
             # Action Row (Copy / Edit)
             self.actions = ctk.CTkFrame(self.bubble, fg_color="transparent", height=30)
@@ -857,44 +4191,375 @@ class BubbleMessage:
         # Initial size calc
         self.resize_textbox()
 
-    def resize_textbox(self):
-        # Rough calc: lines * line_height
-        # This is a heuristic because CTkTextbox auto-sizing is tricky
-        lines = self.text.count('\n') + (len(self.text) / 60) # approx chars per line
-        h = max(40, int(lines * 24) + 20)
+    def resize_textbox(self) -> bool:
+        """Fit the textbox to the text using font metrics; True if the height changed."""
+        scale = self.textbox._get_widget_scaling()
+        width, _ = bubble_text_size(self.role, self.text, self.max_width_px, scale)
+        if width != self._width:
+            self._width = width
+            self.textbox.configure(width=width)
+        font = TEXT_LAYOUT.font(FONT_NORMAL, scale)
+        # With markdown the wrap state covers the rendered lines; the raw tail is added on top.
+        shown = self.md.committed_text() if self.md else self.text
+        self._wrap = TEXT_LAYOUT.wrap_state(shown, int(width * scale) - TEXT_PAD_PX, font)
+        return self._apply_height(scale, font)
+
+    def _line_count(self) -> float:
+        if self.md is None:
+            return self._wrap.line_count()
+        state = self._wrap
+        if self.md.pending:
+            state = state.copy()
+            state.feed(self.md.pending)
+        # Heading lines use a larger font; count them as one and a half lines.
+        return state.line_count() + 0.5 * self.md.headings
+
+    def _apply_height(self, scale: float, font: tkfont.Font) -> bool:
+        h = max(40, int((self._line_count() * font.metrics("linespace") + TEXT_PAD_PX) / scale))
+        if h == self._height:
+            return False
+        self._height = h
         self.textbox.configure(height=h)
+        return True
 
-    def grid(self, row: int):
-        self.container.grid(row=row, column=0, sticky="ew")
-        return self
-
-    def set_text(self, txt: str):
+    def set_text(self, txt: str, final: bool = True) -> bool:
+        """Replace the text; `final=False` leaves an unfinished last line open for append_text()."""
         self.text = txt
         self.textbox.configure(state="normal")
         self.textbox.delete("0.0", "end")
-        self.textbox.insert("0.0", txt)
+        if self.md:
+            self.md.reset()
+            self.md.feed(txt)
+            if final:
+                self.md.finish()
+        else:
+            self.textbox.insert("0.0", txt)
         self.textbox.configure(state="disabled")
-        self.resize_textbox()
+        return self.resize_textbox()
 
-    def append_text(self, more: str):
+    def append_text(self, more: str) -> bool:
         self.text += more
         self.textbox.configure(state="normal")
-        self.textbox.insert("end", more)
+        if self.md:
+            completed = self.md.feed(more)
+        else:
+            self.textbox.insert("end", more)
+            completed = more
+        self.textbox.configure(state="disabled")
+        if self._wrap is None or self.role == "user":
+            return self.resize_textbox()
+        # Streaming: only newly completed lines are measured (plus the short raw tail).
+        self._wrap.feed(completed)
+        scale = self.textbox._get_widget_scaling()
+        return self._apply_height(scale, TEXT_LAYOUT.font(FONT_NORMAL, scale))
+
+    def finish_text(self) -> bool:
+        """The stream ended: render its last line; True if the height changed."""
+        if self.md is None or not self.md.pending:
+            return False
+        self.textbox.configure(state="normal")
+        self.md.finish()
         self.textbox.configure(state="disabled")
-        self.resize_textbox()
+        return self.resize_textbox()
+
+    def set_sources(self, refs: list[dict], on_open):
+        # Clickable notebook ranges that were injected into the prompt for this answer
+        for btn in self.source_btns:
+            btn.destroy()
+        self.source_btns = []
+        if self.role == "user" or not refs:
+            return
+        for ref in refs[:6]:
+            btn = ctk.CTkButton(
+                self.actions,
+                text=f"📓 {ref['title'][:18]} {ref['start']}–{ref['end']}",
+                height=26,
+                fg_color="transparent",
+                hover_color=BG_INPUT,
+                text_color=TEXT_GRAY,
+                font=FONT_SMALL,
+                command=lambda r=ref: on_open(r["nid"], r["start"], r["end"]),
+            )
+            btn.pack(side="left", padx=(0, 5))
+            self.source_btns.append(btn)
 
-    def set_wraplength(self, px: int):
-        # CTkTextbox handles wrapping automatically via width
-        pass
+    def set_wraplength(self, px: int) -> bool:
+        if px == self.max_width_px:
+            return False
+        self.max_width_px = px
+        return self.resize_textbox()
 
     def copy_text(self):
+        import pyperclip
         pyperclip.copy(self.text)
 
+class TranscriptEntry:
+    """One chat message in the transcript model.
+
+    Updates go to the bubble only while the entry is on screen; otherwise they just
+    change the text and the transcript re-estimates the row height.
+    """
+
+    def __init__(self, view: "ChatTranscript", role: str, text: str):
+        self.view = view
+        self.role = role
+        self.text = text
+        self.index = -1
+        self.bubble: BubbleMessage | None = None
+        self.sources: list[dict] = []
+        self.on_open_source = None
+        self.streaming = False # a reply is still arriving; its last line may be incomplete
+
+    def set_text(self, txt: str, streaming: bool = False):
+        self.text = txt
+        self.streaming = streaming
+        if self.bubble is None or self.bubble.set_text(txt, final=not streaming):
+            self.view.item_changed(self.index)
+
+    def append_text(self, more: str):
+        self.text += more
+        if self.bubble is None or self.bubble.append_text(more):
+            self.view.item_changed(self.index)
+
+    def finish(self):
+        self.streaming = False
+        if self.bubble is not None and self.bubble.finish_text():
+            self.view.item_changed(self.index)
+
+    def set_sources(self, refs: list[dict], on_open):
+        self.sources = list(refs)
+        self.on_open_source = on_open
+        if self.bubble:
+            self.bubble.set_sources(self.sources, on_open)
+        self.view.item_changed(self.index)
+
+class ChatTranscript(VirtualScroller):
+    """Virtualized chat history; BubbleMessage widgets are pooled per role."""
+
+    def __init__(self, master, max_width_px: int = 780, **kwargs):
+        super().__init__(master, **kwargs)
+        self.max_width_px = max_width_px
+
+    def add_entry(self, role: str, text: str) -> TranscriptEntry:
+        entry = TranscriptEntry(self, role, text)
+        entry.index = self.append(entry)
+        return entry
+
+    def load_entries(self, msgs: list[tuple[str, str]]) -> None:
+        entries = []
+        for i, (role, text) in enumerate(msgs):
+            entry = TranscriptEntry(self, role, text)
+            entry.index = i
+            entries.append(entry)
+        self.set_items(entries)
+
+    def row_kind(self, entry: TranscriptEntry) -> str:
+        return "user" if entry.role == "user" else "assistant"
+
+    def create_row(self, kind: str) -> BubbleMessage:
+        return BubbleMessage(self.canvas, role=kind, text="", max_width_px=self.max_width_px)
+
+    def bind_row(self, bubble: BubbleMessage, entry: TranscriptEntry) -> None:
+        bubble.entry = entry
+        entry.bubble = bubble
+        bubble.max_width_px = self.max_width_px
+        bubble.set_text(entry.text, final=not entry.streaming)
+        bubble.set_sources(entry.sources, entry.on_open_source)
+
+    def unbind_row(self, bubble: BubbleMessage) -> None:
+        if bubble.entry is not None:
+            bubble.entry.bubble = None
+            bubble.entry = None
+
+    def estimate_height(self, entry: TranscriptEntry) -> int:
+        scale = self._get_widget_scaling()
+        kind = self.row_kind(entry)
+        _, h = bubble_text_size(kind, entry.text, self.max_width_px, scale)
+        return int((h + BUBBLE_CHROME[kind]) * scale)
+
+    def on_width_change(self, old_width: int) -> None:
+        scale = self._get_widget_scaling()
+        old_max = self.max_width_px
+        self.max_width_px = max(240, min(780, int(self.width / scale) - 60))
+        for bubble in self.active.values():
+            bubble.set_wraplength(self.max_width_px)
+        # Off-screen rows: scale the text part by the width ratio; exact heights are
+        # measured again when they scroll into view.
+        ratio = old_max / self.max_width_px
+        for i, entry in enumerate(self.items):
+            if i not in self.active:
+                chrome = int(BUBBLE_CHROME[self.row_kind(entry)] * scale)
+                self.heights[i] = chrome + int(max(0, self.heights[i] - chrome) * ratio)
+        self.measured = [False] * len(self.items)
+        self._dirty_from = 0
+
+# =========================
+# KEYED LISTS (library sidebar, DM contacts)
+# =========================
+
+class KeyedRow:
+    """Pooled list row: a section header label or a clickable item button."""
+
+    def __init__(self, parent, kind: str, view: "KeyedList"):
+        self.kind = kind
+        self.key = None
+        self.container = ctk.CTkFrame(parent, fg_color="transparent", corner_radius=0, height=KeyedList.ROW_HEIGHTS[kind])
+        self.container.pack_propagate(False)
+        if kind == "header":
+            self.widget = ctk.CTkLabel(self.container, text="", font=("Google Sans", 11, "bold"), text_color="#555", anchor="w")
+            self.widget.pack(side="bottom", anchor="w", padx=15, pady=(0, 5))
+        else:
+            self.widget = ctk.CTkButton(
+                self.container,
+                text="",
+                anchor="w",
+                fg_color="transparent",
+                hover_color=BG_CARD,
+                height=KeyedList.ROW_HEIGHTS[kind] - 2,
+                corner_radius=8,
+                font=FONT_NORMAL,
+                text_color="#CCC",
+                command=lambda: view.on_open(self.kind, self.key),
+            )
+            self.widget.pack(fill="x", pady=1, padx=6)
+            if kind == "chat" and view.on_menu:
+                self.widget.bind("<Button-3>", lambda e: view.on_menu(e, self.key))
+
+class KeyedList(VirtualScroller):
+    """Keyed, virtualized list (library sidebar, DM contacts).
+
+    set_rows() takes the full (key, kind, text) list and diffs it by key: an on-screen row
+    whose item survived moves with it to its new position, and only rows whose text
+    changed are rebound. A rename, or a new chat that shifts every row down, touches a
+    handful of widgets no matter how large the library is.
+    """
+
+    ROW_HEIGHTS = {"header": 40, "chat": 37, "note": 37, "contact": 52}
+    measure_rows = False
+
+    def __init__(self, master, on_open, on_menu=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_open = on_open
+        self.on_menu = on_menu
+
+    def set_rows(self, rows: list[tuple[str, str, str]]) -> None:
+        if rows == self.items:
+            return
+        old = self.items
+        position = {r[0]: i for i, r in enumerate(rows)}
+        heights = [self.ROW_HEIGHTS[r[1]] for r in rows]
+        # Offsets are recomputed from the first row whose height changed
+        first = next((i for i, (a, b) in enumerate(zip(self.heights, heights)) if a != b), min(len(old), len(rows)))
+        self._dirty_from = min(self._dirty_from, first)
+        self.items = list(rows)
+        self.heights = heights
+        self.measured = [True] * len(rows)
+
+        # Widgets follow their key; render() places them at the new offsets
+        active, self.active = self.active, {}
+        for idx, row in active.items():
+            new_idx = position.get(old[idx][0])
+            if new_idx is None or rows[new_idx][1] != old[idx][1]:
+                self._recycle(row)
+                continue
+            if rows[new_idx] != old[idx]:
+                self.bind_row(row, rows[new_idx])
+            self.active[new_idx] = row
+        self.schedule_render()
+
+    def row_kind(self, item) -> str:
+        return item[1]
+
+    def create_row(self, kind: str) -> KeyedRow:
+        return KeyedRow(self.canvas, kind, self)
+
+    def bind_row(self, row: KeyedRow, item) -> None:
+        row.key = item[0]
+        row.widget.configure(text=item[2])
+
+    def estimate_height(self, item) -> int:
+        return self.ROW_HEIGHTS[item[1]]
+
+# =========================
+# DM THREAD
+# =========================
+
+class DMRow:
+    """Pooled DM message label; one pool per side so rows never need re-packing."""
+
+    def __init__(self, parent, kind: str):
+        self.container = ctk.CTkFrame(parent, fg_color="transparent", corner_radius=0)
+        mine = kind == "me"
+        self.label = ctk.CTkLabel(
+            self.container,
+            text="",
+            fg_color=HELIX_PURPLE if mine else BG_CARD,
+            corner_radius=10,
+            padx=10,
+            pady=5,
+            wraplength=400,
+        )
+        self.label.pack(anchor="e" if mine else "w", pady=5, padx=10)
+
+class DMThreadView(VirtualScroller):
+    """Virtualized DM thread. New messages are appended in place and older history is
+    fetched a page at a time (keyed by timestamp) when the user scrolls to the top."""
+
+    def __init__(self, master, on_need_older, **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_need_older = on_need_older
+        self.has_more = False
+        self.loading = False
+
+    def row_kind(self, msg: dict) -> str:
+        return "me" if msg["role"] == "me" else "them"
+
+    def create_row(self, kind: str) -> DMRow:
+        return DMRow(self.canvas, kind)
+
+    def bind_row(self, row: DMRow, msg: dict) -> None:
+        row.label.configure(text=msg["content"])
+
+    def estimate_height(self, msg: dict) -> int:
+        scale = self._get_widget_scaling()
+        font = TEXT_LAYOUT.font(FONT_NORMAL, scale)
+        lines = TEXT_LAYOUT.line_count(msg["content"], int(400 * scale), font)
+        return lines * font.metrics("linespace") + int(30 * scale)
+
+    def on_scrolled(self, first: float, last: float) -> None:
+        if first <= 0.0 and self.has_more and not self.loading and self.items:
+            self.loading = True
+            self.after_idle(self.on_need_older)
+
 # =========================
 # MAIN APP
 # =========================
 
+class CoreAttr:
+    """HelixApp attribute stored on its HelixCore, so widgets and core share one value."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        return self if obj is None else getattr(obj.core, self.name)
+
+    def __set__(self, obj, value):
+        setattr(obj.core, self.name, value)
+
 class HelixApp(ctk.CTk):
+    current_user = CoreAttr()
+    saved_chats = CoreAttr()
+    current_model_key = CoreAttr()
+    current_note_id = CoreAttr()
+    attach_notebook_to_chat = CoreAttr()
+    use_notebook_context = CoreAttr()
+    auto_memories = CoreAttr()
+    compress_prompts = CoreAttr()
+    compression_ratio = CoreAttr()
+    notebook_chunks = CoreAttr()
+    context_refs = CoreAttr()
+
     def __init__(self):
         super().__init__()
 
@@ -902,41 +4567,144 @@ class HelixApp(ctk.CTk):
         self.geometry("1366x900")
         self.configure(fg_color=BG_DARK)
 
-        # state
-        self.current_user = None
+        # state: user, chats, model and context settings live on the core
+        self.core = HelixCore()
         self.token_balance = 0
-        self.saved_chats: dict = {}
         self.current_chat_id: str | None = None
-
-        self.current_model_key = "Standard"
-        self.current_note_id: str | None = None
-        self.attach_notebook_to_chat = False
-        self.use_notebook_context = False # Global context toggle
+        self.memory_timers: dict[str, str] = {}
 
         self.active_tab = "Talk to AI"
 
         self.pending_email = ""
         self.pending_pass = ""
-        self.pending_otp = ""
 
         self.settings_overlay = None
+        self.canvas_overlay = None
+
+        self.dm_contacts: list[tuple[str, str, str]] | None = None # (id, name, last_msg), loaded on first visit
+        self.dm_current_contact = None
+        self.dm_draft_visible = False
+
+        self.animator = Animator(self)
+        self.page_x: dict = {} # current relx of pages that are mid-slide
+
+        self.stall_monitor = StallMonitor(self)
+        self.stall_monitor.start()
+
+        db.warm_up() # schema setup runs while the first screen is built
+        self.bg = BackgroundService(self)
+        self.auth_busy = False
+        self.workspace_loaded = False # chats/notebooks of current_user are in memory
+        self.note_loading: str | None = None # canvas id whose content is being fetched
+        self.restore_chat_id: str | None = None # chat to reopen once the workspace has loaded
+        self.last_snapshot = ""
+
+        # Screens and pages are built on first use; heavy extras after the first frame
+        self.login_frame = None
+        self.otp_frame = None
+        self.app_frame = None
+        self.widget = None
+        self.built_pages: set[str] = set()
+        self.startup_times: dict[str, float] = {}
 
         self.container = ctk.CTkFrame(self, fg_color="transparent")
         self.container.pack(fill="both", expand=True)
 
-        self.setup_login_screen()
-        self.setup_otp_screen()
-        self.setup_main_app()
-
-        # session restore
+        # session restore: show the app right away, then confirm the token in the background
+        self.session_token: str | None = None
         cached = load_session()
         if cached:
-            self.current_user = cached
-            self.token_balance = db.get_token_balance(self.current_user)
+            self.current_user = cached[0]
+            self.set_session(cached[1])
             self.show_app()
+            self.bg.submit(db.session_user, self.session_token,
+                           on_done=lambda email, token=self.session_token: self._session_checked(token, email))
         else:
             self.show_login()
 
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(SNAPSHOT_INTERVAL_MS, self._snapshot_tick)
+        self.after_idle(self._on_first_frame)
+
+    # ---------- STARTUP ----------
+    def on_close(self):
+        self.write_snapshot()
+        self.destroy()
+
+    def build_snapshot(self) -> dict | None:
+        if not self.current_user or not self.workspace_loaded:
+            return None
+        chat = self.saved_chats.get(self.current_chat_id) if self.current_chat_id else None
+        tail = []
+        if chat:
+            for m in chat.get("msgs", [])[-SNAPSHOT_TAIL_MSGS:]:
+                tail.append({"role": m.get("role"), "content": str(m.get("content", ""))[:SNAPSHOT_MSG_CHARS]})
+        return {
+            "version": 1,
+            "email": self.current_user,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "active_tab": self.active_tab,
+            "library": self._library_rows(),
+            "notebook_index": self.notebook_index,
+            "chat": {"id": self.current_chat_id, "msgs": tail} if chat else None,
+        }
+
+    def write_snapshot(self, background: bool = False):
+        data = self.build_snapshot()
+        if data is None:
+            return
+        # saved_at changes every time; compare the rest to skip redundant writes
+        key = json.dumps({k: v for k, v in data.items() if k != "saved_at"})
+        if key == self.last_snapshot:
+            return
+        self.last_snapshot = key
+        if background:
+            self.bg.submit(save_snapshot, data, ordered=True)
+        else:
+            save_snapshot(data)
+
+    def _snapshot_tick(self):
+        self.write_snapshot(background=True)
+        self.after(SNAPSHOT_INTERVAL_MS, self._snapshot_tick)
+
+    def restore_snapshot(self, snap: dict):
+        """Show the last session's library, tab and chat tail before the DB has been read."""
+        try:
+            self.library.set_rows([tuple(r) for r in snap.get("library") or []])
+            self.notebook_index = [tuple(n) for n in snap.get("notebook_index") or []]
+            chat = snap.get("chat")
+            if chat and chat.get("id"):
+                self.restore_chat_id = chat["id"]
+                self.current_chat_id = chat["id"]
+                msgs = chat.get("msgs") or []
+                if msgs:
+                    self._ensure_chat_visible()
+                    self.transcript.load_entries([
+                        ("user" if m.get("role") == "user" else "assistant", str(m.get("content", ""))) for m in msgs
+                    ])
+                    self.scroll_chat_to_bottom()
+            tab = snap.get("active_tab")
+            if tab in self.pages and tab != self.active_tab:
+                self.switch_tab(tab)
+        except Exception:
+            pass
+
+    def _on_first_frame(self):
+        # Idle callbacks queued during construction (geometry, first draw) have run by now.
+        self.startup_times["first_frame_ms"] = (time.perf_counter() - APP_START) * 1000
+        self.after(1, self._build_deferred)
+
+    def _build_deferred(self):
+        client.warm_up() # model endpoint probe (and the openai import) off the Tk thread
+        if self.widget is None:
+            self.widget = FloatingWidget(self)
+        # Interactive once the event loop gets a turn after the deferred work.
+        self.after(1, self._report_startup)
+
+    def _report_startup(self):
+        self.startup_times["interactive_ms"] = (time.perf_counter() - APP_START) * 1000
+        sys.stderr.write("HELIX startup: first frame {first_frame_ms:.0f} ms, interactive {interactive_ms:.0f} ms\n".format(**self.startup_times))
+
     # ---------- UI UTIL ----------
     def setup_textbox_placeholder(self, textbox: ctk.CTkTextbox, placeholder_text: str, submit_func):
         textbox.delete("0.0", "end")
@@ -970,84 +4738,55 @@ class HelixApp(ctk.CTk):
         textbox.bind("<Return>", on_enter)
 
     def scroll_chat_to_bottom(self):
-        canvas = getattr(self.chat_scroll, "_parent_canvas", None)
-        if canvas is None:
-            canvas = getattr(self.chat_scroll, "_canvas", None)
-        if canvas is not None:
-            try:
-                canvas.yview_moveto(1.0)
-            except Exception:
-                pass
+        if hasattr(self, "transcript"):
+            self.transcript.scroll_to_end()
 
     # ---------- ANIMATION HELPER ----------
     def animate_slide_page(self, old_frame, new_frame, direction="right"):
         # We need to use place for sliding
         # Assume both frames are children of self.pages_container
-
-        # Dimensions
-        w = self.pages_container.winfo_width()
-        h = self.pages_container.winfo_height()
-
-        # Start positions
-        # if direction is right (navigating to right tab), new frame comes from right (x=1)
+        # If direction is right (navigating to right tab), new frame comes from right (x=1)
         start_x = 1.0 if direction == "right" else -1.0
 
-        new_frame.place(relx=start_x, rely=0, relwidth=1, relheight=1)
-        new_frame.lift()
-        old_frame.place(relx=0, rely=0, relwidth=1, relheight=1) # Ensure visible
+        # A slide interrupted by another click leaves a third page mid-way; park it.
+        for frame in self.pages.values():
+            if frame is not old_frame and frame is not new_frame:
+                frame.place_forget()
+                self.page_x.pop(frame, None)
 
-        steps = 15
-        dt = 10 # ms
+        # Either page may be mid-slide from an interrupted animation; continue from there
+        old_x = self.page_x.get(old_frame, 0.0)
+        new_x = self.page_x.get(new_frame, start_x)
+        new_frame.place(relx=new_x, rely=0, relwidth=1, relheight=1)
+        new_frame.lift()
 
-        def step(i):
-            if i > steps:
-                new_frame.place(relx=0, rely=0, relwidth=1, relheight=1)
-                old_frame.place_forget() # Hide old
-                return
+        def apply(progress):
+            # New frame moves from where it is to 0, old frame from where it is to -start_x
+            self.page_x[new_frame] = new_x * (1 - progress)
+            self.page_x[old_frame] = old_x + (-start_x - old_x) * progress
+            new_frame.place(relx=self.page_x[new_frame], rely=0, relwidth=1, relheight=1)
+            old_frame.place(relx=self.page_x[old_frame], rely=0, relwidth=1, relheight=1)
 
-            # Linear interpolation
-            progress = i / steps
-            # New frame moves from start_x to 0
-            curr_new = start_x * (1 - progress)
-            # Old frame moves from 0 to -start_x
-            curr_old = -start_x * progress
+        def done():
+            old_frame.place_forget() # Hide old
+            self.page_x.pop(old_frame, None)
 
-            new_frame.place(relx=curr_new, rely=0, relwidth=1, relheight=1)
-            old_frame.place(relx=curr_old, rely=0, relwidth=1, relheight=1)
+        self.animator.animate("pages", 0.0, 1.0, ANIM_DURATION_MS, apply, done, retarget=False)
 
-            self.after(dt, lambda: step(i + 1))
+    def animate_overlay_open(self, overlay):
+        # Move from rely=1 to rely=0 (or from wherever a pending close left it)
+        self.animator.animate(overlay, 1.0, 0.0, ANIM_DURATION_MS,
+                              lambda y: overlay.place(relx=0, rely=y, relwidth=1, relheight=1))
 
-        step(0)
+    def animate_overlay_close(self, overlay, on_done=None):
+        def done():
+            overlay.destroy()
+            if on_done:
+                on_done()
 
-    def animate_overlay_open(self, overlay):
-        overlay.place(relx=0, rely=1, relwidth=1, relheight=1)
-        steps = 15
-        dt = 10
-        def step(i):
-            if i > steps:
-                overlay.place(relx=0, rely=0, relwidth=1, relheight=1)
-                return
-            progress = i / steps
-            # Move from rely=1 to rely=0
-            curr_y = 1.0 - progress
-            overlay.place(relx=0, rely=curr_y, relwidth=1, relheight=1)
-            self.after(dt, lambda: step(i+1))
-        step(0)
-
-    def animate_overlay_close(self, overlay):
-        steps = 15
-        dt = 10
-        def step(i):
-            if i > steps:
-                overlay.destroy()
-                self.settings_overlay = None
-                return
-            progress = i / steps
-            # Move from rely=0 to rely=1
-            curr_y = progress
-            overlay.place(relx=0, rely=curr_y, relwidth=1, relheight=1)
-            self.after(dt, lambda: step(i+1))
-        step(0)
+        # Move from rely=0 to rely=1
+        self.animator.animate(overlay, 0.0, 1.0, ANIM_DURATION_MS,
+                              lambda y: overlay.place(relx=0, rely=y, relwidth=1, relheight=1), done)
 
     # ---------- SCREENS ----------
     def setup_login_screen(self):
@@ -1063,7 +4802,7 @@ class HelixApp(ctk.CTk):
         logo_area.pack(fill="x", pady=(40, 10))
 
         try:
-            icon = ctk.CTkImage(light_image=Image.open(asset_path(LOGO_FILENAME)), size=(60, 60))
+            icon = ASSETS.logo(60, scale=logo_area._get_widget_scaling())
             ctk.CTkLabel(logo_area, text="", image=icon).pack()
         except:
             ctk.CTkLabel(logo_area, text="🧬", font=("Arial", 60)).pack()
@@ -1100,7 +4839,19 @@ class HelixApp(ctk.CTk):
             self.btn_auth_action.configure(text="Create Account")
             self.lbl_auth_toggle.configure(text="Already have an account? Log In")
 
+    def set_auth_busy(self, busy: bool, text: str = ""):
+        """Loading state for the auth buttons while bcrypt/db work runs in the background."""
+        self.auth_busy = busy
+        if busy:
+            self.btn_auth_action.configure(text=text, state="disabled")
+        else:
+            self.btn_auth_action.configure(text="Log In" if self.login_mode else "Create Account", state="normal")
+        if self.otp_frame is not None:
+            self.btn_otp_submit.configure(text=text if busy else "Submit", state="disabled" if busy else "normal")
+
     def do_auth_action(self):
+        if self.auth_busy:
+            return
         if self.login_mode:
             self.do_login()
         else:
@@ -1118,8 +4869,12 @@ class HelixApp(ctk.CTk):
                                       font=("Segoe UI", 24), justify="center", fg_color=BG_INPUT, border_width=0)
         self.entry_otp.pack(pady=20)
 
-        ctk.CTkButton(center, text="Submit", height=50, width=200, corner_radius=25, fg_color=HELIX_PURPLE, text_color="black",
-                      command=self.verify_otp).pack(pady=20)
+        self.lbl_otp_status = ctk.CTkLabel(center, text="", font=FONT_SMALL, text_color=TEXT_GRAY, wraplength=260)
+        self.lbl_otp_status.pack(padx=20)
+
+        self.btn_otp_submit = ctk.CTkButton(center, text="Submit", height=50, width=200, corner_radius=25, fg_color=HELIX_PURPLE,
+                                            text_color="black", command=self.verify_otp)
+        self.btn_otp_submit.pack(pady=20)
 
         ctk.CTkButton(center, text="Back", height=40, width=200, fg_color="transparent", command=self.show_login).pack(pady=10)
 
@@ -1138,7 +4893,7 @@ class HelixApp(ctk.CTk):
         logo_row = ctk.CTkFrame(self.sidebar, fg_color="transparent", height=80)
         logo_row.pack(fill="x", padx=25, pady=(25, 15))
         try:
-            icon = ctk.CTkImage(light_image=Image.open(asset_path(LOGO_FILENAME)), size=(34, 34))
+            icon = ASSETS.logo(34, scale=logo_row._get_widget_scaling())
             ctk.CTkLabel(logo_row, text="", image=icon).pack(side="left")
         except Exception:
             pass
@@ -1154,9 +4909,11 @@ class HelixApp(ctk.CTk):
         ctk.CTkButton(action_row, text="+ Canvas", fg_color=BG_CARD, hover_color=BG_INPUT, width=110, height=40, corner_radius=20,
                       font=FONT_BOLD, text_color=TEXT_GRAY, command=self.notebook_new).pack(side="right", padx=(5, 0))
 
-        # LIBRARY SCROLL
-        self.library_scroll = ctk.CTkScrollableFrame(self.sidebar, fg_color="transparent")
-        self.library_scroll.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        # LIBRARY (virtualized, keyed rows)
+        self.library = KeyedList(self.sidebar, on_open=self.open_library_item, on_menu=self.show_chat_context_menu, bg=BG_SIDEBAR)
+        self.library.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        self.notebook_index: list[tuple[str, str]] = [] # (id, title), most recently saved first
+        self._sidebar_job = None
 
         footer = ctk.CTkFrame(self.sidebar, fg_color="transparent", height=60)
         footer.pack(fill="x", side="bottom", padx=20, pady=18)
@@ -1191,14 +4948,16 @@ class HelixApp(ctk.CTk):
         self.pages["Messages"] = ctk.CTkFrame(self.pages_container, fg_color=BG_DARK)
         self.pages["Quick Fix"] = ctk.CTkFrame(self.pages_container, fg_color=BG_DARK)
 
-        # Init pages (hidden or placed)
+        # Init pages (hidden or placed); their contents are built by ensure_page
         for p in self.pages.values():
             p.place(relx=1.0, rely=0, relwidth=1, relheight=1) # Start off-screen right
 
-        self._setup_talk_page(self.pages["Talk to AI"])
-        self._setup_notebook_page(self.pages["Canvas"])
-        self._setup_dm_page(self.pages["Messages"])
-        self._setup_quickfix_page(self.pages["Quick Fix"])
+        self.page_builders = {
+            "Talk to AI": self._setup_talk_page,
+            "Canvas": self._setup_notebook_page,
+            "Messages": self._setup_dm_page,
+            "Quick Fix": self._setup_quickfix_page,
+        }
 
         # Bottom nav pill
         self.nav_buttons: dict[str, ctk.CTkButton] = {}
@@ -1226,9 +4985,14 @@ class HelixApp(ctk.CTk):
         make_nav_btn("Messages", 110)
         make_nav_btn("Quick Fix", 100)
 
-        self.widget = FloatingWidget(self)
-
     # ---------- PAGES ----------
+    def ensure_page(self, name: str):
+        """Build a page's widgets the first time it is needed."""
+        if name in self.built_pages:
+            return
+        self.built_pages.add(name)
+        self.page_builders[name](self.pages[name])
+
     def _setup_talk_page(self, tab: ctk.CTkFrame):
         tab.grid_rowconfigure(0, weight=1)
         tab.grid_rowconfigure(1, weight=0)
@@ -1242,7 +5006,7 @@ class HelixApp(ctk.CTk):
         center.place(relx=0.5, rely=0.45, anchor="center")
 
         try:
-            icon = ctk.CTkImage(light_image=Image.open(asset_path(LOGO_FILENAME)), size=(80, 80))
+            icon = ASSETS.logo(80, scale=center._get_widget_scaling())
             ctk.CTkLabel(center, text="", image=icon).pack(pady=(0, 20))
         except Exception:
             pass
@@ -1277,14 +5041,10 @@ class HelixApp(ctk.CTk):
             r, c = divmod(i, 2)
             btn.grid(row=r, column=c, padx=8, pady=8)
 
-        # chat scroll (hidden until messages)
-        self.chat_scroll = ctk.CTkScrollableFrame(tab, fg_color="transparent")
-        self.chat_scroll.grid(row=0, column=0, sticky="nsew", padx=120, pady=(40, 120))
-        self.chat_scroll.grid_columnconfigure(0, weight=1)
-        self.chat_scroll.grid_remove()
-
-        self.chat_rows: list[BubbleMessage] = []
-        self.chat_row_index = 0
+        # chat transcript (hidden until messages); only on-screen bubbles exist as widgets
+        self.transcript = ChatTranscript(tab, bg=BG_DARK)
+        self.transcript.grid(row=0, column=0, sticky="nsew", padx=120, pady=(40, 120))
+        self.transcript.grid_remove()
 
         # input island
         input_wrapper = ctk.CTkFrame(tab, fg_color="transparent")
@@ -1334,14 +5094,6 @@ class HelixApp(ctk.CTk):
         )
         self.btn_send.pack(side="right", padx=10)
 
-        # adjust wraplength dynamically on resize
-        def on_resize(_):
-            max_w = max(420, min(780, tab.winfo_width() - 240))
-            for msg in self.chat_rows:
-                msg.set_wraplength(max_w)
-
-        tab.bind("<Configure>", on_resize)
-
     def _setup_notebook_page(self, tab: ctk.CTkFrame):
         # Renamed visual to "Canvas" but internal logic remains notebook-based for now
         tab.grid_columnconfigure(0, weight=1) # Full width editor
@@ -1362,8 +5114,9 @@ class HelixApp(ctk.CTk):
         ctk.CTkButton(btn_row, text="Draft Mode", width=90, height=35, corner_radius=17, fg_color=BG_CARD, hover_color=BG_DARK,
                       command=self.open_canvas_drafting).pack(side="left", padx=5)
 
-        ctk.CTkButton(btn_row, text="Save", width=70, height=35, corner_radius=17, fg_color=BG_CARD, hover_color=BG_DARK,
-                      command=self.notebook_save).pack(side="left", padx=5)
+        self.btn_note_save = ctk.CTkButton(btn_row, text="Save", width=70, height=35, corner_radius=17, fg_color=BG_CARD, hover_color=BG_DARK,
+                                           command=self.notebook_save)
+        self.btn_note_save.pack(side="left", padx=5)
 
         self.notebook = ctk.CTkTextbox(editor, font=FONT_NORMAL, fg_color="transparent", wrap="word")
         self.notebook.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=30, pady=(0, 0))
@@ -1379,9 +5132,6 @@ class HelixApp(ctk.CTk):
         ctk.CTkButton(ai_bar, text="Run", width=60, height=40, corner_radius=20, fg_color=HELIX_PURPLE, text_color="black",
                       command=self.notebook_ai_run).pack(side="right", padx=10)
 
-        # Drafting Overlay
-        self.canvas_overlay = None
-
     def open_canvas_drafting(self):
         if self.canvas_overlay: return
         self.canvas_overlay = CanvasDraftingOverlay(self.pages["Canvas"], self, self.notebook.get("0.0", "end").strip())
@@ -1401,8 +5151,8 @@ class HelixApp(ctk.CTk):
         ctk.CTkLabel(self.dm_list, text="Messages", font=FONT_BOLD).pack(pady=20)
         ctk.CTkButton(self.dm_list, text="+ New DM", width=180, height=35, fg_color=BG_CARD, command=self.dm_new_contact).pack(pady=10)
 
-        self.dm_scroll = ctk.CTkScrollableFrame(self.dm_list, fg_color="transparent")
-        self.dm_scroll.pack(fill="both", expand=True)
+        self.dm_contact_list = KeyedList(self.dm_list, on_open=lambda _kind, cid: self.dm_load_thread(cid), bg=BG_SIDEBAR)
+        self.dm_contact_list.pack(fill="both", expand=True)
 
         # CENTER: Chat
         self.dm_chat_area = ctk.CTkFrame(tab, fg_color=BG_DARK, corner_radius=0)
@@ -1410,8 +5160,8 @@ class HelixApp(ctk.CTk):
         self.dm_chat_area.grid_rowconfigure(0, weight=1)
         self.dm_chat_area.grid_columnconfigure(0, weight=1)
 
-        self.dm_msgs_scroll = ctk.CTkScrollableFrame(self.dm_chat_area, fg_color="transparent")
-        self.dm_msgs_scroll.grid(row=0, column=0, sticky="nsew", pady=(0, 10))
+        self.dm_thread = DMThreadView(self.dm_chat_area, on_need_older=self.dm_load_older, bg=BG_DARK)
+        self.dm_thread.grid(row=0, column=0, sticky="nsew", pady=(0, 10))
 
         self.dm_input = ctk.CTkTextbox(self.dm_chat_area, height=60, font=FONT_NORMAL)
         self.dm_input.grid(row=1, column=0, sticky="ew")
@@ -1426,44 +5176,105 @@ class HelixApp(ctk.CTk):
         self.dm_draft_panel = ctk.CTkFrame(tab, width=250, fg_color=BG_SIDEBAR, corner_radius=0)
         # Grid it later when toggled
 
-        self.dm_current_contact = None
-        self.dm_draft_visible = False
-
     def dm_new_contact(self):
         # Stub: just add a fake one for now
-        cid = db.add_contact(self.current_user, f"User {random.randint(100,999)}")
-        self.dm_refresh_list()
-        self.dm_load_thread(cid)
+        name = f"User {random.randint(100,999)}"
+
+        def added(cid):
+            if self.dm_contacts is None:
+                self.dm_refresh_list()
+            else:
+                self.dm_contacts.insert(0, (cid, name, "New Chat"))
+                self.dm_render_contacts()
+            self.dm_load_thread(cid)
+
+        self.bg.submit(db.add_contact, self.current_user, name, on_done=added, ordered=True)
 
     def dm_refresh_list(self):
-        for w in self.dm_scroll.winfo_children(): w.destroy()
-        contacts = db.get_contacts(self.current_user)
-        for cid, name, last in contacts:
-            btn = ctk.CTkButton(self.dm_scroll, text=f"{name}\n{last}", height=50, fg_color="transparent", anchor="w", command=lambda x=cid: self.dm_load_thread(x))
-            btn.pack(fill="x", pady=2)
+        user = self.current_user
+        if self.dm_contacts is None:
+            self.dm_contact_list.set_rows([("h:loading", "header", "Loading…")])
+
+        def loaded(contacts):
+            if user == self.current_user:
+                self.dm_contacts = list(contacts)
+                self.dm_render_contacts()
+
+        self.bg.submit(db.get_contacts, user, on_done=loaded)
+
+    def dm_render_contacts(self):
+        self.dm_contact_list.set_rows([(cid, "contact", f"{name}\n{last}") for cid, name, last in self.dm_contacts or []])
+
+    def dm_touch_contact(self, cid, last: str):
+        # Move the contact to the top with its new preview, like ORDER BY updated_at DESC
+        if self.dm_contacts is None:
+            return
+        for i, (c_id, name, _) in enumerate(self.dm_contacts):
+            if c_id == cid:
+                del self.dm_contacts[i]
+                self.dm_contacts.insert(0, (cid, name, last[:30]))
+                self.dm_render_contacts()
+                break
 
     def dm_load_thread(self, contact_id):
         self.dm_current_contact = contact_id
-        for w in self.dm_msgs_scroll.winfo_children(): w.destroy()
-        msgs = db.get_dm_messages(contact_id)
-        for role, content, is_draft in msgs:
-            align = "e" if role == "me" else "w"
-            color = HELIX_PURPLE if role == "me" else BG_CARD
-            lbl = ctk.CTkLabel(self.dm_msgs_scroll, text=content, fg_color=color, corner_radius=10, padx=10, pady=5, wraplength=400)
-            lbl.pack(anchor=align, pady=5, padx=10)
+        view = self.dm_thread
+        view.clear()
+        view.has_more = False
+        view.loading = True # blocks older-page requests until the first page is in
+
+        def loaded(page):
+            if self.dm_current_contact != contact_id:
+                return
+            view.has_more = len(page) == DM_PAGE_SIZE
+            view.loading = False
+            view.set_items(page)
+            view.scroll_to_end()
+
+        self.bg.submit(db.get_dm_messages_page, contact_id, None, DM_PAGE_SIZE, on_done=loaded)
+
+    def dm_load_older(self):
+        view = self.dm_thread
+        cid = self.dm_current_contact
+        if not cid or not view.items:
+            view.loading = False
+            return
+        first = view.items[0]
+
+        def loaded(page):
+            if self.dm_current_contact != cid:
+                return
+            view.has_more = len(page) == DM_PAGE_SIZE
+            view.prepend(page)
+            view.loading = False
+
+        self.bg.submit(db.get_dm_messages_page, cid, (first["timestamp"], first["rowid"]), DM_PAGE_SIZE, on_done=loaded)
 
     def dm_send(self):
         txt = self.dm_input.get("0.0", "end").strip()
         if not txt or not self.dm_current_contact: return
-        db.save_dm_message(self.dm_current_contact, "me", txt)
+        cid = self.dm_current_contact
         self.dm_input.delete("0.0", "end")
-        self.dm_load_thread(self.dm_current_contact)
-        # Simulate reply
-        self.after(1000, lambda: self.dm_receive_sim(self.dm_current_contact))
+        self.dm_touch_contact(cid, txt)
+
+        def saved(msg):
+            if self.dm_current_contact == cid:
+                self.dm_thread.append(msg)
+                self.dm_thread.scroll_to_end()
+            # Simulate reply
+            self.after(1000, lambda: self.dm_receive_sim(cid))
+
+        self.bg.submit(db.save_dm_message, cid, "me", txt, on_done=saved, ordered=True)
 
     def dm_receive_sim(self, cid):
-        db.save_dm_message(cid, "them", "This is a simulated reply.")
-        if self.dm_current_contact == cid: self.dm_load_thread(cid)
+        def saved(msg):
+            if self.dm_current_contact == cid:
+                self.dm_thread.append(msg)
+                if self.dm_thread.stick_to_bottom:
+                    self.dm_thread.scroll_to_end()
+            self.dm_touch_contact(cid, msg["content"])
+
+        self.bg.submit(db.save_dm_message, cid, "them", "This is a simulated reply.", on_done=saved, ordered=True)
 
     def dm_toggle_draft(self):
         self.dm_draft_visible = not self.dm_draft_visible
@@ -1530,12 +5341,16 @@ class HelixApp(ctk.CTk):
         except:
             direction = "right"
 
+        self.ensure_page(tab_name)
         old_frame = self.pages[self.active_tab]
         new_frame = self.pages[tab_name]
 
         self.active_tab = tab_name
         self.animate_slide_page(old_frame, new_frame, direction)
 
+        if tab_name == "Messages" and self.dm_contacts is None and self.current_user:
+            self.dm_refresh_list()
+
         # Sidebar visible on both Talk and Canvas now (Unified Library)
         if tab_name in ["Talk to AI", "Canvas"]:
             self.sidebar.grid()
@@ -1560,43 +5375,94 @@ class HelixApp(ctk.CTk):
         self.animate_overlay_open(self.settings_overlay)
 
     # ---------- AUTH ----------
+    def _show_screen(self, name: str):
+        builders = {"login_frame": self.setup_login_screen, "otp_frame": self.setup_otp_screen, "app_frame": self.setup_main_app}
+        if getattr(self, name) is None:
+            builders[name]()
+        for other in builders:
+            frame = getattr(self, other)
+            if other != name and frame is not None:
+                frame.pack_forget()
+        getattr(self, name).pack(fill="both", expand=True)
+
     def show_login(self):
-        self.app_frame.pack_forget()
-        self.otp_frame.pack_forget()
-        self.login_frame.pack(fill="both", expand=True)
+        self._show_screen("login_frame")
 
     def show_otp(self):
-        self.login_frame.pack_forget()
-        self.otp_frame.pack(fill="both", expand=True)
+        self._show_screen("otp_frame")
 
     def show_app(self):
-        self.login_frame.pack_forget()
-        self.otp_frame.pack_forget()
-        self.app_frame.pack(fill="both", expand=True)
-
-        self.saved_chats = db.load_chats(self.current_user)
-        self.refresh_notebook_list()
-
-        cleaned = {}
-        for cid, cdata in (self.saved_chats or {}).items():
-            if not isinstance(cdata, dict):
-                continue
-            title = str(cdata.get("title", "New Chat"))
-            msgs = cdata.get("msgs", [])
-            if not isinstance(msgs, list):
-                msgs = []
-            cleaned[cid] = {"title": title, "msgs": msgs}
-        self.saved_chats = cleaned
-
-        self.refresh_sidebar()
-        self.create_new_chat()
+        self._show_screen("app_frame")
+        self.ensure_page("Talk to AI")
 
         # Reset pages
+        self.animator.cancel("pages")
+        self.page_x = {}
         for p in self.pages.values(): p.place(relx=1.0, rely=0)
         self.pages["Talk to AI"].place(relx=0, rely=0)
         self.active_tab = "Talk to AI"
         self.switch_tab("Talk to AI") # ensures UI state correct
 
+        # The user's data is read in the background; until then the last snapshot (or a
+        # loading row) is shown and save_history stays disabled.
+        self.workspace_loaded = False
+        self.saved_chats = {}
+        self.notebook_index = []
+        self.current_chat_id = None
+        self.restore_chat_id = None
+        self.last_snapshot = ""
+        self.clear_chat_view()
+        user = self.current_user
+        snap = load_snapshot(user)
+        if snap:
+            self.restore_snapshot(snap)
+        else:
+            self.library.set_rows([("h:loading", "header", "Loading…")])
+
+        def failed(e):
+            if user == self.current_user:
+                self.library.set_rows([("h:loading", "header", "Could not load library")])
+                messagebox.showerror("Error", f"Could not load your data: {e}")
+
+        self.bg.submit(self._load_workspace, user, on_done=lambda data: self._workspace_loaded(user, data), on_error=failed)
+
+    @staticmethod
+    def _load_workspace(user: str):
+        return db.load_chats(user), db.load_notebooks_list(user), db.get_token_balance(user)
+
+    def _workspace_loaded(self, user: str, data):
+        if user != self.current_user:
+            return # logged out (or switched user) while loading
+        chats, notebooks, balance = data
+        self.notebook_index = list(notebooks)
+        self.token_balance = balance
+        self.core.set_chats(chats)
+        self.workspace_loaded = True
+
+        self.refresh_sidebar()
+        # Reconcile the chat shown from the snapshot (or opened meanwhile) with the real data
+        restore = self.restore_chat_id
+        self.restore_chat_id = None
+        if restore in self.saved_chats:
+            msgs = self.saved_chats[restore].get("msgs", [])
+            shown = [(e.role, e.text) for e in self.transcript.items] if self.current_chat_id == restore else None
+            wanted = [("user" if m.get("role") == "user" else "assistant", str(m.get("content", ""))) for m in msgs]
+            if shown != wanted:
+                self.load_chat(restore)
+            self.current_chat_id = restore
+        else:
+            self.create_new_chat()
+
+    def set_session(self, token: str):
+        self.session_token = token
+        if DB_URL:
+            db.use_session(token) # shared storage acts for this user; cheap, no connection is made
+
+    def _session_checked(self, token: str, email: str | None):
+        # Revoked or expired elsewhere: sign out unless the user already moved on
+        if token == self.session_token and email != self.current_user:
+            self.do_logout()
+
     def do_login(self):
         email = self.var_email.get().strip()
         p = self.var_pass.get()
@@ -1605,21 +5471,47 @@ class HelixApp(ctk.CTk):
             messagebox.showerror("Error", "Missing email or password.")
             return
 
-        success, tokens = db.login(email, p)
-        if success:
-            self.current_user = email
-            self.token_balance = tokens
-            save_session(email)
-            self.show_app()
-        else:
-            messagebox.showerror("Error", "Login failed.")
+        def done(result):
+            self.set_auth_busy(False)
+            success, tokens, token = result
+            if success:
+                self.current_user = email
+                self.set_session(token)
+                self.token_balance = tokens
+                save_session(email, token)
+                self.show_app()
+            else:
+                messagebox.showerror("Error", "Login failed.")
+
+        def failed(e):
+            self.set_auth_busy(False)
+            messagebox.showerror("Error", f"Login failed: {e}")
+
+        # bcrypt.checkpw is deliberately slow; keep it off the Tk thread
+        self.set_auth_busy(True, "Logging in…")
+        self.bg.submit(db.open_session, email, p, on_done=done, on_error=failed)
 
     def do_logout(self):
+        if self.session_token:
+            self.bg.submit(db.delete_session, self.session_token, ordered=True)
+            self.session_token = None
         clear_session()
-        self.current_user = None
+        clear_snapshot()
+        for timer in self.memory_timers.values():
+            try:
+                self.after_cancel(timer)
+            except Exception:
+                pass
+        self.memory_timers = {}
+        self.core.reset()
+        self.workspace_loaded = False
         self.token_balance = 0
-        self.saved_chats = {}
         self.current_chat_id = None
+        self.dm_contacts = None
+        self.dm_current_contact = None
+        if "Messages" in self.built_pages:
+            self.dm_contact_list.set_rows([])
+            self.dm_thread.clear()
         self.clear_chat_view()
         self.show_login()
 
@@ -1630,83 +5522,121 @@ class HelixApp(ctk.CTk):
         if not self.pending_email or not self.pending_pass:
             messagebox.showerror("Error", "Missing email or password.")
             return
-        if db.check_exists(self.pending_email):
-            messagebox.showerror("Error", "Account already exists.")
-            return
 
-        self.pending_otp = str(random.randint(100000, 999999))
+        def checked(exists):
+            self.set_auth_busy(False)
+            if exists:
+                messagebox.showerror("Error", "Account already exists.")
+                return
+
+            email = self.pending_email
+
+            def deliver():
+                # Queue the code, then report whether it actually went out
+                status, info = "error", None
+                try:
+                    status, mid = send_signup_code(email)
+                    if mid and not DB_URL and not mailer.can_send():
+                        info = {"status": "failed", "error": "outgoing mail isn't set up (HELIX_SMTP_USER, HELIX_SMTP_PASSWORD)"}
+                    else:
+                        info = mailer.wait(mid) if mid else None
+                except Exception as e:
+                    if status == "error":
+                        info = {"status": "failed", "error": str(e)}
+                self.after(0, lambda: self.otp_delivery(email, status, info))
+
+            threading.Thread(target=deliver, daemon=True).start()
+            self.show_otp()
+            self.set_otp_status("Sending code…")
+            self.entry_otp.delete(0, "end")
 
-        def send():
-            send_otp_email(self.pending_email, self.pending_otp)
+        def failed(e):
+            self.set_auth_busy(False)
+            messagebox.showerror("Error", str(e))
 
-        threading.Thread(target=send, daemon=True).start()
-        self.entry_otp.delete(0, "end")
-        self.show_otp()
+        self.set_auth_busy(True, "Checking…")
+        self.bg.submit(db.check_exists, self.pending_email, on_done=checked, on_error=failed)
+
+    def set_otp_status(self, text: str, error: bool = False):
+        self.lbl_otp_status.configure(text=text, text_color="#ff5555" if error else TEXT_GRAY)
+
+    def otp_delivery(self, email: str, status: str, info: dict | None):
+        if email != self.pending_email or self.current_user:
+            return
+        if status == "exists":
+            self.set_otp_status("An account with this email already exists.", error=True)
+        elif status == "limited":
+            self.set_otp_status("Too many codes sent to this address. Use the last one, or wait a few minutes.", error=True)
+        elif info and info["status"] == "sent":
+            self.set_otp_status(f"Code sent to {email}.")
+        elif info and info["status"] == "failed":
+            self.set_otp_status(f"Couldn't send the code: {info['error']}", error=True)
+        else:
+            last = f" Last error: {info['error']}" if info and info.get("error") else ""
+            self.set_otp_status("Still trying to send the code…" + last)
 
     def verify_otp(self):
-        if self.entry_otp.get().strip() != self.pending_otp:
-            messagebox.showerror("Error", "Invalid code.")
+        code = self.entry_otp.get().strip()
+        if not code:
+            messagebox.showerror("Error", "Enter the code from the email.")
             return
 
-        ok, msg = db.register_final(self.pending_email, self.pending_pass)
-        if not ok:
-            messagebox.showerror("Error", msg)
+        if self.auth_busy:
             return
 
-        self.current_user = self.pending_email
-        self.token_balance = INITIAL_TOKENS
-        save_session(self.current_user)
-        self.show_app()
+        email, password = self.pending_email, self.pending_pass
 
-    # ---------- SIDEBAR / LIBRARY ----------
-    def refresh_sidebar(self):
-        for w in self.library_scroll.winfo_children():
-            w.destroy()
+        def done(result):
+            self.set_auth_busy(False)
+            ok, msg, token = result
+            if not ok:
+                messagebox.showerror("Error", msg)
+                return
 
-        # CHATS SECTION
-        ctk.CTkLabel(self.library_scroll, text="CHATS", font=("Google Sans", 11, "bold"), text_color="#555").pack(anchor="w", padx=15, pady=(10, 5))
+            self.current_user = email
+            self.set_session(token)
+            self.token_balance = INITIAL_TOKENS
+            save_session(email, token)
+            self.show_app()
 
-        ids = list(self.saved_chats.keys())[::-1]
-        for c_id in ids:
-            title = self.saved_chats[c_id].get("title", "New Chat")
-            title = str(title).strip() or "New Chat"
-            display = title if len(title) <= 24 else title[:24] + "…"
+        def failed(e):
+            self.set_auth_busy(False)
+            messagebox.showerror("Error", str(e))
 
-            btn = ctk.CTkButton(
-                self.library_scroll,
-                text="💬 " + display,
-                anchor="w",
-                fg_color="transparent",
-                hover_color=BG_CARD,
-                height=35,
-                corner_radius=8,
-                font=FONT_NORMAL,
-                text_color="#CCC",
-                command=lambda x=c_id: self.load_chat(x),
-            )
-            btn.pack(fill="x", pady=1, padx=6)
-            btn.bind("<Button-3>", lambda e, cid=c_id: self.show_chat_context_menu(e, cid))
+        # Storage checks the code; bcrypt.hashpw runs in the background
+        self.set_auth_busy(True, "Creating account…")
+        self.bg.submit(db.register_final, email, password, code, on_done=done, on_error=failed, ordered=True)
 
-        # CANVAS SECTION
-        ctk.CTkLabel(self.library_scroll, text="CANVASES", font=("Google Sans", 11, "bold"), text_color="#555").pack(anchor="w", padx=15, pady=(20, 5))
+    # ---------- SIDEBAR / LIBRARY ----------
+    def refresh_sidebar(self):
+        # Coalesce bursts (auto-title + save + branch...) into one reconcile pass.
+        if self._sidebar_job is None:
+            self._sidebar_job = self.after_idle(self._reconcile_sidebar)
+
+    def _reconcile_sidebar(self):
+        self._sidebar_job = None
+        self.library.set_rows(self._library_rows())
+
+    def _library_rows(self) -> list[tuple[str, str, str]]:
+        rows = [("h:chats", "header", "CHATS")]
+        for c_id in reversed(list(self.saved_chats.keys())):
+            title = str(self.saved_chats[c_id].get("title", "New Chat")).strip() or "New Chat"
+            display = title if len(title) <= 24 else title[:24] + "…"
+            rows.append((c_id, "chat", "💬 " + display))
 
+        rows.append(("h:canvases", "header", "CANVASES"))
         if self.current_user:
-            notebooks = db.load_notebooks_list(self.current_user)
-            for nid, title in notebooks:
-                display = title or "Untitled"
-                btn = ctk.CTkButton(
-                    self.library_scroll,
-                    text="📝 " + display,
-                    anchor="w",
-                    fg_color="transparent",
-                    hover_color=BG_CARD,
-                    height=35,
-                    corner_radius=8,
-                    font=FONT_NORMAL,
-                    text_color="#CCC",
-                    command=lambda x=nid: self.load_notebook(x),
-                )
-                btn.pack(fill="x", pady=1, padx=6)
+            for nid, title in self.notebook_index:
+                rows.append((nid, "note", "📝 " + (title or "Untitled")))
+        return rows
+
+    def open_library_item(self, kind: str, key: str):
+        if kind == "chat" and not self.workspace_loaded:
+            self.restore_chat_id = key # listed from the snapshot; opened once chats are loaded
+        elif kind == "chat":
+            self.load_chat(key)
+        elif kind == "note":
+            self.load_notebook(key)
 
     def show_chat_context_menu(self, event, chat_id: str):
         menu = tk.Menu(self, tearoff=0)
@@ -1727,49 +5657,36 @@ class HelixApp(ctk.CTk):
             return
         if not messagebox.askyesno("Delete chat", "Delete this chat?"):
             return
-        del self.saved_chats[chat_id]
+        self.core.delete_chat(chat_id)
         if self.current_chat_id == chat_id:
             self.create_new_chat()
         self.save_history()
         self.refresh_sidebar()
 
     def branch_chat(self, chat_id: str):
-        if chat_id not in self.saved_chats:
+        if self.core.branch_chat(chat_id) is None:
             return
-        src = self.saved_chats[chat_id]
-        new_id = str(uuid.uuid4())
-        new_title = f"Branch: {src.get('title', 'Chat')}"
-        new_msgs = list(src.get("msgs", []))
-        self.saved_chats[new_id] = {"title": new_title, "msgs": new_msgs}
         self.save_history()
         self.refresh_sidebar()
 
     # ---------- CHAT VIEW ----------
     def clear_chat_view(self):
-        if hasattr(self, "chat_scroll"):
-            for w in self.chat_scroll.winfo_children():
-                w.destroy()
-        self.chat_rows = []
-        self.chat_row_index = 0
-        if hasattr(self, "chat_scroll"):
-            self.chat_scroll.grid_remove()
+        if hasattr(self, "transcript"):
+            self.transcript.clear()
+            self.transcript.grid_remove()
         if hasattr(self, "welcome_frame"):
             self.welcome_frame.grid()
 
     def _ensure_chat_visible(self):
         self.welcome_frame.grid_remove()
-        self.chat_scroll.grid()
+        self.transcript.grid()
         self.scroll_chat_to_bottom()
 
-    def add_message(self, role: str, text: str) -> BubbleMessage:
+    def add_message(self, role: str, text: str) -> TranscriptEntry:
         self._ensure_chat_visible()
-        tab = self.pages["Talk to AI"]
-        max_w = max(420, min(780, tab.winfo_width() - 240))
-        msg = BubbleMessage(self.chat_scroll, role=role, text=text, max_width_px=max_w).grid(self.chat_row_index)
-        self.chat_row_index += 1
-        self.chat_rows.append(msg)
+        entry = self.transcript.add_entry(role, text)
         self.scroll_chat_to_bottom()
-        return msg
+        return entry
 
     def load_chat(self, chat_id: str):
         self.current_chat_id = chat_id
@@ -1778,54 +5695,119 @@ class HelixApp(ctk.CTk):
         msgs = data.get("msgs", [])
         if msgs:
             self._ensure_chat_visible()
-        for m in msgs:
-            role = "user" if m.get("role") == "user" else "assistant"
-            self.add_message(role, str(m.get("content", "")))
+            self.transcript.load_entries([
+                ("user" if m.get("role") == "user" else "assistant", str(m.get("content", ""))) for m in msgs
+            ])
+            self.scroll_chat_to_bottom()
 
     def create_new_chat(self):
-        new_id = str(uuid.uuid4())
-        self.saved_chats[new_id] = {"title": "New Chat", "msgs": []}
-        self.current_chat_id = new_id
+        self.current_chat_id = self.core.new_chat()
         self.clear_chat_view()
         self.save_history()
         self.refresh_sidebar()
 
     # ---------- NOTEBOOK ----------
     def notebook_new(self):
+        self.ensure_page("Canvas")
+        self._set_note_loading(None)
         self.current_note_id = str(uuid.uuid4())
         self.note_title.delete(0, "end")
         self.note_title.insert(0, "Untitled")
         self.notebook.delete("0.0", "end")
-        self.refresh_notebook_list()
+        self.refresh_sidebar()
         self.switch_tab("Canvas") # Auto switch to canvas when created
 
     def notebook_save(self):
+        self.ensure_page("Canvas")
+        if self.note_loading:
+            return # the editor still shows a placeholder, not the canvas
         if not self.current_note_id:
             self.current_note_id = str(uuid.uuid4())
-        db.save_notebook(self.current_note_id, self.current_user, self.note_title.get().strip() or "Untitled",
-                         self.notebook.get("0.0", "end").strip())
-        self.refresh_notebook_list()
+        title = self.note_title.get().strip() or "Untitled"
+        content = self.notebook.get("0.0", "end").strip()
 
-    def refresh_notebook_list(self):
-        # Now handled by refresh_sidebar since it's the unified library
+        btn = self.btn_note_save
+        btn.configure(text="Saving…", state="disabled")
+
+        def done(_):
+            btn.configure(text="Save", state="normal")
+
+        def failed(e):
+            done(None)
+            messagebox.showerror("Error", f"Could not save canvas: {e}")
+
+        self.bg.submit(db.save_notebook, self.current_note_id, self.current_user, title, content,
+                       on_done=done, on_error=failed, ordered=True)
+        self.notebook_chunks.update(self.current_note_id, title, content)
+        # Keep the cached listing in updated_at order without re-querying it
+        self.notebook_index = [(self.current_note_id, title)] + [n for n in self.notebook_index if n[0] != self.current_note_id]
         self.refresh_sidebar()
 
-    def load_notebook(self, nid: str):
+    def refresh_notebook_list(self):
+        # Reload the canvas listing; the unified library sidebar renders it
+        user = self.current_user
+        if not user:
+            self.notebook_index = []
+            self.refresh_sidebar()
+            return
+
+        def loaded(rows):
+            if user == self.current_user:
+                self.notebook_index = list(rows)
+                self.refresh_sidebar()
+
+        self.bg.submit(db.load_notebooks_list, user, on_done=loaded)
+
+    def _set_note_loading(self, nid: str | None):
+        self.note_loading = nid
+        self.notebook.configure(state="disabled" if nid else "normal")
+
+    def load_notebook(self, nid: str, on_loaded=None):
+        self.ensure_page("Canvas")
         self.current_note_id = nid
-        t, c = db.load_notebook_content(nid)
+        self._set_note_loading(None)
         self.note_title.delete(0, "end")
-        self.note_title.insert(0, t)
+        self.note_title.insert(0, "Loading…")
         self.notebook.delete("0.0", "end")
-        self.notebook.insert("0.0", c)
+        self._set_note_loading(nid)
         self.switch_tab("Canvas")
 
+        def loaded(result):
+            if self.note_loading != nid:
+                return # another canvas was opened meanwhile
+            t, c = result
+            self._set_note_loading(None)
+            self.note_title.delete(0, "end")
+            self.note_title.insert(0, t)
+            self.notebook.insert("0.0", c)
+            if on_loaded:
+                on_loaded()
+
+        def failed(e):
+            if self.note_loading == nid:
+                self._set_note_loading(None)
+                messagebox.showerror("Error", f"Could not open canvas: {e}")
+
+        self.bg.submit(db.load_notebook_content, nid, on_done=loaded, on_error=failed)
+
+    def show_notebook_range(self, nid: str, start: int, end: int):
+        # Offsets index the saved content, which is exactly what load_notebook inserts.
+        def highlight():
+            self.notebook.tag_config("context_range", background="#2B3A55")
+            self.notebook.tag_remove("context_range", "1.0", "end")
+            self.notebook.tag_add("context_range", f"1.0 + {start} chars", f"1.0 + {end} chars")
+            self.notebook.see(f"1.0 + {start} chars")
+
+        self.load_notebook(nid, on_loaded=highlight)
+
     # ---------- QUICK FIX ----------
     def start_quick_fix(self, text: str):
+        self.ensure_page("Quick Fix")
         self.switch_tab("Quick Fix")
         self.q_result.delete("0.0", "end")
         threading.Thread(
             target=self.run_ai_stream,
-            args=([{"role": "system", "content": PROMPTS["Fix"]}, {"role": "user", "content": text}], self.q_result, False),
+            args=(self.core.fix_messages(text), self.q_result, False),
             daemon=True,
         ).start()
 
@@ -1841,11 +5823,7 @@ class HelixApp(ctk.CTk):
 
         threading.Thread(
             target=self.run_ai_stream,
-            args=(
-                [{"role": "system", "content": f"Editor. Instruction: {instruction}"}, {"role": "user", "content": current}],
-                self.q_result,
-                False,
-            ),
+            args=(self.core.custom_fix_messages(instruction, current), self.q_result, False),
             daemon=True,
         ).start()
 
@@ -1860,105 +5838,48 @@ class HelixApp(ctk.CTk):
     def change_model(self, v):
         self.current_model_key = v
 
-    # ---------- PROMPTS ----------
-    def get_system_prompt(self, key: str) -> str:
-        base = PROMPTS.get(key, "")
-        try:
-            mems = db.get_memories(self.current_user)
-            if mems:
-                base += "\nMemories:\n" + "\n".join([m[1] for m in mems])
-        except Exception:
-            pass
-
-        if self.attach_notebook_to_chat and self.current_note_id:
-            try:
-                base += f"\nNotebook:\n{db.load_notebook_content(self.current_note_id)[1]}"
-            except Exception:
-                pass
-
-        # RAG Implementation
-        if self.use_notebook_context:
-            try:
-                # Naive Retrieval: Fetch all notes and match keywords
-                # In production, use vector embeddings (e.g. chromadb)
-                notes = db.load_notebooks_list(self.current_user)
-                relevant_text = []
-                # prompt isn't passed here, but we can't easily get it without refactoring.
-                # Heuristic: Just dump recently modified notes if context is on.
-                # A better approach requires passing the prompt to this function.
-                # Let's limit to top 3 recent notes for context window safety.
-                for nid, title in notes[:3]:
-                    _, content = db.load_notebook_content(nid)
-                    if content.strip():
-                        relevant_text.append(f"--- Note: {title} ---\n{content[:500]}...") # Truncate
-
-                if relevant_text:
-                    base += "\n\n[Context from Notebooks]:\n" + "\n".join(relevant_text)
-            except Exception:
-                pass
-
-        return base
-
     # ---------- CHAT SEND ----------
     def send_chat(self, text: str | None = None):
         msg = text if text is not None else self.chat_entry.get("0.0", "end").strip()
         if not msg or getattr(self.chat_entry, "has_placeholder", False):
             return
+        if not self.workspace_loaded:
+            return # chats are still loading; keep the draft in the box
 
         if not self.current_chat_id:
             self.create_new_chat()
 
         self.chat_entry.delete("0.0", "end")
         self.setup_textbox_placeholder(self.chat_entry, "Ask Helix anything...", self.send_chat)
+        self.cancel_memory_extraction(self.current_chat_id)
 
+        chat_id = self.current_chat_id
         self.add_message("user", msg)
-        self.saved_chats[self.current_chat_id]["msgs"].append({"role": "user", "content": msg})
+        self.core.add_user_message(chat_id, msg)
 
-        if len(self.saved_chats[self.current_chat_id]["msgs"]) == 1:
-            self._auto_title_chat(self.current_chat_id, msg)
+        if len(self.saved_chats[chat_id]["msgs"]) == 1:
+            self._auto_title_chat(chat_id, msg)
 
         self.save_history()
 
         assistant_widget = self.add_message("assistant", "")
+        threading.Thread(target=self.run_chat_turn, args=(chat_id, msg, assistant_widget), daemon=True).start()
 
-        threading.Thread(
-            target=self.run_ai_stream,
-            args=([{"role": "system", "content": self.get_system_prompt("Chat")}, {"role": "user", "content": msg}], assistant_widget, True),
-            daemon=True,
-        ).start()
+    def run_chat_turn(self, chat_id: str, msg: str, widget: TranscriptEntry):
+        # The prompt reads memories and notebooks from storage, so it is built here rather than on the Tk thread
+        request = self.core.chat_request(msg)
+        refs = list(self.core.context_refs)
+        if refs:
+            self.after(0, lambda: widget.set_sources(refs, self.show_notebook_range))
+        self.run_ai_stream(request, widget, True, chat_id)
 
     def _auto_title_chat(self, chat_id: str, first_prompt: str):
-        def heuristic_title(text: str) -> str:
-            t = " ".join(text.strip().split())
-            if not t:
-                return "New Chat"
-            if len(t) <= 42:
-                return t
-            return t[:42].rstrip() + "…"
-
         def generate():
-            title = None
-            try:
-                resp = client.chat.completions.create(
-                    model=MODEL_CONFIG["Standard"]["id"],
-                    messages=[
-                        {"role": "system", "content": "Create a short chat title (2-5 words). Output ONLY the title."},
-                        {"role": "user", "content": first_prompt},
-                    ],
-                    temperature=0.2,
-                    stream=False,
-                    max_tokens=24,
-                )
-                title = (resp.choices[0].message.content or "").strip().strip('"')
-            except Exception:
-                title = None
-
-            if not title:
-                title = heuristic_title(first_prompt)
+            title = self.core.suggest_title(first_prompt)
 
             def apply():
                 if chat_id in self.saved_chats:
-                    self.saved_chats[chat_id]["title"] = title
+                    self.core.rename_chat(chat_id, title)
                     self.save_history()
                     self.refresh_sidebar()
 
@@ -1966,46 +5887,79 @@ class HelixApp(ctk.CTk):
 
         threading.Thread(target=generate, daemon=True).start()
 
+    # ---------- MEMORY EXTRACTION ----------
+    def cancel_memory_extraction(self, chat_id: str | None):
+        timer = self.memory_timers.pop(chat_id, None)
+        if timer:
+            try:
+                self.after_cancel(timer)
+            except Exception:
+                pass
+
+    def schedule_memory_extraction(self, chat_id: str | None):
+        # Restart the idle countdown; extraction only runs once the chat goes quiet.
+        if not chat_id or not self.auto_memories:
+            return
+        self.cancel_memory_extraction(chat_id)
+        self.memory_timers[chat_id] = self.after(MEMORY_IDLE_MS, lambda: self._extract_chat_memories(chat_id))
+
+    def _extract_chat_memories(self, chat_id: str):
+        self.memory_timers.pop(chat_id, None)
+
+        def done(email, end):
+            def apply():
+                if self.core.mark_memories_extracted(email, chat_id, end):
+                    self.save_history()
+            self.after(0, apply)
+
+        self.core.extract_chat_memories(chat_id, done)
+
     # ---------- AI STREAM ----------
-    def run_ai_stream(self, msgs, widget, is_chat: bool):
+    def run_ai_stream(self, msgs, widget, is_chat: bool, chat_id: str | None = None):
+        purpose = "chat" if is_chat else ("notebook" if widget is getattr(self, "notebook", None) else "fix")
+        stream = self.core.stream(msgs, purpose)
         try:
-            full_response = ""
-
-            if isinstance(widget, BubbleMessage):
-                self.after(0, lambda: widget.set_text(""))
+            if isinstance(widget, TranscriptEntry):
+                self.after(0, lambda: widget.set_text("", streaming=True))
             else:
                 self.after(0, lambda: widget.delete("0.0", "end"))
 
-            stream = client.chat.completions.create(
-                model=MODEL_CONFIG[self.current_model_key]["id"],
-                messages=msgs,
-                temperature=0.7,
-                stream=True,
-            )
-            for chunk in stream:
-                delta = chunk.choices[0].delta
-                if hasattr(delta, "content") and delta.content:
-                    c = delta.content
-                    full_response += c
-                    if isinstance(widget, BubbleMessage):
-                        self.after(0, lambda x=c: (widget.append_text(x), self.scroll_chat_to_bottom()))
-                    else:
-                        self.after(0, lambda x=c: widget.insert("end", x))
-
-            if is_chat and self.current_chat_id and isinstance(widget, BubbleMessage):
-                self.saved_chats[self.current_chat_id]["msgs"].append({"role": "assistant", "content": full_response})
+            trace = stream.trace
+            for c in stream:
+                arrived = time.perf_counter() if trace.on else None
+                if isinstance(widget, TranscriptEntry):
+                    self.after(0, lambda x=c, t=arrived: (widget.append_text(x), self.scroll_chat_to_bottom(), trace.flushed(t)))
+                else:
+                    self.after(0, lambda x=c, t=arrived: (widget.insert("end", x), trace.flushed(t)))
+
+            full_response = stream.text
+            if chat_id and isinstance(widget, TranscriptEntry):
+                self.core.finish_chat_turn(chat_id, full_response)
                 self.after(0, self.save_history)
-
-            self.after(0, lambda: self.charge_tokens_for_words(full_response))
+                self.after(0, lambda: self.schedule_memory_extraction(chat_id))
+        except AdmissionDenied as e:
+            # `e` is unbound once the except block ends, before the callback runs
+            msg = str(e)
+            if isinstance(widget, TranscriptEntry):
+                self.after(0, lambda m=msg: widget.set_text(f"[{m}]"))
+            else:
+                self.after(0, lambda m=msg: widget.insert("end", f"\n[{m}]"))
         except Exception as e:
-            if isinstance(widget, BubbleMessage):
-                self.after(0, lambda: widget.set_text(f"[Error: {e}]"))
+            msg = str(e)
+            if isinstance(widget, TranscriptEntry):
+                self.after(0, lambda m=msg: widget.set_text(f"[Error: {m}]"))
             else:
-                self.after(0, lambda: widget.insert("end", f"\n[Error: {e}]"))
+                self.after(0, lambda m=msg: widget.insert("end", f"\n[Error: {m}]"))
+        finally:
+            if isinstance(widget, TranscriptEntry):
+                self.after(0, widget.finish)
+            # The stream settled its reservation, so the balance is current
+            if stream.balance is not None:
+                self.after(0, lambda: self.show_balance(stream.user, stream.balance))
 
-    def charge_tokens_for_words(self, text: str):
-        c = len(text.split()) * int(MODEL_CONFIG[self.current_model_key]["cost_multiplier"])
-        self.token_balance = db.deduct_tokens(self.current_user, c)
+    def show_balance(self, user: str | None, balance: int):
+        if user == self.current_user:
+            self.token_balance = balance
 
     # ---------- NOTEBOOK AI ----------
     def notebook_ai_run(self):
@@ -2017,11 +5971,7 @@ class HelixApp(ctk.CTk):
 
         threading.Thread(
             target=self.run_ai_stream,
-            args=(
-                [{"role": "system", "content": f"Editor. Inst: {p}"}, {"role": "user", "content": self.notebook.get('0.0', 'end')}],
-                self.notebook,
-                False,
-            ),
+            args=(self.core.notebook_edit_messages(p, self.notebook.get("0.0", "end")), self.notebook, False),
             daemon=True,
         ).start()
 
@@ -2033,15 +5983,874 @@ class HelixApp(ctk.CTk):
             self.show_login()
             return
         if mode == "clipboard":
+            import pyperclip
             self.start_quick_fix(pyperclip.paste())
 
     # ---------- PERSIST ----------
     def save_history(self):
-        if self.current_user:
-            db.save_chats(self.current_user, self.saved_chats)
+        # Saving before the user's chats are loaded would overwrite them with an empty set.
+        # Only chats changed here are written, so ones the API saved meanwhile survive.
+        if self.current_user and self.workspace_loaded:
+            changed, deleted = self.core.take_chat_changes()
+            if changed or deleted:
+                self.bg.submit(db.update_chats, self.current_user, changed, deleted, ordered=True)
+
+
+# =========================
+# API SERVER (headless)
+# =========================
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class ApiRequest:
+    def __init__(self, method: str, path: str, headers: dict, body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.email: str | None = None
+        self.db = None # storage acting for this request's user, once authenticated
+
+    def json(self) -> dict:
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise ApiError(400, "body is not valid JSON")
+        if not isinstance(data, dict):
+            raise ApiError(400, "body must be a JSON object")
+        return data
+
+class HttpService:
+    """Small HTTP/1.1 server on asyncio with a fixed thread pool for blocking calls.
+
+    Subclasses implement dispatch(), which answers one request and returns False once
+    it has taken over the connection (a stream that closes when done).
+    """
+
+    REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 401: "Unauthorized",
+               402: "Payment Required", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+               502: "Bad Gateway"}
+
+    def __init__(self, host: str, port: int, workers: int, name: str, max_body: int = API_MAX_BODY):
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.server = None
+
+    async def start(self):
+        import asyncio
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self, banner: str = "") -> None:
+        if self.server is None:
+            await self.start()
+        if banner:
+            print(banner.format(host=self.host, port=self.port), file=sys.stderr, flush=True)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def blocking(self, fn, *args):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def dispatch(self, req: ApiRequest, writer, keep_alive: bool) -> bool:
+        raise NotImplementedError
+
+    async def _handle(self, reader, writer) -> None:
+        import asyncio
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, 413, {"error": "headers too large"}, keep_alive=False)
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                method, target, version = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > self.max_body:
+                    await self.send(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                req = ApiRequest(method, target.split("?", 1)[0], headers, body)
+                if not await self.dispatch(req, writer, keep_alive) or not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, OSError, ValueError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def send(self, writer, status: int, payload, keep_alive: bool = True, retry_after: float | None = None) -> None:
+        data = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {self.REASONS.get(status, 'Error')}",
+                f"Content-Length: {len(data)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if retry_after is not None:
+            head.append(f"Retry-After: {math.ceil(retry_after)}")
+        if data:
+            head.append("Content-Type: application/json; charset=utf-8")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        await writer.drain()
+
+class ApiServer(HttpService):
+    """HTTP API over the app's database and HelixCore for tools without the GUI.
+
+    One asyncio loop serves every connection. Blocking work (SQLite, prompt assembly)
+    runs on a fixed pool of API_WORKERS threads, bcrypt in the password processes, and
+    model replies stream through AsyncOpenAI, so a request costs a coroutine rather
+    than a thread. Chat replies are Server-Sent Events; everything else is JSON.
+    Clients sign in with POST /api/login and send `Authorization: Bearer <token>`;
+    tokens are the same stored sessions the desktop app uses.
+    """
+
+    def __init__(self, host: str = API_HOST, port: int = API_PORT, workers: int = API_WORKERS):
+        super().__init__(host, port, workers, "helix-api")
+        self.sessions: dict[str, tuple[str, float]] = {} # token -> (email, trusted until)
+        self.cores: dict[str, HelixCore] = {}
+        self.locks: dict[str, "asyncio.Lock"] = {}
+        self.ai = None
+        self.routes = [
+            ("POST", r"/api/login", self.login, False),
+            ("POST", r"/api/logout", self.logout, True),
+            ("GET", r"/api/balance", self.balance, True),
+            ("GET", r"/api/chats", self.list_chats, True),
+            ("GET", r"/api/chats/([\w-]+)", self.get_chat, True),
+            ("DELETE", r"/api/chats/([\w-]+)", self.delete_chat, True),
+            ("POST", r"/api/chat", self.chat, True),
+            ("GET", r"/api/notebooks", self.list_notebooks, True),
+            ("POST", r"/api/notebooks", self.create_notebook, True),
+            ("GET", r"/api/notebooks/([\w-]+)", self.get_notebook, True),
+            ("PUT", r"/api/notebooks/([\w-]+)", self.put_notebook, True),
+            ("DELETE", r"/api/notebooks/([\w-]+)", self.delete_notebook, True),
+            ("GET", r"/api/memories", self.list_memories, True),
+            ("POST", r"/api/memories", self.add_memory, True),
+            ("DELETE", r"/api/memories/(\d+)", self.delete_memory, True),
+        ]
+        self.routes = [(m, re.compile(p + "$"), fn, auth) for m, p, fn, auth in self.routes]
+
+    async def run(self, sync_client=None, warm_up: bool = True) -> None:
+        import asyncio
+        from openai import AsyncOpenAI
+        loop = asyncio.get_running_loop()
+        # Same endpoint choice as the GUI; the probe is a blocking request, so do it once here
+        sync_client = sync_client or await loop.run_in_executor(self.pool, client.get)
+        self.ai = AsyncOpenAI(base_url=str(sync_client.base_url), api_key=sync_client.api_key)
+        if warm_up:
+            await loop.run_in_executor(self.pool, db.warm_up)
+        await self.serve_forever(f"Helix API on http://{{host}}:{{port}} (model endpoint {sync_client.base_url})")
+
+    def lock_for(self, email: str) -> "asyncio.Lock":
+        import asyncio
+        if email not in self.locks:
+            self.locks[email] = asyncio.Lock()
+        return self.locks[email]
+
+    async def core_for(self, req: ApiRequest) -> HelixCore:
+        """The user's HelixCore with chats freshly loaded; callers hold lock_for(req.email).
+
+        Chats are re-read on every call because the desktop app and other API processes
+        write them too; changes go back through save_changes, never as the whole set.
+        """
+        email = req.email
+        core = self.cores.get(email)
+        if core is None:
+            core = HelixCore(req.db)
+            core.current_user = email
+            core.auto_memories = False
+            core = self.cores.setdefault(email, core)
+        core.db = req.db # with shared storage, acts through the session of the latest request
+        core.set_chats(await self.blocking(req.db.load_chats, email))
+        return core
+
+    async def save_changes(self, req: ApiRequest, core: HelixCore) -> None:
+        changed, deleted = core.take_chat_changes()
+        if changed or deleted:
+            await self.blocking(req.db.update_chats, req.email, changed, deleted)
+
+    async def dispatch(self, req: ApiRequest, writer, keep_alive: bool) -> bool:
+        """Answer one request; returns False once the connection has been used for a stream."""
+        t0 = time.perf_counter()
+        allowed = False
+        route = None
+        try:
+            for method, pattern, fn, needs_auth in self.routes:
+                m = pattern.match(req.path)
+                if not m:
+                    continue
+                allowed = True
+                if method != req.method:
+                    continue
+                route = fn.__name__
+                if needs_auth:
+                    req.email = await self._authenticate(req)
+                    req.db = db.as_user(self._bearer(req))
+                result = await fn(req, writer, *m.groups())
+                if result is None:
+                    return False # streamed; the handler wrote and closed the response
+                status, payload = result
+                await self.send(writer, status, payload, keep_alive)
+                return True
+            raise ApiError(405 if allowed else 404, "method not allowed" if allowed else "not found")
+        except ApiError as e:
+            await self.send(writer, e.status, {"error": str(e)}, keep_alive, e.retry_after)
+            return True
+        except (ConnectionError, OSError):
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            await self.send(writer, 500, {"error": str(e)}, keep_alive)
+            return True
+        finally:
+            # Keyed by handler, never by client-supplied path, so the set of metrics stays fixed
+            if route:
+                TELEMETRY.observe(f"api.{route}_ms", (time.perf_counter() - t0) * 1000)
+
+    @staticmethod
+    def _bearer(req: ApiRequest) -> str:
+        auth = req.headers.get("authorization", "")
+        return auth[7:].strip() if auth.lower().startswith("bearer ") else ""
+
+    async def _authenticate(self, req: ApiRequest) -> str:
+        token = self._bearer(req)
+        session = self.sessions.get(token)
+        if session and session[1] > time.time():
+            return session[0]
+        self.sessions.pop(token, None)
+        # Tokens live in storage, so they survive restarts and work on every API process
+        email = await self.blocking(db.session_user, token) if token else None
+        if not email:
+            raise ApiError(401, "sign in with POST /api/login and send the token as a Bearer header")
+        self.sessions[token] = (email, time.time() + API_SESSION_CACHE)
+        return email
+
+    # ---------- AUTH ----------
+    async def login(self, req: ApiRequest, writer):
+        data = req.json()
+        email = str(data.get("email", "")).strip()
+        password = str(data.get("password", ""))
+        if not email or not password:
+            raise ApiError(400, "email and password are required")
+        ok, balance, token = await self.blocking(db.open_session, email, password)
+        if not ok:
+            raise ApiError(401, "invalid email or password")
+        self.sessions[token] = (email, time.time() + API_SESSION_CACHE)
+        return 200, {"token": token, "email": email, "balance": balance}
+
+    async def logout(self, req: ApiRequest, writer):
+        token = self._bearer(req)
+        self.sessions.pop(token, None)
+        await self.blocking(db.delete_session, token)
+        return 204, None
+
+    async def balance(self, req: ApiRequest, writer):
+        return 200, {"balance": await self.blocking(req.db.get_token_balance, req.email)}
+
+    # ---------- CHATS ----------
+    async def list_chats(self, req: ApiRequest, writer):
+        async with self.lock_for(req.email):
+            core = await self.core_for(req)
+            rows = [{"id": cid, "title": c.get("title", "New Chat"), "messages": len(c.get("msgs", []))}
+                    for cid, c in core.saved_chats.items()]
+        return 200, {"chats": rows}
+
+    async def get_chat(self, req: ApiRequest, writer, chat_id: str):
+        async with self.lock_for(req.email):
+            core = await self.core_for(req)
+            chat = core.saved_chats.get(chat_id)
+            if chat is None:
+                raise ApiError(404, "no such chat")
+            return 200, {"id": chat_id, "title": chat.get("title", "New Chat"), "messages": list(chat.get("msgs", []))}
+
+    async def delete_chat(self, req: ApiRequest, writer, chat_id: str):
+        async with self.lock_for(req.email):
+            core = await self.core_for(req)
+            if not core.delete_chat(chat_id):
+                raise ApiError(404, "no such chat")
+            await self.save_changes(req, core)
+        return 204, None
+
+    async def chat(self, req: ApiRequest, writer):
+        """Stream a reply as SSE: `meta` (chat id, sources), `delta` chunks, then `done` or `error`.
+
+        Admission happens first: 402 when the balance can't cover a reply, 429 with
+        Retry-After when the user is over their concurrency or rate limit.
+        """
+        data = req.json()
+        text = str(data.get("message", "")).strip()
+        if not text:
+            raise ApiError(400, "message is required")
+        model_key = data.get("model", "Standard")
+        if model_key not in MODEL_CONFIG:
+            raise ApiError(400, f"model must be one of {', '.join(MODEL_CONFIG)}")
+        max_tokens = data.get("max_tokens")
+        if max_tokens is not None and (not isinstance(max_tokens, int) or max_tokens <= 0):
+            raise ApiError(400, "max_tokens must be a positive integer")
+        email = req.email
+
+        async with self.lock_for(email):
+            core = await self.core_for(req)
+            chat_id = data.get("chat_id")
+            created = chat_id is None
+            if created:
+                chat_id = core.new_chat()
+            elif chat_id not in core.saved_chats:
+                raise ApiError(404, "no such chat")
+            note_id = data.get("notebook_id")
+            if note_id:
+                await self._owned_notebook(req, note_id)
+            core.current_note_id = note_id
+            core.attach_notebook_to_chat = bool(note_id)
+            core.use_notebook_context = bool(data.get("use_notebook_context"))
+            core.compress_prompts = bool(data.get("compress", False))
+            first = not core.saved_chats[chat_id]["msgs"]
+            messages = await self.blocking(core.begin_chat_turn, chat_id, text)
+            refs = list(core.context_refs)
+            try:
+                reservation = await self.blocking(core.admission.admit, core.db, email, messages, model_key, max_tokens)
+            except AdmissionDenied as e:
+                # Refused before anything was sent: nothing is written back
+                raise ApiError(402 if e.reason == "tokens" else 429, str(e), e.retry_after)
+            if first:
+                core.rename_chat(chat_id, heuristic_title(text))
+            # Taken now: the next core_for (from any request) reloads chats and would drop these
+            changed, deleted = core.take_chat_changes()
+
+        async def event(name: str, payload: dict) -> None:
+            writer.write(f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await writer.drain()
+
+        model_id = MODEL_CONFIG[model_key]["id"]
+        trace = RequestTrace("api", model_id, messages)
+        reply = ""
+        error = None
+        disconnected = False
+        started = False
+        # Everything after admission settles in `finally`, or a failure here (or the task being
+        # cancelled) would hold the reserved tokens until RESERVATION_TTL
+        try:
+            async with self.lock_for(email):
+                await self.blocking(req.db.update_chats, email, changed, deleted)
+
+            writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                          "Cache-Control: no-cache\r\nConnection: close\r\n\r\n").encode())
+            started = True
+            await event("meta", {"chat_id": chat_id, "model": model_key, "sources": refs})
+            stream = await self.ai.chat.completions.create(model=model_id, messages=messages, temperature=0.7,
+                                                           max_tokens=reservation.max_tokens, stream=True)
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    c = getattr(chunk.choices[0].delta, "content", None)
+                    if c:
+                        reply += c
+                        trace.chunk(c)
+                        await event("delta", {"text": c})
+            finally:
+                await stream.close()
+        except (ConnectionError, OSError):
+            if not started:
+                raise
+            disconnected = True # client went away; keep and bill what was generated
+        except Exception as e:
+            if not started:
+                raise # nothing sent yet: answer with a plain error
+            error = str(e)
+        finally:
+            trace.finish(cancelled=disconnected, error=error)
+            # Settle even on failure so the unused part of the reservation goes back
+            balance = await self.blocking(core.admission.settle, core.db, reservation, reply)
+
+        if reply:
+            async with self.lock_for(email):
+                core = await self.core_for(req)
+                core.finish_chat_turn(chat_id, reply)
+                await self.save_changes(req, core)
+        if not disconnected:
+            try:
+                if error:
+                    await event("error", {"error": error, "balance": balance})
+                else:
+                    await event("done", {"chat_id": chat_id, "tokens": reply_cost(reply, model_key), "balance": balance})
+                writer.close()
+            except (ConnectionError, OSError):
+                pass
+        return None
+
+    # ---------- NOTEBOOKS ----------
+    async def _owned_notebook(self, req: ApiRequest, nid: str) -> None:
+        if await self.blocking(req.db.notebook_owner, nid) != req.email:
+            raise ApiError(404, "no such notebook")
+
+    async def list_notebooks(self, req: ApiRequest, writer):
+        rows = await self.blocking(req.db.load_notebooks_list, req.email)
+        return 200, {"notebooks": [{"id": nid, "title": title} for nid, title in rows]}
+
+    async def get_notebook(self, req: ApiRequest, writer, nid: str):
+        await self._owned_notebook(req, nid)
+        title, content = await self.blocking(req.db.load_notebook_content, nid)
+        return 200, {"id": nid, "title": title, "content": content}
+
+    async def _save_notebook(self, req: ApiRequest, nid: str, data: dict) -> None:
+        title = str(data.get("title") or "Untitled")
+        content = str(data.get("content", ""))
+        await self.blocking(req.db.save_notebook, nid, req.email, title, content)
+        core = self.cores.get(req.email)
+        if core:
+            core.notebook_chunks.forget(nid)
+
+    async def create_notebook(self, req: ApiRequest, writer):
+        nid = str(uuid.uuid4())
+        await self._save_notebook(req, nid, req.json())
+        return 201, {"id": nid}
+
+    async def put_notebook(self, req: ApiRequest, writer, nid: str):
+        owner = await self.blocking(req.db.notebook_owner, nid)
+        if owner not in (None, req.email):
+            raise ApiError(404, "no such notebook")
+        await self._save_notebook(req, nid, req.json())
+        return (201 if owner is None else 200), {"id": nid}
+
+    async def delete_notebook(self, req: ApiRequest, writer, nid: str):
+        if not await self.blocking(req.db.delete_notebook, nid, req.email):
+            raise ApiError(404, "no such notebook")
+        core = self.cores.get(req.email)
+        if core:
+            core.notebook_chunks.forget(nid)
+        return 204, None
+
+    # ---------- MEMORIES ----------
+    async def list_memories(self, req: ApiRequest, writer):
+        rows = await self.blocking(req.db.get_memories, req.email)
+        return 200, {"memories": [{"id": mid, "content": content} for mid, content in rows]}
+
+    async def add_memory(self, req: ApiRequest, writer):
+        content = str(req.json().get("content", "")).strip()
+        if not content:
+            raise ApiError(400, "content is required")
+        await self.blocking(req.db.add_memory, req.email, content)
+        return 201, {"ok": True}
+
+    async def delete_memory(self, req: ApiRequest, writer, mid: str):
+        if not await self.blocking(req.db.delete_memory, int(mid), req.email):
+            raise ApiError(404, "no such memory")
+        return 204, None
+
+def run_api_server(argv: list[str]) -> int:
+    import argparse
+    import asyncio
+    ap = argparse.ArgumentParser(prog="Main.py serve", description="Serve chats, canvases and memories over HTTP.")
+    ap.add_argument("--host", default=API_HOST)
+    ap.add_argument("--port", type=int, default=API_PORT)
+    ap.add_argument("--workers", type=int, default=API_WORKERS, help="threads for database and bcrypt work")
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(ApiServer(args.host, args.port, args.workers).run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+# =========================
+# STORAGE SERVICE (stand-in)
+# =========================
+
+class DatabaseServer(HttpService):
+    """Stand-in shared storage: DatabaseManager's methods as JSON RPC for many desktops.
+
+    POST /rpc {"method": ..., "args": [...]} -> {"result": ...}. Only DB_METHODS are
+    served; apart from sign-in and sign-up they need an X-Helix-Session header and act
+    for that session's user. SQLite work runs on a fixed pool of threads sharing the
+    manager's connection pool, and balance changes take the per-user lock, so charges
+    arriving from different desktops stay exact. Sign-up codes are mailed from here.
+    """
+
+    def __init__(self, dbm: DatabaseManager | None = None, host: str = "127.0.0.1", port: int = DB_SERVER_PORT,
+                 workers: int = DB_SERVER_WORKERS, token: str = DB_TOKEN):
+        super().__init__(host, port, workers, "helix-db")
+        self.dbm = dbm or DatabaseManager(pool_size=workers)
+        self.token = token
+        self.sessions: dict[str, tuple[str, float]] = {} # token -> (email, trusted until)
+        self.mailer = MailQueue(self.dbm)
+
+    async def dispatch(self, req: ApiRequest, writer, keep_alive: bool) -> bool:
+        import hmac
+        try:
+            if req.path != "/rpc":
+                raise ApiError(404, "not found")
+            if req.method != "POST":
+                raise ApiError(405, "use POST")
+            if self.token and not hmac.compare_digest(req.headers.get("x-helix-token", ""), self.token):
+                raise ApiError(403, "bad service token")
+            data = req.json()
+            method, args = data.get("method"), data.get("args", [])
+            if method not in DB_METHODS or not isinstance(args, list):
+                raise ApiError(404, f"unknown method {method!r}")
+            args = await self.authorize(req, method, args)
+            try:
+                result = await self.blocking(getattr(self.dbm, method), *args)
+            except TypeError as e:
+                raise ApiError(400, str(e))
+            if method == "start_signup" and result[1]:
+                self.mailer.start()
+            elif method == "delete_session" and args:
+                self.sessions.pop(args[0], None)
+            await self.send(writer, 200, {"result": result}, keep_alive)
+        except ApiError as e:
+            await self.send(writer, e.status, {"error": str(e)}, keep_alive)
+        except (ConnectionError, OSError):
+            raise
+        except Exception as e:
+            await self.send(writer, 500, {"error": f"{type(e).__name__}: {e}"}, keep_alive)
+        return True
+
+    async def authorize(self, req: ApiRequest, method: str, args: list) -> list:
+        """The call's arguments with the caller's email filled in; ApiError if it isn't theirs."""
+        rule = DB_METHODS[method]
+        if rule is None:
+            return args
+        email = await self.session_email(req.headers.get("x-helix-session", ""))
+        pos, owned = rule
+        if pos is not None:
+            args = args + [None] * (pos + 1 - len(args))
+            args[pos] = email
+        if owned:
+            if not args:
+                raise ApiError(400, f"{method} needs a {owned} id")
+            lookup = self.dbm.notebook_owner if owned == "notebook" else self.dbm.contact_owner
+            owner = await self.blocking(lookup, args[0])
+            # An unknown notebook id is a new notebook; contacts must already exist
+            if owner != email and (owner is not None or owned == "contact"):
+                raise ApiError(403, f"not your {owned}")
+        return args
+
+    async def session_email(self, token: str) -> str:
+        session = self.sessions.get(token)
+        if session and session[1] > time.time():
+            return session[0]
+        self.sessions.pop(token, None)
+        email = await self.blocking(self.dbm.session_user, token) if token else None
+        if not email:
+            raise ApiError(401, "sign in first")
+        self.sessions[token] = (email, time.time() + API_SESSION_CACHE)
+        return email
+
+def run_db_server(argv: list[str]) -> int:
+    import argparse
+    import asyncio
+    import ipaddress
+    ap = argparse.ArgumentParser(prog="Main.py dbserver", description="Host the shared storage service.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DB_SERVER_PORT)
+    ap.add_argument("--db", help="SQLite file to serve (default: the app's data file)")
+    ap.add_argument("--workers", type=int, default=DB_SERVER_WORKERS)
+    args = ap.parse_args(argv)
+    try:
+        loopback = ipaddress.ip_address(args.host).is_loopback
+    except ValueError:
+        loopback = args.host == "localhost"
+    if not loopback and not DB_TOKEN:
+        print("Set HELIX_DB_TOKEN before serving storage beyond this machine.", file=sys.stderr)
+        return 2
+    server = DatabaseServer(DatabaseManager(args.db, pool_size=args.workers), args.host, args.port, args.workers)
+    if server.mailer.can_send():
+        server.mailer.start() # anything left queued by the last run
+    else:
+        print("Outgoing mail isn't set up (HELIX_SMTP_USER, HELIX_SMTP_PASSWORD); sign-up codes will stay queued.",
+              file=sys.stderr)
+    try:
+        asyncio.run(server.serve_forever(f"Helix storage on http://{{host}}:{{port}}/rpc ({server.dbm.path})"))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+# =========================
+# BATCH MODE (command line)
+# =========================
+
+def load_batch_items(source: str) -> list[dict]:
+    """Inputs from a directory (one item per text file) or an NDJSON file; "-" reads stdin.
+
+    NDJSON lines are either a string or an object with "text" (or "input"/"content"),
+    plus optional "id" and a per-item "instruction".
+    """
+    items = []
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        text = f.read()
+                except (UnicodeDecodeError, OSError) as e:
+                    print(f"skipping {path}: {e}", file=sys.stderr)
+                    continue
+                items.append({"id": os.path.relpath(path, source).replace(os.sep, "/"), "text": text})
+    else:
+        f = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+        try:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                if isinstance(rec, str):
+                    rec = {"text": rec}
+                elif not isinstance(rec, dict):
+                    raise ValueError(f"{source}:{n}: expected an object or string")
+                text = rec.get("text", rec.get("input", rec.get("content")))
+                if not isinstance(text, str):
+                    raise ValueError(f"{source}:{n}: no text field")
+                items.append({"id": str(rec.get("id", n)), "text": text, "instruction": rec.get("instruction")})
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    seen = set()
+    for item in items:
+        if item["id"] in seen:
+            raise ValueError(f"duplicate id {item['id']!r}; ids must be unique to resume")
+        seen.add(item["id"])
+    return items
+
+class BatchRunner:
+    """Quick Fix (or a custom instruction) over many inputs with bounded concurrency.
+
+    Workers stream replies into a queue. The calling thread writes them strictly in input
+    order: the oldest unfinished item live, later ones from their buffers once they reach
+    the front. Each item reserves tokens before its request and is charged when it ends
+    (waiting out the per-user rate and concurrency limits); finished ids are appended to
+    the progress file, so an interrupted run picks up where it stopped.
+    """
+
+    def __init__(self, core: HelixCore, items: list[dict], instruction: str | None = None,
+                 concurrency: int = BATCH_CONCURRENCY, out=None, fmt: str = "text",
+                 progress_path: str | None = None):
+        self.core = core
+        self.items = items
+        self.instruction = instruction
+        self.concurrency = max(1, concurrency)
+        self.out = out or sys.stdout
+        self.fmt = fmt
+        self.progress_path = progress_path
+        self.streams: dict[int, CompletionStream] = {}
+        self.stopping = threading.Event()
+        self.stats = {"done": 0, "skipped": 0, "errors": 0, "tokens": 0}
+
+    def _load_progress(self) -> set[str]:
+        done = set()
+        if self.progress_path and os.path.exists(self.progress_path):
+            with open(self.progress_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        done.add(json.loads(line)["id"])
+                    except (ValueError, KeyError, TypeError):
+                        pass # a line cut short by a crash
+        return done
+
+    def _work(self, idx: int, item: dict, events: queue.Queue) -> None:
+        instruction = item.get("instruction") or self.instruction
+        msgs = (self.core.custom_fix_messages(instruction, item["text"]) if instruction
+                else self.core.fix_messages(item["text"]))
+        while True:
+            stream = self.core.stream(msgs, "fix", interactive=False)
+            self.streams[idx] = stream
+            try:
+                for c in stream:
+                    events.put(("chunk", idx, c))
+                events.put(("done", idx, stream, None))
+            except AdmissionDenied as e:
+                # Nothing was sent yet, so wait out the limit and try again
+                if e.retry_after is not None and not self.stopping.wait(e.retry_after):
+                    continue
+                events.put(("done", idx, stream, e))
+            except Exception as e:
+                events.put(("done", idx, stream, str(e)))
+            return
+
+    def _write(self, text: str) -> None:
+        self.out.write(text)
+        self.out.flush()
+
+    def _begin(self, item: dict, chunks: list[str]) -> None:
+        if self.fmt == "text":
+            self._write(f"=== {item['id']} ===\n" + "".join(chunks))
+
+    def _finish(self, item: dict, stream: CompletionStream, error, progress) -> int | None:
+        """Record one item; returns the balance after it settled (None if never admitted)."""
+        text = stream.text
+        tokens = stream.cost
+        self.stats["tokens"] += tokens
+        if error is None:
+            self.stats["done"] += 1
+        else:
+            self.stats["errors"] += 1
+            error = str(error)
 
+        if self.fmt == "text":
+            self._write(f"\n[Error: {error}]\n\n" if error else "\n\n")
+        else:
+            rec = {"id": item["id"], "output": text, "tokens": tokens, "balance": stream.balance}
+            if error:
+                rec["error"] = error
+            self._write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+        if progress and error is None:
+            progress.write(json.dumps({"id": item["id"], "tokens": tokens}) + "\n")
+            progress.flush()
+        return stream.balance
+
+    def run(self) -> int:
+        done = self._load_progress()
+        todo = [it for it in self.items if it["id"] not in done]
+        self.stats["skipped"] = len(self.items) - len(todo)
+        balance = self.core.balance()
+        if todo and balance <= 0:
+            print("No tokens left on this account.", file=sys.stderr)
+            return 1
+
+        events: queue.Queue = queue.Queue()
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="helix-batch")
+        progress = open(self.progress_path, "a", encoding="utf-8") if self.progress_path else None
+        buffers: dict[int, list[str]] = {}
+        finished: dict[int, tuple[str, str | None]] = {}
+        submitted = head = in_flight = 0
+        out_of_tokens = False
+        try:
+            while head < submitted or (not out_of_tokens and submitted < len(todo)):
+                while not out_of_tokens and submitted < len(todo) and in_flight < self.concurrency:
+                    buffers[submitted] = []
+                    pool.submit(self._work, submitted, todo[submitted], events)
+                    if submitted == head:
+                        self._begin(todo[head], [])
+                    submitted += 1
+                    in_flight += 1
+
+                kind, idx, *rest = events.get()
+                if kind == "chunk":
+                    if idx == head:
+                        if self.fmt == "text":
+                            self._write(rest[0])
+                    else:
+                        buffers[idx].append(rest[0])
+                    continue
+
+                in_flight -= 1
+                finished[idx] = (rest[0], rest[1])
+                short = isinstance(rest[1], AdmissionDenied) and rest[1].reason == "tokens"
+                while head in finished:
+                    stream, error = finished.pop(head)
+                    buffers.pop(head, None)
+                    self.streams.pop(head, None)
+                    new_balance = self._finish(todo[head], stream, error, progress)
+                    if new_balance is not None:
+                        balance = new_balance
+                    head += 1
+                    if head < submitted:
+                        self._begin(todo[head], buffers[head])
+                if (short or balance <= 0) and not out_of_tokens:
+                    out_of_tokens = True
+                    print("Token balance exhausted; finishing requests in flight.", file=sys.stderr)
+        except KeyboardInterrupt:
+            self.stopping.set()
+            for stream in list(self.streams.values()):
+                stream.cancel()
+            print("\nInterrupted; rerun the same command to resume.", file=sys.stderr)
+            return 130
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            if progress:
+                progress.close()
+
+        s = self.stats
+        # Items settle on their own threads, so ask rather than trust the last one seen
+        print(f"{s['done']} done, {s['errors']} failed, {s['skipped']} already done, "
+              f"{s['tokens']} tokens charged, balance {self.core.balance()}", file=sys.stderr)
+        return 0 if not s["errors"] and not out_of_tokens else 1
+
+def batch_user(email: str | None) -> str | None:
+    """The saved session's user, or `email` after a password check (HELIX_PASSWORD or a prompt)."""
+    cached = load_session()
+    if cached and email in (None, cached[0]) and db.session_user(cached[1]) == cached[0]:
+        db.use_session(cached[1])
+        return cached[0]
+    if email is None:
+        return None
+    import getpass
+    password = os.environ.get("HELIX_PASSWORD") or getpass.getpass(f"Password for {email}: ")
+    ok, _, token = db.open_session(email, password)
+    db.use_session(token)
+    return email if ok else None
+
+def run_batch(argv: list[str]) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(prog="Main.py batch", description="Run Quick Fix or a custom instruction over many inputs.")
+    ap.add_argument("source", help="directory of text files, NDJSON file, or - for NDJSON on stdin")
+    ap.add_argument("-i", "--instruction", help="custom instruction instead of Quick Fix")
+    ap.add_argument("-m", "--model", default="Standard", choices=list(MODEL_CONFIG))
+    ap.add_argument("-j", "--concurrency", type=int, default=BATCH_CONCURRENCY, help="requests in flight at once")
+    ap.add_argument("-o", "--out", help="append results here instead of printing them")
+    ap.add_argument("--format", choices=("text", "ndjson"), help="default: ndjson with --out, text otherwise")
+    ap.add_argument("--progress", help="finished-id log for resuming (default: OUT.progress when --out is set)")
+    ap.add_argument("--user", help="account to charge (default: the signed-in user)")
+    args = ap.parse_args(argv)
+
+    user = batch_user(args.user)
+    if not user:
+        print("Not signed in: log in through the app or pass --user.", file=sys.stderr)
+        return 2
+    try:
+        items = load_batch_items(args.source)
+    except (OSError, ValueError) as e:
+        print(f"Could not read inputs: {e}", file=sys.stderr)
+        return 2
+
+    core = HelixCore()
+    core.current_user = user
+    core.current_model_key = args.model
+    out = open(args.out, "a", encoding="utf-8") if args.out else None
+    try:
+        return BatchRunner(
+            core, items,
+            instruction=args.instruction,
+            concurrency=args.concurrency,
+            out=out,
+            fmt=args.format or ("ndjson" if args.out else "text"),
+            progress_path=args.progress or (args.out + ".progress" if args.out else None),
+        ).run()
+    finally:
+        if out:
+            out.close()
 
 if __name__ == "__main__":
     # If you pasted secrets into code (tokens/passwords), rotate them and move to env vars.
+    if getattr(sys, "frozen", False):
+        from multiprocessing import freeze_support
+        freeze_support() # password worker processes in a frozen build start here
+    if sys.argv[1:2] == ["batch"]:
+        sys.exit(run_batch(sys.argv[2:]))
+    if sys.argv[1:2] == ["serve"]:
+        sys.exit(run_api_server(sys.argv[2:]))
+    if sys.argv[1:2] == ["dbserver"]:
+        sys.exit(run_db_server(sys.argv[2:]))
     app = HelixApp()
     app.mainloop()
@@ -0,0 +1,97 @@
+"""Pick the bcrypt cost factor (HELIX_BCRYPT_ROUNDS) for this hardware.
+
+Times one hash at each cost, recommends the highest cost whose median stays under the
+target, then measures a burst of concurrent logins at that cost: threads in this
+interpreter versus Main's password process pool.
+
+    python benchmarks/bcrypt_cost.py --target-ms 250
+    python benchmarks/bcrypt_cost.py --min 10 --max 15 --burst 64 --out bcrypt.json
+
+Run it on the machine that serves logins (the desktop, or the storage service host).
+Stored hashes made at another cost are upgraded the next time their user logs in.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Main  # noqa: E402
+
+PASSWORD = "correct horse battery staple"
+
+
+def time_hash(rounds: int, samples: int) -> float:
+    times = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        Main._bcrypt_hash(PASSWORD, rounds)
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def burst(check, pw_hash: bytes, n: int, threads: int) -> float:
+    """Logins per second for n simultaneous checks issued from `threads` threads."""
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        t0 = time.perf_counter()
+        ok = list(pool.map(lambda _: check(PASSWORD, pw_hash), range(n)))
+        wall = time.perf_counter() - t0
+    assert all(ok)
+    return n / wall
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--min", type=int, default=10, help="lowest cost to time")
+    ap.add_argument("--max", type=int, default=14, help="highest cost to time")
+    ap.add_argument("--samples", type=int, default=3, help="hashes per cost; the median is used")
+    ap.add_argument("--target-ms", type=float, default=250.0, help="acceptable time for one login check")
+    ap.add_argument("--burst", type=int, default=32, help="concurrent logins in the throughput test")
+    ap.add_argument("--out", help="write the report as JSON")
+    args = ap.parse_args()
+
+    costs = {}
+    for rounds in range(args.min, args.max + 1):
+        costs[rounds] = round(time_hash(rounds, args.samples), 1)
+        print(f"cost {rounds:2d}: {costs[rounds]:8.1f} ms", flush=True)
+        if costs[rounds] > 4 * args.target_ms:
+            break  # each step doubles; higher costs are only slower
+
+    fitting = [r for r, ms in costs.items() if ms <= args.target_ms]
+    chosen = max(fitting) if fitting else min(costs)
+    pw_hash = Main._bcrypt_hash(PASSWORD, chosen)
+
+    threads = max(args.burst, Main.PASSWORD_WORKERS)
+    in_process = burst(Main._bcrypt_check, pw_hash, args.burst, threads)
+    pooled = burst(Main.check_password, pw_hash, args.burst, threads)
+    Main.password_pool.shutdown()
+
+    report = {
+        "cpu_count": os.cpu_count(),
+        "password_workers": Main.PASSWORD_WORKERS,
+        "hash_ms": costs,
+        "target_ms": args.target_ms,
+        "recommended_rounds": chosen,
+        "current_rounds": Main.BCRYPT_ROUNDS,
+        "burst": args.burst,
+        "logins_per_s_threads": round(in_process, 1),
+        "logins_per_s_process_pool": round(pooled, 1),
+    }
+    print(json.dumps(report, indent=2))
+    if not fitting:
+        print(f"No cost fits {args.target_ms:.0f} ms; the cheapest timed is {chosen}.")
+    print(f"export HELIX_BCRYPT_ROUNDS={chosen}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
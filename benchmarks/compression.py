@@ -0,0 +1,147 @@
+"""Latency saved vs. answer quality for prompt compression.
+
+Runs every case in compression_prompts.json twice against an OpenAI-compatible endpoint,
+once with the full injected context and once compressed, and reports time-to-first-token,
+total latency, prompt size, expected-answer accuracy and how closely the compressed answer
+agrees with the uncompressed one.
+
+    python benchmarks/compression.py --ratio 0.5 --out compression_results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Main import API_KEY, LOCAL_URL, MODEL_CONFIG, PROMPTS, compress_context, tokenize_terms  # noqa: E402
+
+PROMPT_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compression_prompts.json")
+
+
+def build_context(case: dict, filler: list[str], seed: int) -> str:
+    """Deterministic notebook-style context: filler, repeats and separators around the facts."""
+    rng = random.Random(seed)
+    paras = filler[:]
+    rng.shuffle(paras)
+    paras += rng.sample(filler, 4)  # repeated passages, as when one note is pasted into another
+    for fact in case["facts"]:
+        paras.insert(rng.randrange(len(paras)), fact)
+    parts = ["[Context from Notebooks]:"]
+    for i, para in enumerate(paras):
+        if i % 5 == 0:
+            parts.append(f"--- Note: Notes {i // 5 + 1} [chars 0-{len(para)}] ---")
+        parts.append(para)
+        parts.append("\n-----\n" if i % 3 == 2 else "\n")
+    return "\n".join(parts)
+
+
+def run_once(client, model: str, system: str, question: str) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    answer = ""
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": system}, {"role": "user", "content": question}],
+        temperature=0.0,
+        max_tokens=200,
+        stream=True,
+    )
+    for chunk in stream:
+        delta = chunk.choices[0].delta
+        if getattr(delta, "content", None):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            answer += delta.content
+    total = time.perf_counter() - start
+    return {"ttft": ttft if ttft is not None else total, "total": total, "answer": answer}
+
+
+def token_f1(a: str, b: str) -> float:
+    ta, tb = tokenize_terms(a), tokenize_terms(b)
+    if not ta or not tb:
+        return float(ta == tb)
+    common = 0
+    pool = list(tb)
+    for t in ta:
+        if t in pool:
+            pool.remove(t)
+            common += 1
+    if not common:
+        return 0.0
+    p, r = common / len(ta), common / len(tb)
+    return 2 * p * r / (p + r)
+
+
+def is_correct(answer: str, expected: list[str]) -> bool:
+    low = answer.lower()
+    return any(e.lower() in low for e in expected)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--base-url", default=LOCAL_URL)
+    ap.add_argument("--model", default=MODEL_CONFIG["Standard"]["id"])
+    ap.add_argument("--ratio", type=float, default=0.5)
+    ap.add_argument("--out", help="write the full report as JSON")
+    args = ap.parse_args()
+
+    from openai import OpenAI
+    client = OpenAI(base_url=args.base_url, api_key=API_KEY)
+
+    with open(PROMPT_SET, "r", encoding="utf-8") as f:
+        prompt_set = json.load(f)
+
+    rows = []
+    for i, case in enumerate(prompt_set["cases"]):
+        context = build_context(case, prompt_set["filler"], seed=i)
+        t0 = time.perf_counter()
+        compressed = compress_context(context, case["question"], args.ratio)
+        compress_ms = (time.perf_counter() - t0) * 1000
+
+        full = run_once(client, args.model, PROMPTS["Chat"] + "\n" + context, case["question"])
+        small = run_once(client, args.model, PROMPTS["Chat"] + "\n" + compressed, case["question"])
+        rows.append({
+            "question": case["question"],
+            "chars_full": len(context),
+            "chars_compressed": len(compressed),
+            "compress_ms": round(compress_ms, 2),
+            "ttft_full": round(full["ttft"], 3),
+            "ttft_compressed": round(small["ttft"], 3),
+            "total_full": round(full["total"], 3),
+            "total_compressed": round(small["total"], 3),
+            "correct_full": is_correct(full["answer"], case["expected"]),
+            "correct_compressed": is_correct(small["answer"], case["expected"]),
+            "agreement_f1": round(token_f1(full["answer"], small["answer"]), 3),
+        })
+        r = rows[-1]
+        print(f"{i + 1:>2}. {r['chars_full']:>6} -> {r['chars_compressed']:>6} chars  "
+              f"ttft {r['ttft_full']:.2f}s -> {r['ttft_compressed']:.2f}s  "
+              f"correct {r['correct_full']}/{r['correct_compressed']}  f1 {r['agreement_f1']:.2f}")
+
+    summary = {
+        "ratio": args.ratio,
+        "model": args.model,
+        "cases": len(rows),
+        "size_ratio": round(sum(r["chars_compressed"] for r in rows) / sum(r["chars_full"] for r in rows), 3),
+        "ttft_saved_s": round(statistics.mean(r["ttft_full"] - r["ttft_compressed"] for r in rows), 3),
+        "total_saved_s": round(statistics.mean(r["total_full"] - r["total_compressed"] for r in rows), 3),
+        "accuracy_full": sum(r["correct_full"] for r in rows) / len(rows),
+        "accuracy_compressed": sum(r["correct_compressed"] for r in rows) / len(rows),
+        "agreement_f1": round(statistics.mean(r["agreement_f1"] for r in rows), 3),
+    }
+    print(json.dumps(summary, indent=2))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "cases": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Load test for the shared storage service (`Main.py dbserver`).
+
+Simulates many desktop clients, each with its own RemoteDatabase and session, issuing
+the calls the app makes (balance, chats, memories, DMs, token charges). Half the charges
+go to one shared account, signed in from every client, so the per-user balance locking
+is exercised under contention. Reports throughput and per-call latency, then checks
+that no charge was lost.
+
+    python benchmarks/db_load.py --clients 200 --duration 10
+    python benchmarks/db_load.py --url http://127.0.0.1:8766 --db /srv/helix_v2.db --clients 300
+
+With no --url a service is started in this process on a temporary database; clients
+and server then share one interpreter, so an external service gives truer numbers.
+Accounts and sessions are written straight into the database file, so an external
+service must be on this machine.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Main  # noqa: E402
+
+START_TOKENS = 10_000_000
+SHARED = "shared@bench.local"
+
+
+def start_local_service(workers: int) -> tuple[str, str]:
+    path = os.path.join(tempfile.mkdtemp(prefix="helix-dbload-"), "load.db")
+    dbm = Main.DatabaseManager(path, pool_size=workers)
+    server = Main.DatabaseServer(dbm, port=0, workers=workers, token="")
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="db-service", daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{server.port}", path
+
+
+def seed_users(dbm: "Main.DatabaseManager", emails: list[str]) -> dict[str, str]:
+    """Accounts with a balance that never clamps at zero, and a session for each; email -> token."""
+    # Direct inserts: no bcrypt cost
+    conn = Main.sqlite3.connect(dbm.path)
+    conn.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?)", [(e, b"x", START_TOKENS) for e in emails])
+    conn.executemany("INSERT OR REPLACE INTO history VALUES (?, ?)", [(e, "{}") for e in emails])
+    conn.executemany("INSERT OR REPLACE INTO contacts VALUES (?, ?, ?, ?, ?, ?)",
+                     [(f"c-{e}", e, "Bench", "#555", "", "") for e in emails])
+    conn.commit()
+    conn.close()
+    return {e: dbm.create_session(e, 86400) for e in emails}
+
+
+class Client(threading.Thread):
+    def __init__(self, url: str, token: str, email: str, session: str, shared_session: str,
+                 stop_at: float, barrier: threading.Barrier):
+        super().__init__(daemon=True)
+        self.db = Main.RemoteDatabase(url, token, pool_size=2, session=session)
+        self.shared = self.db.as_user(shared_session)
+        self.email = email
+        self.stop_at = stop_at
+        self.barrier = barrier
+        self.lat: dict[str, list[float]] = defaultdict(list)
+        self.errors = 0
+        self.own_charged = 0
+        self.shared_charged = 0
+
+    def timed(self, name: str, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception:
+            self.errors += 1
+            return None
+        finally:
+            self.lat[name].append((time.perf_counter() - t0) * 1000)
+
+    def run(self):
+        db = self.db
+        contact = None
+        contacts = self.timed("get_contacts", db.get_contacts, self.email) or []
+        if contacts:
+            contact = contacts[0][0]
+        chats = {"c1": {"title": "Bench", "msgs": [{"role": "user", "content": "hello " * 50}]}}
+        self.barrier.wait()
+        i = 0
+        while time.time() < self.stop_at:
+            i += 1
+            self.timed("get_token_balance", db.get_token_balance, self.email)
+            self.timed("load_chats", db.load_chats, self.email)
+            if i % 4 == 0:
+                self.timed("save_chats", db.save_chats, self.email, chats)
+            self.timed("get_memories", db.get_memories, self.email)
+            if contact and i % 2 == 0:
+                self.timed("save_dm_message", db.save_dm_message, contact, "me", f"message {i}")
+            if self.timed("deduct_tokens", db.deduct_tokens, self.email, 1) is not None:
+                self.own_charged += 1
+            if self.timed("deduct_tokens.shared", self.shared.deduct_tokens, SHARED, 1) is not None:
+                self.shared_charged += 1
+
+
+def pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p * len(values)))], 2) if values else 0.0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", help="storage service to test (default: start one in-process)")
+    ap.add_argument("--db", help="the external service's SQLite file, for seeding accounts (required with --url)")
+    ap.add_argument("--token", default=os.environ.get("HELIX_DB_TOKEN", ""))
+    ap.add_argument("--clients", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--workers", type=int, default=Main.DB_SERVER_WORKERS, help="service threads (in-process only)")
+    ap.add_argument("--out", help="write the report as JSON")
+    args = ap.parse_args()
+
+    url, path = args.url, args.db
+    if not url:
+        url, path = start_local_service(args.workers)
+    elif not path:
+        ap.error("--url needs --db: sign-up is by mailed code, so accounts are seeded in the file")
+    # Balances are checked in the file itself; the service only lets a user read their own
+    local = Main.DatabaseManager(path, pool_size=2)
+    emails = [f"client{i}@bench.local" for i in range(args.clients)]
+    sessions = seed_users(local, emails + [SHARED])
+    before = {e: local.get_token_balance(e) for e in emails + [SHARED]}
+
+    print(f"{args.clients} clients against {url} for {args.duration:.0f}s", flush=True)
+    barrier = threading.Barrier(args.clients + 1)
+    stop_at = time.time() + 3600
+    clients = [Client(url, args.token, e, sessions[e], sessions[SHARED], stop_at, barrier) for e in emails]
+    for c in clients:
+        c.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for c in clients:
+        c.stop_at = time.time() + args.duration
+    for c in clients:
+        c.join()
+    wall = time.perf_counter() - t0
+
+    lat: dict[str, list[float]] = defaultdict(list)
+    for c in clients:
+        for name, values in c.lat.items():
+            lat[name] += values
+    total = sum(len(v) for v in lat.values())
+    errors = sum(c.errors for c in clients)
+
+    # Every successful charge must be reflected exactly once
+    lost = 0
+    for c in clients:
+        expected = max(0, before[c.email] - c.own_charged)
+        lost += abs(local.get_token_balance(c.email) - expected)
+    shared_expected = max(0, before[SHARED] - sum(c.shared_charged for c in clients))
+    shared_diff = local.get_token_balance(SHARED) - shared_expected
+
+    report = {
+        "url": url,
+        "clients": args.clients,
+        "wall_s": round(wall, 2),
+        "calls": total,
+        "calls_per_s": round(total / wall, 1),
+        "errors": errors,
+        "balance_mismatch_own": lost,
+        "balance_mismatch_shared": shared_diff,
+        "latency_ms": {
+            name: {"n": len(v), "p50": pct(v, 0.5), "p95": pct(v, 0.95), "p99": pct(v, 0.99),
+                   "mean": round(statistics.fmean(v), 2)}
+            for name, v in sorted(lat.items())
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if not errors and not lost and not shared_diff else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
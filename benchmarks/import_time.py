@@ -0,0 +1,85 @@
+"""Import-time budget for Main.py.
+
+Imports Main in a fresh interpreter with `-X importtime`, reports the slowest modules,
+and fails (exit code 1) when the cumulative import time exceeds the budget or when a
+module that should load lazily is pulled in at import. Modules customtkinter imports
+itself (it loads PIL) don't count against Main.
+
+    python benchmarks/import_time.py --budget-ms 500 --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy modules Main must only import on first use, unless customtkinter already does
+DEFERRED = ("openai", "requests", "PIL", "bcrypt", "pyperclip", "smtplib", "multiprocessing")
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """module -> (self_us, cumulative_us) from `-X importtime` output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+            times[name.strip()] = (int(self_us), int(cum_us))
+        except ValueError:
+            continue
+    return times
+
+
+def measure_once(module: str = "Main") -> dict[str, tuple[int, int]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-2000:])
+        raise SystemExit(f"importing {module} failed with exit code {proc.returncode}")
+    return parse_importtime(proc.stderr)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--budget-ms", type=float, default=float(os.environ.get("HELIX_IMPORT_BUDGET_MS", 500)))
+    ap.add_argument("--runs", type=int, default=5, help="fresh interpreters; the median is compared")
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    totals = [r["Main"][1] / 1000 for r in runs if "Main" in r]
+    if not totals:
+        print("Main did not appear in the importtime output")
+        return 1
+    median_ms = statistics.median(totals)
+
+    last = runs[-1]
+    print(f"Main cumulative import: median {median_ms:.1f} ms over {len(totals)} runs (budget {args.budget_ms:.0f} ms)")
+    print("Slowest modules (cumulative, last run):")
+    top_level = {name: cum for name, (_, cum) in last.items() if "." not in name.strip()}
+    for name, cum in sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[: args.top]:
+        print(f"  {cum / 1000:8.1f} ms  {name}")
+
+    failures = []
+    baseline = measure_once("customtkinter")
+    eager = sorted(m for m in DEFERRED if m in last and m not in baseline)
+    if eager:
+        failures.append("imported eagerly: " + ", ".join(eager))
+    if median_ms > args.budget_ms:
+        failures.append(f"import time {median_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+
+    for f in failures:
+        print("FAIL:", f)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""OpenAI-compatible mock inference server for offline load testing.
+
+Implements GET /v1/models, POST /v1/chat/completions (streaming and not) and
+POST /v1/embeddings on plain asyncio, so hundreds of concurrent streams cost one
+coroutine each. Latency, token rate, jitter, error injection and mid-stream
+disconnects are configurable; GET /mock/stats reports what the server has seen.
+
+    python benchmarks/mock_server.py --port 1234 --ttft 0.3 --rate 40 --jitter 0.2
+    HELIX_LOCAL_URL=http://127.0.0.1:1234/v1 python Main.py
+
+    # stress: 300 concurrent streams against an in-process server (or --url)
+    python benchmarks/mock_server.py --stress 300 --rate 50 --error-rate 0.02 --disconnect-rate 0.02
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+WORDS = (
+    "the a of to and in that it is for on with as this was be by at from or an are not have one "
+    "model stream token latency notebook chat memory server answer question result context helix"
+).split()
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+@dataclass
+class MockConfig:
+    ttft: float = 0.2            # seconds before the first token
+    rate: float = 50.0           # tokens per second after the first
+    jitter: float = 0.0          # +/- fraction applied to every delay
+    tokens: int = 200            # reply length when the request sets no max_tokens
+    error_rate: float = 0.0      # fraction of requests answered with error_status
+    error_status: int = 500
+    disconnect_rate: float = 0.0  # fraction of streams dropped part-way through
+    embedding_dim: int = 384
+    models: tuple = ("hermes-3-llama-3.1-8b", "glm-4.1v-9b-thinking")
+    seed: int | None = None
+
+
+class MockServer:
+    def __init__(self, config: MockConfig | None = None):
+        self.config = config or MockConfig()
+        self.rng = random.Random(self.config.seed)
+        self.server: asyncio.AbstractServer | None = None
+        self.stats = {"requests": 0, "streams": 0, "active_streams": 0, "peak_streams": 0,
+                      "errors": 0, "disconnects": 0, "tokens": 0}
+
+    # ---------- lifecycle ----------
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.server = await asyncio.start_server(self._handle, host, port, backlog=1024)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/v1"
+
+    async def close(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    # ---------- HTTP ----------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, version = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                self.stats["requests"] += 1
+                keep_alive = await self._route(writer, method, path.split("?", 1)[0], body, keep_alive) and keep_alive
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _send_json(self, writer, status: int, payload: dict, keep_alive: bool, extra: dict | None = None) -> None:
+        data = json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}", "Content-Type: application/json",
+                f"Content-Length: {len(data)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{k}: {v}" for k, v in (extra or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+        await writer.drain()
+
+    async def _route(self, writer, method: str, path: str, body: bytes, keep_alive: bool) -> bool:
+        """Answer one request; returns False when the connection must not be reused."""
+        if method == "GET" and path in ("/v1/models", "/models"):
+            await self._send_json(writer, 200, {"object": "list", "data": [
+                {"id": m, "object": "model", "owned_by": "mock"} for m in self.config.models]}, keep_alive)
+            return True
+        if method == "GET" and path == "/mock/stats":
+            await self._send_json(writer, 200, self.stats, keep_alive)
+            return True
+        if method != "POST" or path not in ("/v1/chat/completions", "/v1/embeddings"):
+            await self._send_json(writer, 404, {"error": {"message": f"no route {method} {path}"}}, keep_alive)
+            return True
+
+        try:
+            req = json.loads(body or b"{}")
+        except ValueError:
+            await self._send_json(writer, 400, {"error": {"message": "invalid JSON"}}, keep_alive)
+            return True
+
+        if self.config.error_rate and self.rng.random() < self.config.error_rate:
+            self.stats["errors"] += 1
+            status = self.config.error_status
+            extra = {"Retry-After": "1"} if status == 429 else None
+            await self._send_json(writer, status, {"error": {"message": "injected failure", "type": "mock_error"}},
+                                  keep_alive, extra)
+            return True
+
+        if path == "/v1/embeddings":
+            await self._send_json(writer, 200, self._embeddings(req), keep_alive)
+            return True
+        if req.get("stream"):
+            return await self._stream(writer, req, keep_alive)
+        await asyncio.sleep(self._delay(self.config.ttft) + self._reply_len(req) * self._delay(1 / self.config.rate))
+        await self._send_json(writer, 200, self._completion(req), keep_alive)
+        return True
+
+    # ---------- completions ----------
+    def _delay(self, base: float) -> float:
+        j = self.config.jitter
+        return max(0.0, base * (1 + self.rng.uniform(-j, j))) if j else base
+
+    def _reply_len(self, req: dict) -> int:
+        return max(1, min(int(req.get("max_tokens") or self.config.tokens), self.config.tokens))
+
+    def _words(self, req: dict) -> list[str]:
+        rng = random.Random(json.dumps(req.get("messages", []), sort_keys=True))
+        return [rng.choice(WORDS) + " " for _ in range(self._reply_len(req))]
+
+    @staticmethod
+    def _usage(req: dict, completion: int) -> dict:
+        prompt = sum(len(str(m.get("content", ""))) for m in req.get("messages", [])) // 4
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    def _completion(self, req: dict) -> dict:
+        words = self._words(req)
+        self.stats["tokens"] += len(words)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+            "model": req.get("model", self.config.models[0]),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words).strip()},
+                         "finish_reason": "stop"}],
+            "usage": self._usage(req, len(words)),
+        }
+
+    async def _stream(self, writer, req: dict, keep_alive: bool) -> bool:
+        chunked = keep_alive  # HTTP/1.0 clients read to EOF instead
+        head = ["HTTP/1.1 200 OK", "Content-Type: text/event-stream", "Cache-Control: no-cache",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if chunked:
+            head.append("Transfer-Encoding: chunked")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+
+        def event(payload) -> bytes:
+            data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode()
+            return f"{len(data):x}\r\n".encode() + data + b"\r\n" if chunked else data
+
+        words = self._words(req)
+        drop_at = (self.rng.randrange(len(words)) if self.config.disconnect_rate
+                   and self.rng.random() < self.config.disconnect_rate else None)
+        cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = req.get("model", self.config.models[0])
+
+        def chunk(delta: dict, finish=None) -> dict:
+            return {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+        self.stats["streams"] += 1
+        self.stats["active_streams"] += 1
+        self.stats["peak_streams"] = max(self.stats["peak_streams"], self.stats["active_streams"])
+        try:
+            writer.write(event(chunk({"role": "assistant", "content": ""})))
+            await writer.drain()
+            await asyncio.sleep(self._delay(self.config.ttft))
+            for i, w in enumerate(words):
+                if i == drop_at:
+                    # Abrupt close: no finish_reason, no [DONE], no terminating chunk
+                    self.stats["disconnects"] += 1
+                    writer.transport.abort()
+                    return False
+                if i:
+                    await asyncio.sleep(self._delay(1 / self.config.rate))
+                writer.write(event(chunk({"content": w})))
+                await writer.drain()
+                self.stats["tokens"] += 1
+            writer.write(event(chunk({}, "stop")))
+            if (req.get("stream_options") or {}).get("include_usage"):
+                writer.write(event({**chunk({}), "choices": [], "usage": self._usage(req, len(words))}))
+            writer.write(event("[DONE]"))
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            return chunked
+        finally:
+            self.stats["active_streams"] -= 1
+
+    # ---------- embeddings ----------
+    def _embeddings(self, req: dict) -> dict:
+        inputs = req.get("input", "")
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        data = []
+        for i, text in enumerate(inputs):
+            # Deterministic bag-of-words hashing, so similar texts get similar vectors
+            vec = [0.0] * self.config.embedding_dim
+            for word in str(text).lower().split():
+                h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+                vec[h % len(vec)] += 1.0 if (h >> 32) & 1 else -1.0
+            norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+            data.append({"object": "embedding", "index": i, "embedding": [v / norm for v in vec]})
+        tokens = sum(len(str(t)) for t in inputs) // 4
+        return {"object": "list", "data": data, "model": req.get("model", "mock-embed"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+
+def start_in_thread(config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0) -> tuple[MockServer, str]:
+    """Run a MockServer on a daemon thread's event loop; returns (server, base_url)."""
+    mock = MockServer(config)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    box = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        box["url"] = loop.run_until_complete(mock.start(host, port))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="mock-server", daemon=True).start()
+    ready.wait()
+    mock.loop = loop
+    return mock, box["url"]
+
+
+# ---------- stress client ----------
+
+async def one_stream(base_url: str, model: str, prompt: str, max_tokens: int) -> dict:
+    """Stream one completion over raw HTTP/1.0 and time it; no client library, no thread."""
+    host_port = base_url.split("//", 1)[1].split("/", 1)[0]
+    host, _, port = host_port.partition(":")
+    prefix = "/" + base_url.split("//", 1)[1].split("/", 1)[1] if "/" in base_url.split("//", 1)[1] else ""
+    body = json.dumps({"model": model, "stream": True, "max_tokens": max_tokens,
+                       "messages": [{"role": "user", "content": prompt}]}).encode()
+    t0 = time.perf_counter()
+    result = {"status": None, "ttft": None, "total": None, "tokens": 0, "outcome": "error"}
+    try:
+        reader, writer = await asyncio.open_connection(host, int(port or 80))
+        writer.write(f"POST {prefix}/chat/completions HTTP/1.0\r\nHost: {host_port}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        result["status"] = int((await reader.readline()).split()[1])
+        await reader.readuntil(b"\r\n\r\n")
+        if result["status"] == 200:
+            result["outcome"] = "disconnected"
+            async for raw in reader:
+                line = raw.strip()
+                if not line.startswith(b"data: "):
+                    continue
+                if line == b"data: [DONE]":
+                    result["outcome"] = "ok"
+                    break
+                choices = json.loads(line[6:]).get("choices") or [{}]
+                if choices[0].get("delta", {}).get("content"):
+                    if result["ttft"] is None:
+                        result["ttft"] = time.perf_counter() - t0
+                    result["tokens"] += 1
+        writer.close()
+    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+        pass
+    result["total"] = time.perf_counter() - t0
+    return result
+
+
+async def stress(base_url: str, concurrency: int, model: str, max_tokens: int) -> dict:
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one_stream(base_url, model, f"stress {i}", max_tokens) for i in range(concurrency)))
+    wall = time.perf_counter() - t0
+
+    def pct(values, p):
+        values = sorted(values)
+        return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 1) if values else None
+
+    ttfts = [r["ttft"] for r in results if r["ttft"] is not None]
+    ok = [r for r in results if r["outcome"] == "ok"]
+    return {
+        "streams": concurrency,
+        "ok": len(ok),
+        "errors": sum(r["outcome"] == "error" for r in results),
+        "disconnected": sum(r["outcome"] == "disconnected" for r in results),
+        "wall_s": round(wall, 3),
+        "ttft_p50_ms": pct(ttfts, 0.5),
+        "ttft_p95_ms": pct(ttfts, 0.95),
+        "total_p95_ms": pct([r["total"] for r in ok], 0.95),
+        "tok_s_per_stream": round(statistics.median(
+            r["tokens"] / max(1e-9, r["total"] - r["ttft"]) for r in ok if r["ttft"] is not None), 1) if ok else None,
+        "tok_s_aggregate": round(sum(r["tokens"] for r in results) / wall, 1),
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=1234)
+    ap.add_argument("--ttft", type=float, default=MockConfig.ttft, help="seconds before the first token")
+    ap.add_argument("--rate", type=float, default=MockConfig.rate, help="tokens per second")
+    ap.add_argument("--jitter", type=float, default=MockConfig.jitter, help="+/- fraction on every delay")
+    ap.add_argument("--tokens", type=int, default=MockConfig.tokens, help="reply length cap")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--error-status", type=int, default=500)
+    ap.add_argument("--disconnect-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--stress", type=int, metavar="N", help="run N concurrent streams and print a report")
+    ap.add_argument("--url", help="stress an already running server instead of an in-process one")
+    ap.add_argument("--max-tokens", type=int, default=100, help="tokens requested per stress stream")
+    args = ap.parse_args()
+
+    config = MockConfig(ttft=args.ttft, rate=args.rate, jitter=args.jitter, tokens=args.tokens,
+                        error_rate=args.error_rate, error_status=args.error_status,
+                        disconnect_rate=args.disconnect_rate, seed=args.seed)
+
+    async def run_stress():
+        mock = None
+        url = args.url
+        if not url:
+            mock = MockServer(config)
+            url = await mock.start(args.host, 0)
+        report = await stress(url, args.stress, config.models[0], args.max_tokens)
+        if mock:
+            report["server"] = dict(mock.stats)
+            await mock.close()
+        print(json.dumps(report, indent=2))
+
+    async def serve():
+        mock = MockServer(config)
+        url = await mock.start(args.host, args.port)
+        print(f"Mock server on {url}  {json.dumps(asdict(config))}", flush=True)
+        await mock.server.serve_forever()
+
+    try:
+        asyncio.run(run_stress() if args.stress else serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""Local SMTP stand-in for testing Helix's outbound mail queue.
+
+Speaks enough SMTP for smtplib (EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, RSET, NOOP,
+QUIT) on plain asyncio and accepts any credentials. Latency, transient (4xx) failures,
+permanent (5xx) rejections, dropped connections and an idle timeout are configurable.
+Nothing is delivered; messages are kept in memory and optionally appended to a JSONL file.
+
+    python benchmarks/smtp_server.py --port 2525 --outbox sent.jsonl
+    HELIX_SMTP_HOST=127.0.0.1 HELIX_SMTP_PORT=2525 HELIX_SMTP_SECURITY=plain HELIX_SMTP_PASSWORD=x python Main.py
+
+    # burst: queue N sign-up codes through Main.MailQueue against an in-process server
+    python benchmarks/smtp_server.py --burst 200 --fail-rate 0.05 --drop-rate 0.02
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from email.parser import BytesParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class SmtpConfig:
+    latency: float = 0.0          # seconds added to every reply
+    fail_rate: float = 0.0        # fraction of messages answered 451 after DATA (retry later)
+    reject_rate: float = 0.0      # fraction of recipients refused with 550 (permanent)
+    drop_rate: float = 0.0        # fraction of messages where the connection is cut mid-transaction
+    idle_timeout: float = 300.0   # close connections silent this long, like real servers do
+    outbox: str | None = None     # JSONL file receiving accepted messages
+    seed: int | None = None
+
+
+class SmtpServer:
+    def __init__(self, config: SmtpConfig | None = None):
+        self.config = config or SmtpConfig()
+        self.rng = random.Random(self.config.seed)
+        self.server: asyncio.AbstractServer | None = None
+        self.messages: list[dict] = []
+        self.per_recipient: Counter = Counter()
+        self.stats = {"connections": 0, "active": 0, "auths": 0, "messages": 0,
+                      "transient": 0, "rejected": 0, "dropped": 0, "idle_closed": 0}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _reply(self, writer: asyncio.StreamWriter, line: str) -> None:
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        writer.write(line.encode() + b"\r\n")
+        await writer.drain()
+
+    async def _readline(self, reader: asyncio.StreamReader) -> bytes:
+        return await asyncio.wait_for(reader.readline(), self.config.idle_timeout)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats["connections"] += 1
+        self.stats["active"] += 1
+        sender, recipients = None, []
+        try:
+            await self._reply(writer, "220 helix-smtp-standin ready")
+            while True:
+                try:
+                    raw = await self._readline(reader)
+                except asyncio.TimeoutError:
+                    self.stats["idle_closed"] += 1
+                    await self._reply(writer, "421 idle timeout")
+                    return
+                if not raw:
+                    return
+                line = raw.decode("utf-8", "replace").rstrip("\r\n")
+                verb = line.split(" ", 1)[0].upper()
+                arg = line[len(verb):].strip()
+
+                if verb in ("EHLO", "HELO"):
+                    if verb == "EHLO":
+                        writer.write(b"250-helix-smtp-standin\r\n250-8BITMIME\r\n")
+                        await self._reply(writer, "250 AUTH PLAIN LOGIN")
+                    else:
+                        await self._reply(writer, "250 helix-smtp-standin")
+                elif verb == "AUTH":
+                    mech, _, initial = arg.partition(" ")
+                    if mech.upper() == "LOGIN":
+                        if not initial:
+                            await self._reply(writer, "334 " + base64.b64encode(b"Username:").decode())
+                            await self._readline(reader)
+                        await self._reply(writer, "334 " + base64.b64encode(b"Password:").decode())
+                        await self._readline(reader)
+                    elif not initial:
+                        await self._reply(writer, "334 ")
+                        await self._readline(reader)
+                    self.stats["auths"] += 1
+                    await self._reply(writer, "235 2.7.0 accepted")
+                elif verb == "MAIL":
+                    sender, recipients = arg.partition(":")[2].strip(), []
+                    if self.rng.random() < self.config.drop_rate:
+                        self.stats["dropped"] += 1
+                        return  # cut without a reply
+                    await self._reply(writer, "250 2.1.0 ok")
+                elif verb == "RCPT":
+                    rcpt = arg.partition(":")[2].strip().strip("<>")
+                    if self.rng.random() < self.config.reject_rate:
+                        self.stats["rejected"] += 1
+                        await self._reply(writer, "550 5.1.1 no such user")
+                    else:
+                        recipients.append(rcpt)
+                        await self._reply(writer, "250 2.1.5 ok")
+                elif verb == "DATA":
+                    if not recipients:
+                        await self._reply(writer, "503 5.5.1 no valid recipients")
+                        continue
+                    await self._reply(writer, "354 end with <CRLF>.<CRLF>")
+                    lines = []
+                    while True:
+                        chunk = await self._readline(reader)
+                        if chunk in (b".\r\n", b".\n") or not chunk:
+                            break
+                        lines.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                    if self.rng.random() < self.config.fail_rate:
+                        self.stats["transient"] += 1
+                        await self._reply(writer, "451 4.3.0 try again later")
+                    else:
+                        self._accept(sender, recipients, b"".join(lines))
+                        await self._reply(writer, "250 2.0.0 queued")
+                    sender, recipients = None, []
+                elif verb == "RSET":
+                    sender, recipients = None, []
+                    await self._reply(writer, "250 2.0.0 ok")
+                elif verb == "NOOP":
+                    await self._reply(writer, "250 2.0.0 ok")
+                elif verb == "QUIT":
+                    await self._reply(writer, "221 2.0.0 bye")
+                    return
+                else:
+                    await self._reply(writer, "502 5.5.2 command not implemented")
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.stats["active"] -= 1
+            writer.close()
+
+    def _accept(self, sender: str, recipients: list[str], data: bytes) -> None:
+        msg = BytesParser().parsebytes(data)
+        body = msg.get_payload(decode=True) or b""
+        record = {"from": sender, "to": recipients, "subject": msg.get("Subject", ""),
+                  "body": body.decode("utf-8", "replace").strip(), "at": time.time()}
+        self.messages.append(record)
+        self.stats["messages"] += 1
+        for r in recipients:
+            self.per_recipient[r] += 1
+        if self.config.outbox:
+            with open(self.config.outbox, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def start_in_thread(config: SmtpConfig | None = None, host: str = "127.0.0.1", port: int = 0) -> tuple[SmtpServer, int]:
+    """Run an SmtpServer on a daemon thread's event loop; returns (server, port)."""
+    smtp = SmtpServer(config)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    box = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        box["port"] = loop.run_until_complete(smtp.start(host, port))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="smtp-standin", daemon=True).start()
+    ready.wait()
+    smtp.loop = loop
+    return smtp, box["port"]
+
+
+def burst(config: SmtpConfig, count: int, recipients: int, timeout: float) -> dict:
+    """Queue `count` codes for `recipients` addresses through Main.MailQueue and wait for them."""
+    sys.path.insert(0, ROOT)
+    import Main
+
+    smtp, port = start_in_thread(config)
+    Main.SMTP_HOST, Main.SMTP_PORT, Main.SMTP_SECURITY = "127.0.0.1", port, "plain"
+    Main.SMTP_PASSWORD = "standin" # any login is accepted; the placeholder would keep the worker off
+    dbm = Main.DatabaseManager(os.path.join(tempfile.mkdtemp(prefix="helix-mail-"), "mail.db"))
+    queue = Main.MailQueue(dbm)
+
+    t0 = time.perf_counter()
+    ids, limited = [], 0
+    for i in range(count):
+        status, mid = queue.send(f"user{i % recipients}@burst.local", "Helix Code", f"Verification code: {100000 + i}")
+        if mid:
+            ids.append(mid)
+        else:
+            limited += 1
+    queued_s = time.perf_counter() - t0
+
+    final = Counter()
+    for mid in ids:
+        info = queue.wait(mid, max(0.0, timeout - (time.perf_counter() - t0)))
+        final[info["status"] if info else "missing"] += 1
+    wall = time.perf_counter() - t0
+    return {
+        "requested": count,
+        "recipients": recipients,
+        "limited": limited,
+        "queued": len(ids),
+        "outcome": dict(final),
+        "enqueue_s": round(queued_s, 3),
+        "wall_s": round(wall, 3),
+        "sent_per_s": round(final["sent"] / wall, 1),
+        "queue": dict(queue.stats),
+        "server": {k: v for k, v in smtp.stats.items() if k != "active"},
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=2525)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of messages answered 451")
+    ap.add_argument("--reject-rate", type=float, default=0.0, help="fraction of recipients refused with 550")
+    ap.add_argument("--drop-rate", type=float, default=0.0, help="fraction of transactions cut off")
+    ap.add_argument("--idle-timeout", type=float, default=300.0)
+    ap.add_argument("--outbox", help="append accepted messages to this JSONL file")
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--burst", type=int, metavar="N", help="queue N codes through Main.MailQueue and report")
+    ap.add_argument("--recipients", type=int, help="distinct addresses in the burst (default N)")
+    ap.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for a burst to drain")
+    args = ap.parse_args()
+
+    config = SmtpConfig(latency=args.latency, fail_rate=args.fail_rate, reject_rate=args.reject_rate,
+                        drop_rate=args.drop_rate, idle_timeout=args.idle_timeout, outbox=args.outbox, seed=args.seed)
+
+    if args.burst:
+        print(json.dumps(burst(config, args.burst, args.recipients or args.burst, args.timeout), indent=2))
+        return 0
+
+    async def serve():
+        smtp = SmtpServer(config)
+        port = await smtp.start(args.host, args.port)
+        print(f"SMTP stand-in on {args.host}:{port}  {json.dumps(asdict(config))}", flush=True)
+        await smtp.server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""Headless benchmark suite: storage, prompt assembly, rendering and streaming.
+
+Builds a synthetic workspace in a temporary directory, then measures DatabaseManager
+operations, get_system_prompt assembly, load_chat / refresh_sidebar (needs a display,
+e.g. `xvfb-run`), and run_ai_stream throughput against benchmarks/mock_server.py.
+Results are written as JSON and can be compared against a stored baseline.
+
+    xvfb-run python benchmarks/suite.py --scale 0.01 --out results.json
+    xvfb-run python benchmarks/suite.py --scale 0.01 --baseline baseline.json
+
+--scale 1 is the full workspace: 10k chats, 1M messages, 5k notebooks, 65 memories.
+No baseline is shipped; record one on the machine you compare on with --save-baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Main  # noqa: E402
+from benchmarks.mock_server import MockConfig, start_in_thread, stress  # noqa: E402
+
+FULL = {"chats": 10_000, "messages": 1_000_000, "notebooks": 5_000, "memories": 65, "contacts": 200, "dm_messages": 100_000}
+USER = "bench@example.com"
+PASSWORD = "bench-password"
+
+WORDS = (
+    "the a project plan note idea meeting draft budget design research data model server client cache "
+    "query index latency token stream render window chat canvas memory profile summary review release "
+    "python sqlite network request answer question detail example context chapter section result"
+).split()
+
+
+# ---------- helpers ----------
+
+def sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(sentence(rng, rng.randint(6, 18)) for _ in range(sentences))
+
+
+def timeit(fn, repeat: int, setup=None) -> dict:
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "n": repeat,
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+        "min_ms": round(samples[0], 3),
+    }
+
+
+def log(msg: str) -> None:
+    print(msg, flush=True)
+
+
+# ---------- synthetic workspace ----------
+
+def build_workspace(path: str, scale: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    sizes = {k: max(1, int(v * scale)) for k, v in FULL.items()}
+    sizes["memories"] = FULL["memories"]
+    dbm = Main.DatabaseManager(path)
+
+    ok, msg = dbm.add_user(USER, PASSWORD)
+    if not ok:
+        raise SystemExit(f"could not create the benchmark user: {msg}")
+
+    # Chats live in one JSON document per user, exactly as the app stores them
+    per_chat = max(2, sizes["messages"] // sizes["chats"])
+    chats = {}
+    for i in range(sizes["chats"]):
+        msgs = []
+        for j in range(per_chat):
+            role = "user" if j % 2 == 0 else "assistant"
+            msgs.append({"role": role, "content": sentence(rng, 12) if role == "user" else paragraph(rng, 3)})
+        chats[str(uuid.UUID(int=rng.getrandbits(128)))] = {"title": sentence(rng, 4)[:40], "msgs": msgs}
+    dbm.save_chats(USER, chats)
+
+    base = datetime(2024, 1, 1)
+    conn = Main.sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO notebooks (id, email, title, content, updated_at) VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                str(uuid.UUID(int=rng.getrandbits(128))),
+                USER,
+                sentence(rng, 3)[:40],
+                "\n\n".join(f"## {sentence(rng, 3)}\n{paragraph(rng, 5)}" for _ in range(rng.randint(3, 12))),
+                (base + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+            )
+            for i in range(sizes["notebooks"])
+        ],
+    )
+    contacts = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(sizes["contacts"])]
+    conn.executemany(
+        "INSERT INTO contacts VALUES (?, ?, ?, ?, ?, ?)",
+        [(cid, USER, f"User {i}", "#555", "hi", base.strftime("%Y-%m-%d %H:%M:%S")) for i, cid in enumerate(contacts)],
+    )
+    conn.executemany(
+        "INSERT INTO dm_messages VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (
+                str(uuid.UUID(int=rng.getrandbits(128))),
+                contacts[i % len(contacts)],
+                "me" if i % 2 == 0 else "them",
+                sentence(rng, 10),
+                (base + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"),
+                0,
+            )
+            for i in range(sizes["dm_messages"])
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    for _ in range(sizes["memories"]):
+        dbm.add_memory(USER, sentence(rng, 8))
+
+    return {"sizes": sizes, "contacts": contacts, "db": dbm}
+
+
+# ---------- benchmarks ----------
+
+def bench_db(ws: dict, repeat: int, results: dict) -> None:
+    dbm = ws["db"]
+    notebooks = dbm.load_notebooks_list(USER)
+    chats = dbm.load_chats(USER)
+    contact = ws["contacts"][0]
+    nid = notebooks[len(notebooks) // 2][0]
+
+    results["db.load_chats"] = timeit(lambda: dbm.load_chats(USER), repeat)
+    results["db.save_chats"] = timeit(lambda: dbm.save_chats(USER, chats), repeat)
+    results["db.load_notebooks_list"] = timeit(lambda: dbm.load_notebooks_list(USER), repeat)
+    results["db.load_notebook_content"] = timeit(lambda: dbm.load_notebook_content(nid), repeat)
+    scratch = str(uuid.uuid4())  # keep the generated notebooks (and their order) untouched
+    results["db.save_notebook"] = timeit(lambda: dbm.save_notebook(scratch, USER, "Bench", "x" * 4000), repeat)
+    results["db.get_memories"] = timeit(lambda: dbm.get_memories(USER), repeat)
+    results["db.get_token_balance"] = timeit(lambda: dbm.get_token_balance(USER), repeat)
+    results["db.get_contacts"] = timeit(lambda: dbm.get_contacts(USER), repeat)
+    results["db.get_dm_messages_page"] = timeit(lambda: dbm.get_dm_messages_page(contact, limit=Main.DM_PAGE_SIZE), repeat)
+    results["db.save_dm_message"] = timeit(lambda: dbm.save_dm_message(contact, "me", "benchmark"), repeat)
+    # bcrypt dominates login; a few rounds are enough
+    results["db.login"] = timeit(lambda: dbm.login(USER, PASSWORD), max(3, repeat // 10))
+    token = dbm.create_session(USER)
+    results["db.session_user"] = timeit(lambda: dbm.session_user(token), repeat)  # session restore path
+
+
+def bench_prompt(ws: dict, repeat: int, results: dict) -> None:
+    notebooks = ws["db"].load_notebooks_list(USER)
+    query = "What did the meeting notes say about the cache latency and the release plan?"
+
+    def make_core(**flags):
+        core = Main.HelixCore(ws["db"])
+        core.current_user = USER
+        core.current_note_id = notebooks[0][0]
+        for k, v in flags.items():
+            setattr(core, k, v)
+        return core
+
+    cases = {
+        "prompt.memories_only": {},
+        "prompt.attach": {"attach_notebook_to_chat": True},
+        "prompt.rag": {"use_notebook_context": True},
+        "prompt.rag_compressed": {"use_notebook_context": True, "compress_prompts": True},
+    }
+    for name, flags in cases.items():
+        warm = make_core(**flags)
+        warm.get_system_prompt("Chat", query)  # fill the chunk cache
+        results[name] = timeit(lambda: warm.get_system_prompt("Chat", query), repeat)
+        holder = {}
+        results[name + ".cold"] = timeit(
+            lambda: holder["core"].get_system_prompt("Chat", query),
+            max(3, repeat // 5),
+            setup=lambda: holder.update(core=make_core(**flags)),
+        )
+
+
+def bench_stream_raw(base_url: str, tokens: int, results: dict) -> None:
+    try:
+        from openai import OpenAI
+    except ImportError:
+        results["stream.raw"] = {"skipped": "openai is not installed"}
+        return
+    cli = OpenAI(base_url=base_url, api_key="bench")
+    t0 = time.perf_counter()
+    ttft = None
+    chunks = 0
+    stream = cli.chat.completions.create(model="bench-model", messages=[{"role": "user", "content": "hi"}], stream=True)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if ttft is None:
+                ttft = time.perf_counter() - t0
+            chunks += 1
+    total = time.perf_counter() - t0
+    results["stream.raw"] = {
+        "ttft_ms": round((ttft or total) * 1000, 2),
+        "total_ms": round(total * 1000, 2),
+        "tok_s": round(chunks / max(1e-9, total - (ttft or 0)), 1),
+        "chunks": chunks,
+    }
+
+
+def bench_stream_core(ws: dict, tokens: int, results: dict) -> None:
+    """HelixCore.complete end to end (prompt assembly + stream), no display needed."""
+    try:
+        import openai  # noqa: F401
+    except ImportError:
+        results["stream.core"] = {"skipped": "openai is not installed"}
+        return
+    core = Main.HelixCore(ws["db"])
+    core.current_user = USER
+    chat_id = core.new_chat()
+    t0 = time.perf_counter()
+    reply = core.complete(core.begin_chat_turn(chat_id, "hello"), "chat")
+    total = time.perf_counter() - t0
+    results["stream.core"] = {"total_ms": round(total * 1000, 2), "tok_s": round(len(reply.split()) / max(1e-9, total), 1)}
+
+
+def bench_stream_concurrent(base_url: str, concurrency: int, results: dict) -> None:
+    report = asyncio.run(stress(base_url, concurrency, "bench-model", 100))
+    # tok_s is what the baseline comparison looks at
+    results["stream.concurrent"] = {**report, "tok_s": report["tok_s_aggregate"]}
+
+
+def pump(app, until, timeout: float = 60.0) -> bool:
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        app.update()
+        if until():
+            return True
+        time.sleep(0.001)
+    return False
+
+
+def bench_ui(ws: dict, base_url: str, repeat: int, results: dict) -> None:
+    if not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+        for key in ("ui.load_chat", "ui.refresh_sidebar", "stream.render"):
+            results[key] = {"skipped": "no display (run under xvfb-run)"}
+        return
+
+    app = Main.HelixApp()
+    try:
+        app.current_user = USER
+        app.show_app()
+        if not pump(app, lambda: app.workspace_loaded, timeout=600):
+            raise SystemExit("workspace did not load")
+
+        chat_ids = list(app.saved_chats)
+        picks = [chat_ids[i * len(chat_ids) // repeat] for i in range(repeat)]
+        it = iter(picks)
+        results["ui.load_chat"] = timeit(lambda: (app.load_chat(next(it)), app.update_idletasks()), repeat)
+
+        counter = {"i": 0}
+
+        def touch_title():
+            # A real change, so the keyed reconcile has work to do
+            counter["i"] += 1
+            app.saved_chats[chat_ids[counter["i"] % len(chat_ids)]]["title"] = f"Renamed {counter['i']}"
+
+        results["ui.refresh_sidebar"] = timeit(lambda: (app.refresh_sidebar(), app.update_idletasks()), repeat, setup=touch_title)
+
+        # End-to-end streaming into a transcript bubble
+        app.create_new_chat()
+        entry = app.add_message("assistant", "")
+        worker = threading.Thread(
+            target=app.run_ai_stream, args=([{"role": "user", "content": "hi"}], entry, False), daemon=True
+        )
+        t0 = time.perf_counter()
+        worker.start()
+        pump(app, lambda: not worker.is_alive(), timeout=300)
+        streamed = time.perf_counter() - t0
+        app.update()  # drain queued chunk callbacks
+        done = time.perf_counter() - t0
+        results["stream.render"] = {
+            "total_ms": round(done * 1000, 2),
+            "drain_ms": round((done - streamed) * 1000, 2),
+            "tok_s": round(len(entry.text.split()) / max(1e-9, done), 1),
+        }
+    finally:
+        app.destroy()
+
+
+# ---------- baseline ----------
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        cur = results.get(name)
+        if not isinstance(cur, dict) or not isinstance(base, dict):
+            continue
+        if "median_ms" in base and "median_ms" in cur:
+            old, new = base["median_ms"], cur["median_ms"]
+            change = (new - old) / old if old else 0.0
+            bad = change > threshold and new - old > 1.0  # ignore sub-millisecond noise
+        elif "tok_s" in base and "tok_s" in cur:
+            old, new = base["tok_s"], cur["tok_s"]
+            change = (old - new) / old if old else 0.0
+            bad = change > threshold
+        else:
+            continue
+        flag = "REGRESSION" if bad else "ok"
+        log(f"  {name:<32} {old:>10} -> {new:>10}  ({change:+.0%} worse)  {flag}")
+        if bad:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--scale", type=float, default=0.01, help="fraction of the full workspace (1.0 = 10k chats / 1M messages)")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--stream-tokens", type=int, default=400)
+    ap.add_argument("--stream-rate", type=float, default=200.0, help="mock server tokens per second")
+    ap.add_argument("--stream-ttft", type=float, default=0.05)
+    ap.add_argument("--stream-concurrency", type=int, default=200, help="simultaneous streams for the stress run")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="compare against this results JSON")
+    ap.add_argument("--save-baseline", help="also write results to this path as the new baseline")
+    ap.add_argument("--threshold", type=float, default=0.20, help="allowed slowdown before a result counts as a regression")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="helix-bench-")
+    os.chdir(workdir)  # session, snapshot and telemetry files land here, not in the user's data
+    db_path = os.path.join(workdir, Main.DB_FILE)
+
+    log(f"Building workspace (scale {args.scale}) in {workdir}")
+    t0 = time.perf_counter()
+    ws = build_workspace(db_path, args.scale, args.seed)
+    log(f"  {ws['sizes']} in {time.perf_counter() - t0:.1f}s")
+
+    # The app's module-level services point at the synthetic workspace and mock server
+    mock, base_url = start_in_thread(MockConfig(ttft=args.stream_ttft, rate=args.stream_rate,
+                                                tokens=args.stream_tokens, seed=args.seed))
+    Main.db = Main.LazyService(lambda: ws["db"])
+    Main.client = Main.LazyService(lambda: __import__("openai").OpenAI(base_url=base_url, api_key="bench"))
+
+    results: dict = {}
+    log("DatabaseManager…")
+    bench_db(ws, args.repeat, results)
+    log("get_system_prompt…")
+    bench_prompt(ws, args.repeat, results)
+    log("Streaming…")
+    bench_stream_raw(base_url, args.stream_tokens, results)
+    bench_stream_core(ws, args.stream_tokens, results)
+    bench_stream_concurrent(base_url, args.stream_concurrency, results)
+    log("UI (load_chat, refresh_sidebar, run_ai_stream)…")
+    bench_ui(ws, base_url, min(args.repeat, 50), results)
+    mock.loop.call_soon_threadsafe(mock.loop.stop)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "sizes": ws["sizes"],
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    for name, r in results.items():
+        log(f"  {name:<32} {json.dumps(r)}")
+
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("scale") != args.scale:
+            log("warning: baseline was recorded at a different scale")
+        log(f"Compared with {args.baseline}:")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            log(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
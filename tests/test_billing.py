@@ -0,0 +1,107 @@
+import sqlite3
+import time
+
+import pytest
+
+import Main
+
+EMAIL = "billing@test.local"
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture
+def dbm(tmp_path):
+    dbm = Main.DatabaseManager(str(tmp_path / "billing.db"))
+    set_balance(dbm, 5000)
+    return dbm
+
+
+def set_balance(dbm, tokens: int) -> None:
+    # Direct insert: no bcrypt cost
+    conn = sqlite3.connect(dbm.path)
+    conn.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?)", (EMAIL, b"x", tokens))
+    conn.commit()
+    conn.close()
+
+
+def open_reservations(dbm) -> int:
+    conn = sqlite3.connect(dbm.path)
+    n = conn.execute("SELECT COUNT(*) FROM token_reservations WHERE email=?", (EMAIL,)).fetchone()[0]
+    conn.close()
+    return n
+
+
+def controller(max_concurrent: int = 4) -> Main.AdmissionController:
+    return Main.AdmissionController(max_concurrent=max_concurrent, tokens_per_min=0)
+
+
+def test_low_balance_shortens_reply_cap(dbm):
+    set_balance(dbm, 100)
+    res = controller().admit(dbm, EMAIL, MESSAGES, "Thinking")
+    mult = Main.MODEL_CONFIG["Thinking"]["cost_multiplier"]
+    assert res.max_tokens == 100 // mult
+    assert res.amount == res.max_tokens * mult
+    assert dbm.get_token_balance(EMAIL) == 100 - res.amount
+
+
+def test_balance_below_minimum_reply_is_refused(dbm):
+    set_balance(dbm, Main.REPLY_MIN_TOKENS - 1)
+    with pytest.raises(Main.AdmissionDenied) as exc:
+        controller().admit(dbm, EMAIL, MESSAGES, "Standard")
+    assert exc.value.reason == "tokens"
+    assert dbm.get_token_balance(EMAIL) == Main.REPLY_MIN_TOKENS - 1
+    assert open_reservations(dbm) == 0
+
+
+def test_busy_limit(dbm):
+    adm = controller(max_concurrent=2)
+    first = adm.admit(dbm, EMAIL, MESSAGES, "Standard")
+    adm.admit(dbm, EMAIL, MESSAGES, "Standard")
+    held = dbm.get_token_balance(EMAIL)
+    with pytest.raises(Main.AdmissionDenied) as exc:
+        adm.admit(dbm, EMAIL, MESSAGES, "Standard")
+    assert exc.value.reason == "busy"
+    assert exc.value.retry_after
+    assert dbm.get_token_balance(EMAIL) == held
+
+    adm.settle(dbm, first, "")
+    adm.admit(dbm, EMAIL, MESSAGES, "Standard")
+    assert open_reservations(dbm) == 2
+
+
+def test_stale_reservation_is_refunded_then_charged_in_full(dbm):
+    adm = controller()
+    stale = adm.admit(dbm, EMAIL, MESSAGES, "Standard")
+    conn = sqlite3.connect(dbm.path)
+    conn.execute("UPDATE token_reservations SET created_at=? WHERE id=?",
+                 (time.time() - Main.RESERVATION_TTL - 1, stale.rid))
+    conn.commit()
+    conn.close()
+
+    fresh = adm.admit(dbm, EMAIL, MESSAGES, "Standard") # refunds the stale one first
+    assert dbm.get_token_balance(EMAIL) == 5000 - fresh.amount
+    assert open_reservations(dbm) == 1
+
+    assert adm.settle(dbm, stale, "three billed words") == 5000 - fresh.amount - 3
+    assert adm.settle(dbm, fresh, "") == 5000 - 3
+    assert open_reservations(dbm) == 0
+
+
+def test_late_settle_clamps_at_zero(dbm):
+    adm = controller()
+    res = adm.admit(dbm, EMAIL, MESSAGES, "Standard")
+    conn = sqlite3.connect(dbm.path)
+    conn.execute("DELETE FROM token_reservations WHERE id=?", (res.rid,)) # refunded elsewhere as stale ...
+    conn.execute("UPDATE users SET tokens=2 WHERE email=?", (EMAIL,))   # ... and mostly spent since
+    conn.commit()
+    conn.close()
+    assert adm.settle(dbm, res, "three billed words") == 0
+
+
+def test_settle_after_error_refunds_unused_part(dbm):
+    adm = controller()
+    res = adm.admit(dbm, EMAIL, MESSAGES, "Standard")
+    assert dbm.get_token_balance(EMAIL) == 5000 - res.amount
+    # The stream failed after two words; only those are billed
+    assert adm.settle(dbm, res, "partial reply") == 5000 - 2
+    assert open_reservations(dbm) == 0
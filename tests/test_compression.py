@@ -0,0 +1,51 @@
+import Main
+
+CODE = (
+    "def f(x):\n"
+    "    if x:\n"
+    "        return 1\n"
+    "    return 1\n"
+    "\n"
+    "int main() {\n"
+    "    if (a) {\n"
+    "        b();\n"
+    "    }\n"
+    "}"
+)
+
+
+def test_collapse_whitespace_keeps_code():
+    assert Main.collapse_whitespace(CODE) == CODE
+
+
+def test_collapse_whitespace_squeezes_prose():
+    text = "Some   words  here.\n\n\n\n-----\nPage 3 of 9\n42\n  - item   one"
+    assert Main.collapse_whitespace(text) == "Some words here.\n\n42\n  - item one"
+
+
+def test_compress_context_keeps_code_at_full_ratio():
+    assert Main.compress_context(CODE, "f", 1.0) == CODE
+
+
+def test_compress_context_keeps_fenced_blocks_and_numbers():
+    text = "Intro line.\n```\nx = 1\n\nx = 1\n```\n0\n0\n| a | 0 |\n| a | 0 |"
+    assert Main.compress_context(text, "x", 1.0) == text
+
+
+def test_compress_context_drops_repeated_prose():
+    text = "The cat sat. The cat sat. Dogs run.\n\nThe Cat sat!"
+    assert Main.compress_context(text, "cat", 1.0) == "The cat sat. Dogs run."
+
+
+def test_compress_context_keeps_markers_when_over_budget():
+    text = (
+        "--- Note: A [chars 0-40] ---\n"
+        "Fish swim in the sea. Birds nest in tall old trees near the river.\n"
+        "--- Note: B [chars 0-30] ---\n"
+        "Cars need fuel to drive along the long roads."
+    )
+    out = Main.compress_context(text, "fish", 0.5)
+    assert "--- Note: A [chars 0-40] ---" in out
+    assert "--- Note: B [chars 0-30] ---" in out
+    assert "Fish swim in the sea." in out
+    assert len(out) <= len(text) * 0.5